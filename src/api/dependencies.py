@@ -2,7 +2,7 @@ from collections.abc import AsyncGenerator
 from typing import Annotated
 
 import jwt
-from fastapi import Depends
+from fastapi import Depends, Request
 from fastapi.security import OAuth2PasswordBearer
 from pydantic import ValidationError
 from sqlmodel.ext.asyncio.session import AsyncSession
@@ -13,9 +13,9 @@ from src.core.exceptions import (
     PermissionDeniedError,
 )
 from src.core.security import decode_token
+from src.core.revocation import revocation_store
 from src.models.user import TokenPayload, UserRole
-from src.core.config import AppConfig
-from src.services import LocalStorageService, S3StorageService
+from src.services import BaseStorageService
 
 
 # database session dependency
@@ -36,7 +36,7 @@ TokenDep = Annotated[str, Depends(reusable_oauth2)]
 
 
 # user dependency
-def get_current_user(token: TokenDep) -> TokenPayload:
+async def get_current_user(token: TokenDep) -> TokenPayload:
     try:
         data = decode_token(token=token)
     except (jwt.exceptions.InvalidTokenError, ValidationError):
@@ -45,6 +45,10 @@ def get_current_user(token: TokenDep) -> TokenPayload:
     if not data:
         raise PermissionDeniedError("Invalid or expired token")
 
+    # answered from memory unless the token might have been revoked
+    if await revocation_store.is_revoked(data):
+        raise PermissionDeniedError("Token has been revoked")
+
     # user = session.get(User, token_data.sub)
     # if not user:
     #     raise HTTPException(status_code=404, detail="User not found")
@@ -64,14 +68,9 @@ def get_current_active_superuser(current_user: CurrentUser) -> TokenPayload:
 
 
 # storage dependencies
-def get_storage_service() -> LocalStorageService | S3StorageService:
-    """Returns an instance of the underlying storage client"""
-    if AppConfig.IS_DEVELOPMENT:
-        return LocalStorageService()
-    else:
-        return S3StorageService()
+def get_storage_service(request: Request) -> BaseStorageService:
+    """Returns the storage backend created at startup"""
+    return request.app.state.storage_service
 
 
-StorageServiceDep = Annotated[
-    LocalStorageService | S3StorageService, Depends(get_storage_service)
-]
+StorageServiceDep = Annotated[BaseStorageService, Depends(get_storage_service)]
@@ -1,26 +1,91 @@
+import re
 import sqlite3
 import time
-from fastapi import Request, HTTPException
+import uuid
+import jwt
+from fastapi import HTTPException
 from fastapi.logger import logger
 from fastapi.responses import JSONResponse
-from starlette.middleware.base import BaseHTTPMiddleware
+from pydantic import ValidationError
+from starlette.datastructures import Headers, MutableHeaders
 from starlette.exceptions import HTTPException as StarletteHTTPException
+from starlette.routing import Match, Mount
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from src.core.compression import (
+    Compressor,
+    compression_cpu_histogram,
+    compression_ratio_histogram,
+    compressors,
+    negotiate_encoding,
+)
+from src.core.config import AppConfig
 from src.core.exceptions import (
     AppException,
 )
+from src.core.logging import request_id_var
+from src.core.ratelimit import (
+    RateLimiter,
+    RateLimitKey,
+    RateLimitPolicy,
+    create_rate_limiter,
+    format_retry_after,
+    get_rate_limit_policies,
+    rate_limit_requests_counter,
+)
+from src.core.security import decode_token, hash_token
+from src.core.timing import format_server_timing, record_timing, request_timings
+from src.core.tracing import (
+    SpanKind,
+    current_span,
+    format_traceparent,
+    parse_traceparent,
+    tracer,
+)
 from src.utils.database import parse_sqlite_integrity_error
+from src.utils.heap import register_cache
 from sqlalchemy.exc import IntegrityError
 from prometheus_client import Histogram, Gauge, Counter
 
 
-class ExceptionHandlerMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
+# largest multipart framing accepted around an uploaded file
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+class ExceptionHandlerMiddleware:
+    """A middleware for converting exceptions raised by the application into JSON error responses"""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        response_started = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
         try:
-            response = await call_next(request)
-            return response
+            await self.app(scope, receive, send_wrapper)
+        except Exception as exc:
+            # a response that has already started cannot be replaced
+            if response_started:
+                raise
+
+            response = self.handle_exception(exc)
+            await response(scope, receive, send)
+
+    def handle_exception(self, exc: Exception) -> JSONResponse:
+        """Compose the error response for an exception"""
+        try:
+            raise exc
 
         except AppException as app_exception:
-            logger.error(f"Application Error: {str(app_exception)}")
+            logger.error("Application Error: %s", app_exception)
 
             return JSONResponse(
                 status_code=app_exception.status_code,
@@ -30,7 +95,7 @@ class ExceptionHandlerMiddleware(BaseHTTPMiddleware):
             )
 
         except (HTTPException, StarletteHTTPException) as http_exception:
-            logger.error(f"HTTP Error: {str(http_exception.detail)}")
+            logger.error("HTTP Error: %s", http_exception.detail)
 
             return JSONResponse(
                 status_code=http_exception.status_code,
@@ -39,7 +104,7 @@ class ExceptionHandlerMiddleware(BaseHTTPMiddleware):
                 },
             )
         except (IntegrityError, sqlite3.IntegrityError) as db_exception:
-            logger.error(f"Database Error: {str(db_exception)}", exc_info=True)
+            logger.error("Database Error: %s", db_exception, exc_info=True)
 
             msg, type = parse_sqlite_integrity_error(db_exception)
             status = 500
@@ -58,7 +123,7 @@ class ExceptionHandlerMiddleware(BaseHTTPMiddleware):
             )
 
         except Exception as e:
-            logger.exception(f"Internal server error: {str(e)}")
+            logger.exception("Internal server error: %s", e)
 
             return JSONResponse(
                 status_code=500,
@@ -77,13 +142,19 @@ response_latency_histogram = Histogram(
     name="http_response_latency_seconds",
     documentation="Response Latency of HTTP requests (seconds)",
     labelnames=["endpoint", "method", "status"],
-    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 3.0, 7.5, 10.0, float("INF")),
+    buckets=(*AppConfig.METRICS_LATENCY_BUCKETS, float("INF")),
+)
+time_to_first_byte_histogram = Histogram(
+    name="http_time_to_first_byte_seconds",
+    documentation="Time until the response status and headers of HTTP requests are sent (seconds)",
+    labelnames=["endpoint", "method", "status"],
+    buckets=(*AppConfig.METRICS_LATENCY_BUCKETS, float("INF")),
 )
 response_size_histogram = Histogram(
     name="http_response_size_bytes",
     documentation="Response Size of HTTP requests (bytes)",
     labelnames=["endpoint", "method", "status"],
-    buckets=(100, 500, 1000, 5000, 10000, 50000, 100000, 500000, 1000000, float("INF")),
+    buckets=(*AppConfig.METRICS_SIZE_BUCKETS, float("INF")),
 )
 in_progress_request_gauge = Gauge(
     name="http_in_progress_requests_total",
@@ -104,42 +175,124 @@ excluded_endpoints = set(
         "/health-check/",
     ]
 )
+# label values for requests that match no route or exceed the label set limit
+UNMATCHED_ENDPOINT = "<unmatched>"
+OVERFLOW_ENDPOINT = "<overflow>"
+known_methods = frozenset(
+    ["GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS", "TRACE", "CONNECT"]
+)
+
+
+def get_route_template(scope: Scope) -> str:
+    """
+    Get the path template of the route matching a request, such as `/items/{id}`.
+    Templates keep metric labels bounded no matter how many distinct paths clients request
+    """
+    router = getattr(scope.get("app"), "router", None)
+    if router is None:
+        return UNMATCHED_ENDPOINT
+
+    template = UNMATCHED_ENDPOINT
+    for route in router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.NONE:
+            continue
+
+        path = getattr(route, "path", UNMATCHED_ENDPOINT)
+        # mounted apps serve arbitrary paths below their mount point
+        if isinstance(route, Mount):
+            path = f"{path}/{{path}}"
+        if match == Match.FULL:
+            return path
+        # a partial match means the path exists but not for this method. keep looking for a full match
+        if template == UNMATCHED_ENDPOINT:
+            template = path
+
+    return template
+
+
+class LabelSetLimiter:
+    """Caps the number of distinct label sets so a misbehaving label cannot grow metrics without bound"""
+
+    def __init__(self, max_label_sets: int) -> None:
+        self.max_label_sets = max_label_sets
+        self.label_sets: set[tuple[str, ...]] = set()
+
+    def get_endpoint(self, endpoint: str, *labels: str) -> str:
+        """Return the endpoint label to use, folding new label sets into one series once the cap is reached"""
+        label_set = (endpoint, *labels)
+        if label_set in self.label_sets:
+            return endpoint
+
+        if len(self.label_sets) >= self.max_label_sets:
+            return OVERFLOW_ENDPOINT
+
+        self.label_sets.add(label_set)
+        return endpoint
+
+
+label_set_limiter = LabelSetLimiter(max_label_sets=AppConfig.METRICS_MAX_LABEL_SETS)
+register_cache("metric_label_sets", lambda: len(label_set_limiter.label_sets))
 
 
-class MonitoringMiddleware(BaseHTTPMiddleware):
+class MonitoringMiddleware:
     """A middleware for monitoring all endpoints with Prometheus"""
 
-    async def dispatch(self, request: Request, call_next):
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
         """
         Track the request and record relevant metrics.
         Exceptions will typically be caught at this stage since the error handler middleware is placed first so no need to use an except block here
         """
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        path: str = scope["path"]
         # exclude tracking for metrics, health-check, docs endpoints
-        if request.url.path in excluded_endpoints:
-            return await call_next(request)
+        if path in excluded_endpoints:
+            return await self.app(scope, receive, send)
 
         # get request monitoring details
+        # label by route template so "/items/<id>" for every id is aggregated as one endpoint
+        endpoint = get_route_template(scope)
         # strip trailing slash for non-base path since "/users" and "/users/" are essentially aggregated as different paths
-        endpoint = (
-            request.url.path[:-1]
-            if len(request.url.path) > 1 and request.url.path[-1] == "/"
-            else request.url.path
-        )
+        if len(endpoint) > 1 and endpoint[-1] == "/":
+            endpoint = endpoint[:-1]
 
         # track time for request
         start_time = time.perf_counter()
-        method = request.method
+        method = scope["method"] if scope["method"] in known_methods else "OTHER"
+        status = 500
+        response_size = 0
+        first_byte_time: float | None = None
+
+        # capture response details as they are sent instead of buffering the response.
+        # body sizes are counted from the messages since streamed responses have no content-length
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status, response_size, first_byte_time
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                first_byte_time = time.perf_counter()
+            elif message["type"] == "http.response.body":
+                response_size += len(message.get("body", b""))
+            elif message["type"] == "http.response.zerocopysend":
+                response_size += message.get("count") or 0
+            await send(message)
 
         # record request as in-progress
-        in_progress_request_gauge.labels(endpoint=endpoint, method=method).inc()
+        in_progress_endpoint = label_set_limiter.get_endpoint(endpoint, method)
+        in_progress_request_gauge.labels(
+            endpoint=in_progress_endpoint, method=method
+        ).inc()
 
         try:
-            response = await call_next(request)
+            await self.app(scope, receive, send_wrapper)
 
             # get response monitoring details
-            status = response.status_code
-            response_size = int(response.headers.get("content-length", 0))
             latency = time.perf_counter() - start_time
+            endpoint = label_set_limiter.get_endpoint(endpoint, method, str(status))
 
             # record request count
             requests_counter.labels(
@@ -151,11 +304,379 @@ class MonitoringMiddleware(BaseHTTPMiddleware):
                 endpoint=endpoint, method=method, status=status
             ).observe(latency)
 
+            # record time to first byte separately since streamed responses keep sending long after it
+            if first_byte_time is not None:
+                time_to_first_byte_histogram.labels(
+                    endpoint=endpoint, method=method, status=status
+                ).observe(first_byte_time - start_time)
+
             # record response size
             response_size_histogram.labels(
                 endpoint=endpoint, method=method, status=status
             ).observe(response_size)
-            return response
         finally:
             # remove request from pool
-            in_progress_request_gauge.labels(endpoint=endpoint, method=method).dec()
+            in_progress_request_gauge.labels(
+                endpoint=in_progress_endpoint, method=method
+            ).dec()
+
+
+# accept ids generated by proxies and clients as long as they are safe to log
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,128}$")
+
+
+class RequestIdMiddleware:
+    """A middleware for tagging each request with an id that is attached to its logs and returned in the X-Request-ID header"""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        request_id = Headers(scope=scope).get("x-request-id", "")
+        if not REQUEST_ID_PATTERN.match(request_id):
+            request_id = uuid.uuid4().hex
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message)["X-Request-ID"] = request_id
+            await send(message)
+
+        token = request_id_var.set(request_id)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_id_var.reset(token)
+
+
+class ServerTimingMiddleware:
+    """A middleware for reporting where a request spent its time in the Server-Timing response header"""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start_time = time.perf_counter()
+        timings: dict[str, list[float]] = {}
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                # the body of a streamed response is still being produced so only time up to the headers is covered
+                record_timing("app", time.perf_counter() - start_time)
+                MutableHeaders(scope=message)["Server-Timing"] = format_server_timing(
+                    timings
+                )
+            await send(message)
+
+        token = request_timings.set(timings)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_timings.reset(token)
+
+
+class CompressionMiddleware:
+    """
+    A middleware for compressing responses with the content coding the client prefers.
+    Streamed responses are compressed chunk by chunk so they are not held back until the end
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+        self.encodings = AppConfig.COMPRESSION_ENCODINGS
+        self.minimum_size = AppConfig.COMPRESSION_MIN_SIZE_BYTES
+        self.excluded_content_types = tuple(
+            AppConfig.COMPRESSION_EXCLUDED_CONTENT_TYPES
+        )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            return await self.app(scope, receive, send)
+
+        encoding = negotiate_encoding(
+            Headers(scope=scope).get("accept-encoding", ""), self.encodings
+        )
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        # the response start is held back until the first body chunk shows whether the response is worth compressing
+        start_message: Message | None = None
+        compressor: Compressor | None = None
+        passthrough = False
+        raw_size = compressed_size = 0
+        cpu_time = 0.0
+
+        def compress(data: bytes, finish: bool) -> bytes:
+            nonlocal raw_size, compressed_size, cpu_time
+            started_at = time.thread_time()
+            body = compressor.compress(data) if data else b""  # type: ignore
+            if finish:
+                body += compressor.finish()  # type: ignore
+            cpu_time += time.thread_time() - started_at
+            raw_size += len(data)
+            compressed_size += len(body)
+            return body
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal start_message, compressor, passthrough
+            if passthrough:
+                return await send(message)
+
+            if message["type"] == "http.response.start":
+                if self.should_compress(message):
+                    start_message = message
+                else:
+                    passthrough = True
+                    await send(message)
+                return
+
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                body = message.get("body", b"")
+                # files sent by the server itself and small complete bodies go out unchanged
+                if message["type"] != "http.response.body" or (
+                    not more_body and len(body) < self.minimum_size
+                ):
+                    passthrough = True
+                    await send(start_message)  # type: ignore
+                    return await send(message)
+
+                compressor = compressors[encoding]()
+                message["body"] = compress(body, finish=not more_body)
+                headers = MutableHeaders(scope=start_message)  # type: ignore
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                # the compressed body is a different representation so a strong validator no longer applies
+                etag = headers.get("etag")
+                if etag and not etag.startswith("W/"):
+                    headers["ETag"] = f"W/{etag}"
+                if more_body:
+                    del headers["Content-Length"]
+                else:
+                    headers["Content-Length"] = str(len(message["body"]))
+                await send(start_message)  # type: ignore
+            else:
+                message["body"] = compress(
+                    message.get("body", b""), finish=not more_body
+                )
+
+            await send(message)
+            if not more_body:
+                compression_ratio_histogram.labels(encoding=encoding).observe(
+                    raw_size / compressed_size if compressed_size else 1
+                )
+                compression_cpu_histogram.labels(encoding=encoding).observe(cpu_time)
+
+        await self.app(scope, receive, send_wrapper)
+
+    def should_compress(self, message: Message) -> bool:
+        """Check whether a response can be compressed based on its status and headers"""
+        status = message["status"]
+        if status < 200 or status in (204, 206, 304):
+            return False
+
+        # header names are not always lowercase when set by mounted apps such as the metrics app
+        headers = Headers(
+            raw=[(key.lower(), value) for key, value in message["headers"]]
+        )
+        content_length = headers.get("content-length")
+        return (
+            "content-encoding" not in headers
+            and "no-transform" not in headers.get("cache-control", "")
+            and not headers.get("content-type", "").startswith(
+                self.excluded_content_types
+            )
+            and (content_length is None or int(content_length) >= self.minimum_size)
+        )
+
+
+class TracingMiddleware:
+    """A middleware for starting a server span for each request and propagating W3C trace context"""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            scope["type"] != "http"
+            or not tracer.enabled
+            or scope["path"] in excluded_endpoints
+        ):
+            return await self.app(scope, receive, send)
+
+        # continue the trace of the caller if it sent one
+        parent = parse_traceparent(Headers(scope=scope).get("traceparent"))
+        endpoint = get_route_template(scope)
+        span = tracer.start_span(
+            f"{scope['method']} {endpoint}",
+            kind=SpanKind.SERVER,
+            parent=parent,
+            attributes={
+                "http.request.method": scope["method"],
+                "http.route": endpoint,
+                "url.path": scope["path"],
+            },
+        )
+        if span is None:
+            return await self.app(scope, receive, send)
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                span.set_attribute("http.response.status_code", message["status"])
+                if message["status"] >= 500:
+                    span.error = f"HTTP {message['status']}"
+                # let clients correlate the response with the recorded trace
+                MutableHeaders(scope=message)["traceresponse"] = format_traceparent(
+                    span.context
+                )
+            await send(message)
+
+        token = current_span.set(span)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException as exc:
+            span.record_exception(exc)
+            raise
+        finally:
+            current_span.reset(token)
+            tracer.end_span(span)
+
+
+class RateLimitMiddleware:
+    """A middleware for limiting request rates on the endpoints covered by the rate limit policies"""
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        policies: list[RateLimitPolicy] | None = None,
+        limiter: RateLimiter | None = None,
+    ) -> None:
+        self.app = app
+        self.policies = policies if policies is not None else get_rate_limit_policies()
+        self.limiter = limiter or create_rate_limiter()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        policy = next(
+            (p for p in self.policies if p.matches(scope["method"], scope["path"])),
+            None,
+        )
+        if not policy:
+            return await self.app(scope, receive, send)
+
+        key = f"{policy.name}:{self._identify(scope, policy.key)}"
+        try:
+            result = await self.limiter.hit(key=key, limit=policy.limit)
+        except Exception:
+            # fail open so an unavailable backend does not take the api down with it
+            logger.error("Rate limiter backend failed", exc_info=True)
+            rate_limit_requests_counter.labels(
+                policy=policy.name, decision="error"
+            ).inc()
+            return await self.app(scope, receive, send)
+
+        headers = {
+            "X-RateLimit-Limit": str(policy.limit.capacity),
+            "X-RateLimit-Remaining": str(result.remaining),
+        }
+
+        if not result.allowed:
+            rate_limit_requests_counter.labels(
+                policy=policy.name, decision="limited"
+            ).inc()
+            headers["Retry-After"] = format_retry_after(result.retry_after)
+            response = JSONResponse(
+                status_code=429,
+                content={"message": "Too many requests. Try again later"},
+                headers=headers,
+            )
+            return await response(scope, receive, send)
+
+        rate_limit_requests_counter.labels(policy=policy.name, decision="allowed").inc()
+
+        async def send_with_headers(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).update(headers)
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+    def _identify(self, scope: Scope, key: RateLimitKey) -> str:
+        """Compose the bucket key of a request. Requests without credentials fall back to the client ip"""
+        headers = Headers(scope=scope)
+
+        if key != RateLimitKey.IP:
+            scheme, _, token = headers.get("authorization", "").partition(" ")
+            if scheme.lower() == "bearer" and token:
+                if key == RateLimitKey.TOKEN:
+                    return f"token:{hash_token(token)}"
+                try:
+                    data = decode_token(token=token)
+                except (jwt.exceptions.InvalidTokenError, ValidationError):
+                    data = None
+                if data:
+                    return f"user:{data.sub}"
+
+        if AppConfig.RATE_LIMIT_TRUST_PROXY and "x-real-ip" in headers:
+            return f"ip:{headers['x-real-ip']}"
+
+        client = scope.get("client")
+        return f"ip:{client[0] if client else 'unknown'}"
+
+
+class UploadSizeLimitMiddleware:
+    """
+    A middleware rejecting multipart uploads above the maximum upload size while they are received.
+    FastAPI parses the whole form and spools its files to disk before the endpoint runs, so the size can not be checked any later
+    """
+
+    def __init__(self, app: ASGIApp, max_size: int | None = None) -> None:
+        self.app = app
+        max_size = max_size if max_size is not None else AppConfig.MAX_UPLOAD_SIZE_BYTES
+        # room for the boundaries, part headers and other fields around the file
+        self.max_body_size = max_size + MULTIPART_OVERHEAD_BYTES
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        headers = Headers(scope=scope)
+        if not headers.get("content-type", "").startswith("multipart/form-data"):
+            return await self.app(scope, receive, send)
+
+        message = f"Request body exceeds the maximum size of {self.max_body_size} bytes"
+        content_length = headers.get("content-length", "")
+        if content_length.isdigit() and int(content_length) > self.max_body_size:
+            response = JSONResponse(status_code=413, content={"message": message})
+            return await response(scope, receive, send)
+
+        received = 0
+        exceeded = False
+
+        async def receive_limited() -> Message:
+            nonlocal received, exceeded
+            request_message = await receive()
+            if request_message["type"] == "http.request":
+                received += len(request_message.get("body", b""))
+                # fastapi turns other errors raised while parsing the body into a bad request
+                if received > self.max_body_size:
+                    exceeded = True
+                    raise HTTPException(status_code=413, detail=message)
+            return request_message
+
+        async def send_limited(response_message: Message) -> None:
+            if not exceeded:
+                return await send(response_message)
+            # replace the default error response with one shaped like every other error of the api
+            if response_message["type"] == "http.response.start":
+                response = JSONResponse(status_code=413, content={"message": message})
+                await response(scope, receive, send)
+
+        await self.app(scope, receive_limited, send_limited)
@@ -6,8 +6,10 @@ from src.models import user as user_models, Message
 from src.api.dependencies import SessionDep, CurrentUser
 from src.core.exceptions import PermissionDeniedError
 from src.tasks import email as email_tasks
+from src.api.routing import AppRoute
 
 router = APIRouter(
+    route_class=AppRoute,
     prefix="/auth",
     tags=["Auth Endpoints"],
     responses={
@@ -51,7 +53,7 @@ async def signup(
     )
 
 
-@router.post("/login", response_model=user_models.UserPublicResponse)
+@router.post("/login", response_model=user_models.UserLoginResponse)
 async def login(data: user_models.UserLogin, auth_service: AuthServiceDep):
     """
     Login to a user account
@@ -116,9 +118,9 @@ async def refresh_client_token(
     auth_service: AuthServiceDep,
 ):
     """
-    Refresh user access token
+    Refresh user access token. The refresh token is rotated and can only be used once
     """
-    access_token = await auth_service.refresh_session(refresh_token)
+    access_token, refresh_token = await auth_service.refresh_session(refresh_token)
 
     return user_models.TokenRefreshResponse(
         message="Token refresh successful",
@@ -127,6 +129,20 @@ async def refresh_client_token(
     )
 
 
+@router.post("/logout", response_model=Message)
+async def logout(
+    current_user: CurrentUser,
+    auth_service: AuthServiceDep,
+    refresh_token: str | None = None,
+):
+    """
+    Revoke the current access token and refresh token
+    """
+    await auth_service.logout(current_user=current_user, refresh_token=refresh_token)
+
+    return Message(message="Logout successful")
+
+
 @router.get("/{provider}/init", response_model=user_models.OAuthInitResponse)
 async def initiate_oauth_flow(
     provider: user_models.OAuthProvider,
@@ -0,0 +1,229 @@
+import asyncio
+import tracemalloc
+from datetime import datetime, timezone
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import JSONResponse, PlainTextResponse
+from src.api.dependencies import get_current_active_superuser
+from src.api.routing import AppRoute
+from src.core.config import AppConfig
+from src.core.exceptions import BadActionError, NotFoundError
+from src.models import Message
+from src.models import debug as debug_models
+from src.models.debug import ProfileFormat
+from src.utils.heap import count_model_instances, get_cache_sizes, heap_tracker
+from src.utils.profiler import run_profile
+
+router = APIRouter(
+    route_class=AppRoute,
+    prefix="/debug",
+    tags=["Debug Endpoints"],
+    dependencies=[Depends(get_current_active_superuser)],
+    responses={
+        404: {"description": "Debug endpoint is disabled"},
+        409: {"description": "A profile is already running"},
+    },
+)
+
+
+def require_profiling():
+    """Hide the profiler unless it has been enabled"""
+    if not AppConfig.PROFILING_ENABLED:
+        raise NotFoundError("Profiling is disabled")
+
+
+def require_heap_debug():
+    """Hide the heap endpoints unless they have been enabled"""
+    if not AppConfig.HEAP_DEBUG_ENABLED:
+        raise NotFoundError("Heap debugging is disabled")
+
+
+@router.get(
+    "/profile",
+    dependencies=[Depends(require_profiling)],
+    response_class=PlainTextResponse,
+    responses={200: {"content": {"application/json": {}}}},
+)
+async def profile_cpu(
+    seconds: float = Query(10, gt=0),
+    format: ProfileFormat = ProfileFormat.COLLAPSED,
+    rate: int = Query(100, ge=1, description="Samples per second"),
+):
+    """
+    Sample the stacks of the event loop and all worker threads.
+    Returns collapsed stacks for flamegraph tools or a speedscope file
+    """
+    if seconds > AppConfig.PROFILING_MAX_SECONDS:
+        raise BadActionError(
+            f"Profiles can run for at most {AppConfig.PROFILING_MAX_SECONDS} seconds"
+        )
+    if rate > AppConfig.PROFILING_MAX_SAMPLE_RATE:
+        raise BadActionError(
+            f"Sample rate can be at most {AppConfig.PROFILING_MAX_SAMPLE_RATE} per second"
+        )
+
+    # sample from a worker thread so the event loop keeps serving the traffic being profiled
+    profile = await asyncio.to_thread(run_profile, seconds=seconds, interval=1 / rate)
+
+    name = f"profile-{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}"
+    if format == ProfileFormat.SPEEDSCOPE:
+        return JSONResponse(
+            content=profile.to_speedscope(name=name),
+            headers={
+                "Content-Disposition": f'attachment; filename="{name}.speedscope.json"'
+            },
+        )
+
+    return PlainTextResponse(profile.to_collapsed())
+
+
+def get_heap_status() -> debug_models.HeapStatus:
+    current_size, peak_size = tracemalloc.get_traced_memory()
+    return debug_models.HeapStatus(
+        tracing=heap_tracker.is_tracing,
+        current_size=current_size,
+        peak_size=peak_size,
+        snapshots=[
+            debug_models.HeapSnapshot(name=name, created_at=created_at, size=size)
+            for name, created_at, size in heap_tracker.list_snapshots()
+        ],
+    )
+
+
+@router.get(
+    "/heap",
+    dependencies=[Depends(require_heap_debug)],
+    response_model=debug_models.HeapStatusResponse,
+)
+async def get_heap():
+    """
+    Get the allocation tracing status and the snapshots taken
+    """
+    return debug_models.HeapStatusResponse(
+        message="Heap status retrieved successfully", data=get_heap_status()
+    )
+
+
+@router.post(
+    "/heap/start",
+    dependencies=[Depends(require_heap_debug)],
+    response_model=debug_models.HeapStatusResponse,
+)
+async def start_heap_tracing(frames: int = Query(1, ge=1)):
+    """
+    Start tracing allocations, recording `frames` stack frames per allocation.
+    Tracing slows down every allocation so stop it once done
+    """
+    if frames > AppConfig.HEAP_MAX_TRACE_FRAMES:
+        raise BadActionError(
+            f"At most {AppConfig.HEAP_MAX_TRACE_FRAMES} frames can be traced"
+        )
+
+    heap_tracker.start(frames=frames)
+    return debug_models.HeapStatusResponse(
+        message="Allocation tracing started", data=get_heap_status()
+    )
+
+
+@router.post(
+    "/heap/stop", dependencies=[Depends(require_heap_debug)], response_model=Message
+)
+async def stop_heap_tracing():
+    """
+    Stop tracing allocations and discard all snapshots
+    """
+    heap_tracker.stop()
+    return Message(message="Allocation tracing stopped")
+
+
+@router.post(
+    "/heap/snapshots",
+    dependencies=[Depends(require_heap_debug)],
+    response_model=debug_models.HeapSnapshotResponse,
+)
+async def take_heap_snapshot(data: debug_models.HeapSnapshotCreate):
+    """
+    Take a named snapshot of traced allocations
+    """
+    # snapshots copy every trace so take them off the event loop
+    created_at, size = await asyncio.to_thread(heap_tracker.take_snapshot, data.name)
+
+    return debug_models.HeapSnapshotResponse(
+        message="Snapshot taken successfully",
+        data=debug_models.HeapSnapshot(
+            name=data.name, created_at=created_at, size=size
+        ),
+    )
+
+
+@router.delete(
+    "/heap/snapshots/{name}",
+    dependencies=[Depends(require_heap_debug)],
+    response_model=Message,
+)
+async def delete_heap_snapshot(name: str):
+    """
+    Delete a snapshot
+    """
+    heap_tracker.delete_snapshot(name)
+    return Message(message="Snapshot deleted successfully")
+
+
+@router.get(
+    "/heap/diff",
+    dependencies=[Depends(require_heap_debug)],
+    response_model=debug_models.HeapDiffResponse,
+)
+async def diff_heap_snapshots(
+    base: str,
+    target: str | None = None,
+    group_by: debug_models.HeapGroupBy = Query(
+        debug_models.HeapGroupBy.LINENO, alias="groupBy"
+    ),
+    limit: int = Query(20, ge=1, le=200),
+):
+    """
+    Get the allocations that grew the most since the base snapshot, compared to the target snapshot or the current heap
+    """
+    stats = await asyncio.to_thread(
+        heap_tracker.compare,
+        base=base,
+        target=target,
+        group_by=group_by.value,
+        limit=limit,
+    )
+
+    allocations = [
+        debug_models.AllocationDiff(
+            location=str(stat.traceback)
+            if group_by == debug_models.HeapGroupBy.LINENO
+            else stat.traceback[0].filename,
+            size=stat.size,
+            size_diff=stat.size_diff,
+            count=stat.count,
+            count_diff=stat.count_diff,
+        )
+        for stat in stats
+    ]
+    return debug_models.HeapDiffResponse(
+        message="Snapshots compared successfully",
+        data=debug_models.HeapDiff(
+            base=base, target=target, group_by=group_by, allocations=allocations
+        ),
+    )
+
+
+@router.get(
+    "/heap/objects",
+    dependencies=[Depends(require_heap_debug)],
+    response_model=debug_models.HeapObjectsResponse,
+)
+async def get_heap_objects():
+    """
+    Count live SQLModel instances per class and the entries held by registered caches
+    """
+    models = await asyncio.to_thread(count_model_instances)
+
+    return debug_models.HeapObjectsResponse(
+        message="Heap objects counted successfully",
+        data=debug_models.HeapObjects(models=models, caches=get_cache_sizes()),
+    )
@@ -1,11 +1,32 @@
 import uuid
-from fastapi import APIRouter, status, UploadFile, File
-from fastapi.logger import logger
+from typing import Annotated, AsyncIterator
+from fastapi import (
+    APIRouter,
+    Depends,
+    Header,
+    Path,
+    Query,
+    Request,
+    Response,
+    status,
+    UploadFile,
+    File,
+)
 from src.models import file as file_models, Message
-from src.api.dependencies import StorageServiceDep
-from src.core.exceptions import NotFoundError, InternalServerError
+from src.api.dependencies import SessionDep, StorageServiceDep
+from src.core.exceptions import (
+    AppException,
+    BadActionError,
+    NotFoundError,
+    InternalServerError,
+)
+from src.api.routing import AppRoute
+from src.core.config import AppConfig
+from src.services import FileService, UploadService
+from src.utils.image import get_variant_path
 
 router = APIRouter(
+    route_class=AppRoute,
     prefix="/files",
     tags=["File Endpoints"],
     responses={
@@ -15,47 +36,392 @@ router = APIRouter(
 )
 
 
+# annotate dependencies
+def get_file_service(session: SessionDep, storage_service: StorageServiceDep):
+    return FileService(session=session, storage_service=storage_service)
+
+
+FileServiceDep = Annotated[FileService, Depends(get_file_service)]
+
+
+def get_upload_service(session: SessionDep, storage_service: StorageServiceDep):
+    return UploadService(session=session, storage_service=storage_service)
+
+
+UploadServiceDep = Annotated[UploadService, Depends(get_upload_service)]
+
+# path parameter of a hex encoded sha-256 digest
+Sha256Path = Annotated[str, Path(pattern=r"^[0-9a-f]{64}$")]
+
+
+async def iter_upload_file(file: UploadFile) -> AsyncIterator[bytes]:
+    while chunk := await file.read(AppConfig.UPLOAD_CHUNK_SIZE_BYTES):
+        yield chunk
+
+
 @router.post(
     "/",
     status_code=status.HTTP_201_CREATED,
     response_model=file_models.FilePublicResponse,
 )
 async def upload_one_file(
-    storage_service: StorageServiceDep,
+    file_service: FileServiceDep,
     file: UploadFile = File(...),
 ):
     """
-    Upload a new file
+    Upload a new file. Identical files are only stored once when storage is content addressed
     """
-    # generate file path
-    file_ext = file.filename.split(".")[-1] if file.filename else ""
-    unique_filename = f"{uuid.uuid4()}.{file_ext}"
-
     try:
-        path = await storage_service.upload_file(file=file, path=unique_filename)
-    except FileExistsError:
-        # TODO: regenerate filename
-        logger.fatal("Filename not unique")
+        info = await file_service.upload_file(file=file)
+    except AppException:
+        raise
     except Exception:
         raise InternalServerError("Failed to upload file")
 
     return file_models.FilePublicResponse(
-        message="File uploaded successfully", data=file_models.FilePublic(path=path)
+        message="File uploaded successfully",
+        data=file_models.FilePublic(
+            path=info.path,
+            size=info.size,
+            sha256=info.sha256,
+            variants_task_id=info.variants_task_id,
+        ),
+    )
+
+
+@router.head(
+    "/by-hash/{sha256}",
+    response_class=Response,
+    responses={200: {"description": "File is stored"}},
+)
+async def check_one_file_by_hash(sha256: Sha256Path, file_service: FileServiceDep):
+    """
+    Check whether a file with the given SHA-256 digest is already stored, so its contents need not be uploaded again
+    """
+    info = await file_service.get_file_by_hash(sha256=sha256)
+    return Response(
+        headers={"Content-Length": str(info.size), "Content-Location": info.path}
+    )
+
+
+@router.post(
+    "/by-hash/{sha256}",
+    status_code=status.HTTP_201_CREATED,
+    response_model=file_models.FilePublicResponse,
+)
+async def add_one_file_by_hash(sha256: Sha256Path, file_service: FileServiceDep):
+    """
+    Reference a stored file by its SHA-256 digest instead of uploading the same contents again
+    """
+    info = await file_service.add_file_reference(sha256=sha256)
+    return file_models.FilePublicResponse(
+        message="File uploaded successfully",
+        data=file_models.FilePublic(
+            path=info.path,
+            size=info.size,
+            sha256=info.sha256,
+            variants_task_id=info.variants_task_id,
+        ),
+    )
+
+
+@router.post(
+    "/presigned/uploads",
+    status_code=status.HTTP_201_CREATED,
+    response_model=file_models.PresignedUploadResponse,
+)
+async def create_presigned_upload(
+    data: file_models.PresignedUploadCreate, file_service: FileServiceDep
+):
+    """
+    Get a presigned request uploading a file straight to storage. Confirm the upload with the returned token once it is done
+    """
+    upload = await file_service.create_presigned_upload(data=data)
+    return file_models.PresignedUploadResponse(
+        message="Upload created successfully", data=upload
+    )
+
+
+@router.post(
+    "/presigned/uploads/complete",
+    status_code=status.HTTP_201_CREATED,
+    response_model=file_models.FilePublicResponse,
+)
+async def complete_presigned_upload(
+    data: file_models.PresignedUploadComplete, file_service: FileServiceDep
+):
+    """
+    Confirm a presigned upload, checking the stored file against the size and digest it was issued for
+    """
+    info = await file_service.complete_presigned_upload(token=data.token)
+    return file_models.FilePublicResponse(
+        message="File uploaded successfully",
+        data=file_models.FilePublic(
+            path=info.path,
+            size=info.size,
+            sha256=info.sha256,
+            variants_task_id=info.variants_task_id,
+        ),
+    )
+
+
+@router.get(
+    "/presigned/downloads/{path:path}",
+    response_model=file_models.PresignedDownloadResponse,
+)
+async def create_presigned_download(path: str, file_service: FileServiceDep):
+    """
+    Get a presigned url downloading a file straight from storage
+    """
+    download = await file_service.create_presigned_download(path=path)
+    return file_models.PresignedDownloadResponse(
+        message="Download created successfully", data=download
+    )
+
+
+@router.post(
+    "/uploads",
+    status_code=status.HTTP_201_CREATED,
+    response_model=file_models.UploadSessionPublicResponse,
+)
+async def create_resumable_upload(
+    data: file_models.UploadSessionCreate, upload_service: UploadServiceDep
+):
+    """
+    Start a resumable upload. Send the file in chunks with `PATCH /files/uploads/{id}` and complete it once every byte is received
+    """
+    upload = await upload_service.create_upload(data=data)
+    return file_models.UploadSessionPublicResponse(
+        message="Upload created successfully",
+        data=file_models.UploadSessionPublic.model_validate(upload),
+    )
+
+
+@router.head(
+    "/uploads/{id}",
+    response_class=Response,
+    responses={200: {"description": "Upload progress"}},
+)
+async def get_resumable_upload_offset(id: uuid.UUID, upload_service: UploadServiceDep):
+    """
+    Get the number of bytes received for an upload in the `Upload-Offset` header, which is where an interrupted upload resumes
+    """
+    upload = await upload_service.get_upload(id=id)
+    return Response(
+        headers={
+            "Upload-Offset": str(upload.offset),
+            "Upload-Length": str(upload.size),
+            "Cache-Control": "no-store",
+        }
+    )
+
+
+@router.patch(
+    "/uploads/{id}",
+    status_code=status.HTTP_204_NO_CONTENT,
+    response_class=Response,
+    responses={
+        204: {"description": "Chunk received"},
+        409: {"description": "Chunk was not sent at the upload offset"},
+    },
+)
+async def append_resumable_upload(
+    id: uuid.UUID,
+    request: Request,
+    upload_service: UploadServiceDep,
+    upload_offset: int = Header(alias="Upload-Offset", ge=0),
+):
+    """
+    Send the next chunk of an upload as the raw request body. `Upload-Offset` must be the offset the upload is at.
+    Bytes received before a dropped connection are kept, and the new offset is returned in the `Upload-Offset` header
+    """
+    content_length = request.headers.get("content-length")
+    offset = await upload_service.append_upload(
+        id=id,
+        offset=upload_offset,
+        chunks=request.stream(),
+        length=int(content_length) if content_length else None,
+    )
+    return Response(status_code=204, headers={"Upload-Offset": str(offset)})
+
+
+@router.post(
+    "/uploads/{id}/complete",
+    status_code=status.HTTP_201_CREATED,
+    response_model=file_models.FilePublicResponse,
+)
+async def complete_resumable_upload(id: uuid.UUID, upload_service: UploadServiceDep):
+    """
+    Complete an upload once every byte is received, checking the file against the declared digest
+    """
+    info = await upload_service.complete_upload(id=id)
+    return file_models.FilePublicResponse(
+        message="File uploaded successfully",
+        data=file_models.FilePublic(
+            path=info.path,
+            size=info.size,
+            sha256=info.sha256,
+            variants_task_id=info.variants_task_id,
+        ),
+    )
+
+
+@router.delete("/uploads/{id}", response_model=Message)
+async def delete_resumable_upload(id: uuid.UUID, upload_service: UploadServiceDep):
+    """
+    Cancel an upload and discard the chunks received so far
+    """
+    await upload_service.delete_upload(id=id)
+    return Message(message="Upload deleted successfully")
+
+
+@router.put(
+    "/signed/{path:path}",
+    status_code=status.HTTP_201_CREATED,
+    response_model=file_models.FilePublicResponse,
+)
+async def upload_signed_file(
+    path: str, request: Request, file_service: FileServiceDep, token: str = Query()
+):
+    """
+    Upload the raw contents of a file to a url signed by local storage
+    """
+    info = await file_service.upload_signed_file(
+        token=token,
+        path=path,
+        chunks=request.stream(),
+        content_type=request.headers.get("content-type"),
+    )
+    return file_models.FilePublicResponse(
+        message="File uploaded successfully",
+        data=file_models.FilePublic(
+            path=info.path,
+            size=info.size,
+            sha256=info.sha256,
+            variants_task_id=info.variants_task_id,
+        ),
+    )
+
+
+@router.post(
+    "/signed/{path:path}",
+    status_code=status.HTTP_201_CREATED,
+    response_model=file_models.FilePublicResponse,
+)
+async def upload_signed_form_file(
+    path: str,
+    file_service: FileServiceDep,
+    token: str = Query(),
+    file: UploadFile = File(...),
+):
+    """
+    Upload a file as a multipart form to a url signed by local storage
+    """
+    info = await file_service.upload_signed_file(
+        token=token,
+        path=path,
+        chunks=iter_upload_file(file),
+        content_type=file.content_type,
+    )
+    return file_models.FilePublicResponse(
+        message="File uploaded successfully",
+        data=file_models.FilePublic(
+            path=info.path,
+            size=info.size,
+            sha256=info.sha256,
+            variants_task_id=info.variants_task_id,
+        ),
+    )
+
+
+@router.get(
+    "/signed/{path:path}",
+    response_class=Response,
+    responses={200: {"description": "File contents"}},
+)
+async def download_signed_file(
+    path: str, request: Request, file_service: FileServiceDep, token: str = Query()
+):
+    """
+    Download a file from a url signed by local storage
+    """
+    return await file_service.get_signed_download(
+        token=token, path=path, headers=request.headers
+    )
+
+
+@router.get(
+    "/{path:path}",
+    response_class=Response,
+    responses={
+        200: {"description": "File contents"},
+        206: {"description": "Requested range of the file contents"},
+        304: {"description": "File not modified"},
+        416: {"description": "Requested range not satisfiable"},
+    },
+)
+async def download_one_file(
+    path: str,
+    request: Request,
+    storage_service: StorageServiceDep,
+    variant: str | None = Query(
+        default=None,
+        description="Name of an image variant to download instead of the original",
+    ),
+):
+    """
+    Download a file or one of its image variants. Supports range requests and conditional requests with ETag or Last-Modified.
+    Variants are generated in the background after an image is uploaded and are not found until they are ready
+    """
+    if variant is not None:
+        if variant not in AppConfig.IMAGE_VARIANTS:
+            raise BadActionError("Unknown image variant")
+        path = get_variant_path(path, variant)
+    return await storage_service.get_download(path=path, headers=request.headers)
+
+
+@router.post("/batch-delete", response_model=file_models.FileBatchDeleteResponse)
+async def delete_many_files(
+    data: file_models.FileBatchDelete,
+    file_service: FileServiceDep,
+):
+    """
+    Delete many files in one request, reporting whether each one was deleted. Content addressed files only lose a reference.
+    S3 storage can not tell missing files apart, so they are reported deleted there
+    """
+    try:
+        results = await file_service.delete_files(paths=data.paths)
+    except AppException:
+        raise
+    except Exception:
+        raise InternalServerError("Failed to delete files")
+
+    return file_models.FileBatchDeleteResponse(
+        message="Files deleted successfully",
+        data=file_models.FileBatchDeletePublic(
+            deleted=sum(results.values()),
+            results=[
+                file_models.FileDeleteResult(path=path, deleted=deleted)
+                for path, deleted in results.items()
+            ],
+        ),
     )
 
 
 @router.delete("/{id}", response_model=Message)
 async def delete_one_file(
     path: str,
-    storage_service: StorageServiceDep,
+    file_service: FileServiceDep,
 ):
     """
-    Deleted saved file
+    Deleted saved file. Content addressed files are only deleted once every upload of them is deleted
     """
     try:
-        is_deleted = await storage_service.delete_file(path=path)
+        is_deleted = await file_service.delete_file(path=path)
         if not is_deleted:
             raise NotFoundError("File not found")
+    except AppException:
+        raise
     except Exception:
         raise InternalServerError("Failed to delete file")
 
@@ -2,8 +2,11 @@ from fastapi import APIRouter
 from src.api.dependencies import SessionDep
 from src.models import SystemHealth
 from sqlmodel import select
+from src.api.routing import AppRoute
 
-router = APIRouter(prefix="/health-check", tags=["Health Check Endpoint"])
+router = APIRouter(
+    route_class=AppRoute, prefix="/health-check", tags=["Health Check Endpoint"]
+)
 
 
 @router.get("/", response_model=SystemHealth)
@@ -1,11 +1,16 @@
 from typing import Annotated
-from fastapi import APIRouter, Depends, status
+from fastapi import APIRouter, Depends, Query, status
 from src.services import ItemService
 from src.models import item as item_models, Message
 from src.api.dependencies import SessionDep
 from uuid import UUID
+from src.api.routing import AppRoute
+from src.models.base import ExportFormat
+from src.utils.export import create_export_response
+from fastapi.responses import StreamingResponse
 
 router = APIRouter(
+    route_class=AppRoute,
     prefix="/items",
     tags=["Item Endpoints"],
     responses={
@@ -42,23 +47,59 @@ async def add_one_item(
     )
 
 
-@router.get("/", response_model=item_models.ItemsPublicResponse)
+@router.get(
+    "/",
+    response_model=item_models.ItemsPublicResponse
+    | item_models.ItemsPartialPublicResponse,
+)
 async def get_all_items(
     item_service: ItemServiceDep,
     skip: int = 0,
     limit: int = 10,
     query: item_models.ItemSearch = Depends(),
+    fields: str | None = Query(
+        default=None,
+        description="Comma separated item fields to return, e.g. `id,title`. All fields are returned when omitted",
+    ),
 ):
     """
     Get all item records
     """
-    data = await item_service.get_all_items(skip=skip, limit=limit, query=query)
+    data = await item_service.get_all_items(
+        skip=skip, limit=limit, query=query, fields=fields
+    )
 
+    if isinstance(data, item_models.ItemsPartialPublic):
+        return item_models.ItemsPartialPublicResponse(
+            **vars(data), message="Items retrieved successfully"
+        )
     return item_models.ItemsPublicResponse(
         **vars(data), message="Items retrieved successfully"
     )
 
 
+@router.get(
+    "/export",
+    response_class=StreamingResponse,
+    responses={200: {"description": "Items streamed as NDJSON or CSV"}},
+)
+async def export_items(
+    item_service: ItemServiceDep,
+    format: ExportFormat = ExportFormat.NDJSON,
+    gzip: bool = False,
+    query: item_models.ItemSearch = Depends(),
+):
+    """
+    Export all item records matching the query
+    """
+    return create_export_response(
+        item_service.export_items(query=query, format=format, gzip=gzip),
+        name="items",
+        format=format,
+        gzip=gzip,
+    )
+
+
 @router.get("/{id}", response_model=item_models.ItemPublicResponse)
 async def get_one_item_by_id(id: UUID, item_service: ItemServiceDep):
     """
@@ -3,8 +3,10 @@ from pydantic import EmailStr
 from celery.result import AsyncResult
 from src.models import TaskSubmission, TaskResult
 from src.tasks import basic as basic_tasks, email as email_tasks
+from src.api.routing import AppRoute
 
 router = APIRouter(
+    route_class=AppRoute,
     prefix="/tasks",
     tags=["Long-running Task Endpoints"],
     responses={
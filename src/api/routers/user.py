@@ -1,12 +1,21 @@
 import uuid
 
 from typing import Annotated
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query
 from src.services import UserService
 from src.models import user as user_models
-from src.api.dependencies import SessionDep, CurrentUser
+from src.api.dependencies import (
+    SessionDep,
+    CurrentUser,
+    get_current_active_superuser,
+)
+from src.api.routing import AppRoute
+from src.models.base import ExportFormat
+from src.utils.export import create_export_response
+from fastapi.responses import StreamingResponse
 
 router = APIRouter(
+    route_class=AppRoute,
     prefix="/users",
     tags=["User Endpoints"],
     responses={
@@ -26,24 +35,58 @@ UserServiceDep = Annotated[UserService, Depends(get_user_service)]
 
 @router.get(
     "/",
-    response_model=user_models.UsersPublicResponse,
+    response_model=user_models.UsersPublicResponse
+    | user_models.UsersPartialPublicResponse,
 )
 async def get_users(
     user_service: UserServiceDep,
     skip: int = 0,
     limit: int = 10,
     query: user_models.UserSearch = Depends(),
+    fields: str | None = Query(
+        default=None,
+        description="Comma separated user fields to return, e.g. `id,email`. All fields are returned when omitted",
+    ),
 ):
     """
     Get all user records
     """
-    data = await user_service.get_all_users(skip=skip, limit=limit, query=query)
+    data = await user_service.get_all_users(
+        skip=skip, limit=limit, query=query, fields=fields
+    )
 
+    if isinstance(data, user_models.UsersPartialPublic):
+        return user_models.UsersPartialPublicResponse(
+            **vars(data), message="Users retrieved successfully"
+        )
     return user_models.UsersPublicResponse(
         **vars(data), message="Users retrieved successfully"
     )
 
 
+@router.get(
+    "/export",
+    response_class=StreamingResponse,
+    dependencies=[Depends(get_current_active_superuser)],
+    responses={200: {"description": "Users streamed as NDJSON or CSV"}},
+)
+async def export_users(
+    user_service: UserServiceDep,
+    format: ExportFormat = ExportFormat.NDJSON,
+    gzip: bool = False,
+    query: user_models.UserSearch = Depends(),
+):
+    """
+    Export all user records matching the query
+    """
+    return create_export_response(
+        user_service.export_users(query=query, format=format, gzip=gzip),
+        name="users",
+        format=format,
+        gzip=gzip,
+    )
+
+
 @router.get("/me", response_model=user_models.UserPublicResponse)
 async def get_user_me(current_user: CurrentUser, user_service: UserServiceDep):
     """
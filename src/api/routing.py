@@ -0,0 +1,190 @@
+import functools
+import inspect
+import time
+from contextlib import nullcontext
+from contextvars import ContextVar
+from types import UnionType
+from typing import Any, Callable, Coroutine, Union, get_args, get_origin
+from fastapi import Request, Response
+from fastapi.datastructures import DefaultPlaceholder
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from pydantic import BaseModel
+from src.core.config import AppConfig
+from src.core.timing import record_timing, request_timings
+from src.core.tracing import current_span, tracer
+
+# start and end of the endpoint call of the current request in nanoseconds
+route_phases: ContextVar[dict[str, int] | None] = ContextVar(
+    "route_phases", default=None
+)
+
+
+def span_if_traced(name: str):
+    """Start a child span only for requests that are being traced"""
+    return tracer.span(name) if current_span.get() is not None else nullcontext()
+
+
+def trace_endpoint(func: Callable, name: str) -> Callable:
+    """
+    Run an endpoint in its own span and note when it starts and ends,
+    which splits the request into dependency resolution, the endpoint and response serialization
+    """
+
+    def record(phase: str) -> None:
+        phases = route_phases.get()
+        if phases is not None:
+            phases[phase] = time.time_ns()
+
+    # fastapi awaits coroutine endpoints and runs the rest in a threadpool so the wrapper must keep the function kind
+    if inspect.iscoroutinefunction(func):
+
+        @functools.wraps(func)
+        async def async_endpoint(*args, **kwargs):
+            record("endpoint_start")
+            try:
+                with span_if_traced(name):
+                    return await func(*args, **kwargs)
+            finally:
+                record("endpoint_end")
+
+        return async_endpoint
+
+    @functools.wraps(func)
+    def endpoint(*args, **kwargs):
+        record("endpoint_start")
+        try:
+            with span_if_traced(name):
+                return func(*args, **kwargs)
+        finally:
+            record("endpoint_end")
+
+    return endpoint
+
+
+def get_response_model_types(response_model: Any) -> tuple[type[BaseModel], ...]:
+    """Get the model classes a response model accepts, including every model of a union"""
+    if isinstance(response_model, type) and issubclass(response_model, BaseModel):
+        return (response_model,)
+
+    if get_origin(response_model) in (Union, UnionType):
+        return tuple(
+            member
+            for member in get_args(response_model)
+            if isinstance(member, type) and issubclass(member, BaseModel)
+        )
+    return ()
+
+
+def serialize_endpoint(func: Callable, route: APIRoute) -> Callable:
+    """
+    Serialize results that already are an instance of the response model straight to JSON.
+    FastAPI would otherwise validate them against the response model a second time and pass them through `jsonable_encoder`
+    """
+    model_types = get_response_model_types(route.response_model)
+    status_code = route.status_code or 200
+    options = {
+        "by_alias": route.response_model_by_alias,
+        "exclude_unset": route.response_model_exclude_unset,
+        "exclude_defaults": route.response_model_exclude_defaults,
+        "exclude_none": route.response_model_exclude_none,
+    }
+
+    def serialize(result: Any) -> Any:
+        # subclasses may carry fields the response model leaves out so only exact matches are trusted
+        if type(result) not in model_types:
+            return result
+        return Response(
+            content=result.model_dump_json(**options),
+            status_code=status_code,
+            media_type="application/json",
+        )
+
+    if inspect.iscoroutinefunction(func):
+
+        @functools.wraps(func)
+        async def async_endpoint(*args, **kwargs):
+            return serialize(await func(*args, **kwargs))
+
+        return async_endpoint
+
+    @functools.wraps(func)
+    def endpoint(*args, **kwargs):
+        return serialize(func(*args, **kwargs))
+
+    return endpoint
+
+
+class AppRoute(APIRoute):
+    """
+    API route that serializes response models directly and
+    times each phase of request handling when tracing or the Server-Timing header is enabled
+    """
+
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        timed = tracer.enabled or AppConfig.SERVER_TIMING_ENABLED
+        if timed:
+            self.dependant.call = trace_endpoint(
+                self.dependant.call, f"endpoint {self.name}"
+            )
+        # serialization wraps the timing so it is reported as part of the serialization phase
+        if self.can_serialize_directly():
+            self.dependant.call = serialize_endpoint(self.dependant.call, route=self)
+
+        handler = super().get_route_handler()
+        if not timed:
+            return handler
+
+        async def route_handler(request: Request) -> Response:
+            tracing = current_span.get() is not None
+            if not tracing and request_timings.get() is None:
+                return await handler(request)
+
+            start_time = time.time_ns()
+            phases: dict[str, int] = {}
+            token = route_phases.set(phases)
+            try:
+                with (
+                    tracer.span(
+                        f"route {self.path}", attributes={"http.route": self.path}
+                    )
+                    if tracing
+                    else nullcontext()
+                ):
+                    response = await handler(request)
+                    end_time = time.time_ns()
+
+                    # dependencies are resolved before the endpoint is called and the result is validated after it returns
+                    if "endpoint_end" in phases:
+                        record_timing(
+                            "serialize", (end_time - phases["endpoint_end"]) / 1e9
+                        )
+                    if tracing and "endpoint_start" in phases:
+                        tracer.record_span(
+                            "request.dependencies", start_time, phases["endpoint_start"]
+                        )
+                    if tracing and "endpoint_end" in phases:
+                        tracer.record_span(
+                            "response.serialize", phases["endpoint_end"], end_time
+                        )
+                    return response
+            finally:
+                route_phases.reset(token)
+
+        return route_handler
+
+    def can_serialize_directly(self) -> bool:
+        """Check that returning a serialized response yields the same response FastAPI would build"""
+        response_class = self.response_class
+        if isinstance(response_class, DefaultPlaceholder):
+            response_class = response_class.value
+
+        return (
+            AppConfig.FAST_RESPONSES_ENABLED
+            and bool(get_response_model_types(self.response_model))
+            and issubclass(response_class, JSONResponse)
+            and self.response_model_include is None
+            and self.response_model_exclude is None
+            # headers set on an injected response are only applied to responses built by FastAPI
+            and self.dependant.response_param_name is None
+        )
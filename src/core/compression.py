@@ -0,0 +1,122 @@
+import zlib
+from abc import ABC, abstractmethod
+from typing import Callable
+from prometheus_client import Histogram
+
+# brotli and zstd support comes from the optional `compression` extra. gzip is always available
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class Compressor(ABC):
+    """Incrementally compresses a response body in the format of one content coding"""
+
+    @abstractmethod
+    def compress(self, data: bytes) -> bytes:
+        """Compress a chunk and flush it so the client can decode everything sent so far"""
+
+    @abstractmethod
+    def finish(self) -> bytes:
+        """Return the end of the compressed stream"""
+
+
+class GzipCompressor(Compressor):
+    def __init__(self, level: int = 6) -> None:
+        # a window of 16 + 15 bits writes a gzip header and trailer around the deflate stream
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(
+            zlib.Z_SYNC_FLUSH
+        )
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class BrotliCompressor(Compressor):
+    def __init__(self, quality: int = 4) -> None:
+        self._compressor = brotli.Compressor(quality=quality)  # type: ignore
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class ZstdCompressor(Compressor):
+    def __init__(self, level: int = 3) -> None:
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()  # type: ignore
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(
+            zstandard.COMPRESSOBJ_FLUSH_BLOCK  # type: ignore
+        )
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+# content coding -> compressor factory for every coding supported by the installed packages
+compressors: dict[str, Callable[[], Compressor]] = {"gzip": GzipCompressor}
+if brotli is not None:
+    compressors["br"] = BrotliCompressor
+if zstandard is not None:
+    compressors["zstd"] = ZstdCompressor
+
+compression_ratio_histogram = Histogram(
+    name="http_response_compression_ratio",
+    documentation="Uncompressed to compressed size ratio of compressed HTTP responses",
+    labelnames=["encoding"],
+    buckets=(1, 1.5, 2, 3, 4, 6, 8, 12, 16, 24, 32, float("INF")),
+)
+compression_cpu_histogram = Histogram(
+    name="http_response_compression_cpu_seconds",
+    documentation="CPU time spent compressing HTTP responses (seconds)",
+    labelnames=["encoding"],
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, float("INF")),
+)
+
+
+def parse_accept_encoding(header: str) -> dict[str, float]:
+    """Parse an Accept-Encoding header into content codings and their quality values"""
+    codings = {}
+    for item in header.split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        codings[coding] = quality
+    return codings
+
+
+def negotiate_encoding(header: str, preferred: list[str]) -> str | None:
+    """
+    Pick the content coding to compress a response with.
+    The client's quality values decide first and ties go to the coding listed first in `preferred`
+    """
+    accepted = parse_accept_encoding(header)
+    best, best_quality = None, 0.0
+    for coding in preferred:
+        if coding not in compressors:
+            continue
+        quality = accepted.get(coding, accepted.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
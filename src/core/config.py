@@ -1,3 +1,4 @@
+from pydantic import BaseModel
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from enum import StrEnum
 
@@ -8,6 +9,14 @@ class Environment(StrEnum):
     PRODUCTION = "PRODUCTION"
 
 
+class ImageVariant(BaseModel):
+    # images are scaled down to fit within the width and height, keeping their aspect ratio. unset sides are not limited
+    width: int | None = None
+    height: int | None = None
+    format: str = "webp"  # webp | jpeg | png
+    quality: int = 80
+
+
 class Settings(BaseSettings):
     # core
     PROJECT_TITLE: str = "FastAPI Starter"
@@ -15,9 +24,13 @@ class Settings(BaseSettings):
     PROJECT_VERSION: str = "1.0.0"
     ENVIRONMENT: Environment = Environment.DEVELOPMENT
     IS_DEVELOPMENT: bool = ENVIRONMENT == Environment.DEVELOPMENT
+    # serialize endpoint results that already are the response model without validating them again
+    FAST_RESPONSES_ENABLED: bool = True
     # database
     DATABASE_URL: str
     DB_POOL_SIZE: int = 20
+    # rows fetched from the database per round trip when streaming exports
+    EXPORT_CHUNK_SIZE: int = 1000
 
     # security
     CLIENT_ORIGINS: str
@@ -28,6 +41,32 @@ class Settings(BaseSettings):
     REFRESH_TOKEN_EXPIRE_HOURS: int
     OTP_EXPIRE_MINUTES: int = 10
 
+    # token revocation
+    REVOCATION_BACKEND: str = "database"  # database | redis
+    REVOCATION_FILTER_CAPACITY: int = 100_000
+    REVOCATION_FILTER_ERROR_RATE: float = 0.001
+    REVOCATION_SYNC_INTERVAL_SECONDS: int = 30
+
+    # rate limiting. limits are given as `<requests>/<second|minute|hour|day>`
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_BACKEND: str = "memory"  # memory | redis
+    RATE_LIMIT_LOGIN: str = "10/minute"
+    RATE_LIMIT_SIGNUP: str = "5/minute"
+    RATE_LIMIT_TASKS: str = "30/minute"
+    # identify clients by the X-Real-IP header set by the reverse proxy. must be enabled behind a proxy, otherwise every
+    # anonymous client is seen as the proxy's address and shares one bucket. leave it off when clients reach the api directly
+    # since they could then send the header themselves
+    RATE_LIMIT_TRUST_PROXY: bool = False
+
+    # logging
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "json"  # json | text
+    # records logged while the queue is full are dropped instead of blocking the caller
+    LOG_QUEUE_SIZE: int = 10_000
+    # repeated errors with the same message are logged at most `burst` times per window
+    LOG_ERROR_SAMPLE_WINDOW_SECONDS: float = 60
+    LOG_ERROR_SAMPLE_BURST: int = 10
+
     # oauth client credentials
     GOOGLE_CLIENT_ID: str
     GOOGLE_CLIENT_SECRET: str
@@ -48,14 +87,139 @@ class Settings(BaseSettings):
     SUPERUSER_PASSWORD: str
 
     # storage
+    STORAGE_BACKEND: str = (
+        ""  # local | s3. defaults to local storage in development and s3 otherwise
+    )
     LOCAL_STORAGE_PATH: str
     AWS_BUCKET_NAME: str
     AWS_ACCESS_KEY: str
     AWS_SECRET_KEY: str
     AWS_REGION: str
+    # endpoint of an s3 compatible service such as minio. uses aws when unset
+    AWS_ENDPOINT_URL: str | None = None
+    # files larger than one part are uploaded as multipart uploads with this many parts in flight at once
+    S3_MULTIPART_PART_SIZE_BYTES: int = 8 * 1024 * 1024
+    S3_MULTIPART_CONCURRENCY: int = 4
+    # s3 calls run on the default thread pool so more connections than its threads are never used at once
+    S3_MAX_POOL_CONNECTIONS: int = 32
+    S3_MAX_ATTEMPTS: int = 3
+    S3_CONNECT_TIMEOUT_SECONDS: float = 5
+    S3_READ_TIMEOUT_SECONDS: float = 60
+    # downloads of files with unique names are kept in a disk cache of this size. the cache is disabled when 0
+    S3_CACHE_PATH: str = "data/s3-cache"
+    S3_CACHE_MAX_SIZE_BYTES: int = 0
+    # larger files are always streamed from s3 so one download can not evict the whole cache
+    S3_CACHE_MAX_FILE_SIZE_BYTES: int = 100 * 1024 * 1024
+    # uploads are streamed in chunks of this size and rejected once they exceed the maximum size
+    UPLOAD_CHUNK_SIZE_BYTES: int = 1024 * 1024
+    MAX_UPLOAD_SIZE_BYTES: int = 50 * 1024 * 1024
+    # batch deletes accept this many paths and run this many unlink threads or s3 requests at once
+    MAX_BATCH_DELETE_PATHS: int = 10_000
+    STORAGE_DELETE_CONCURRENCY: int = 8
+    # how long clients may cache downloads of files with unique names
+    FILE_CACHE_MAX_AGE_SECONDS: int = 365 * 24 * 60 * 60
+    # store uploads under the sha-256 digest of their contents so identical files are only stored once
+    STORAGE_CONTENT_ADDRESSED: bool = False
+    # presigned urls let clients transfer files straight to and from storage
+    PRESIGNED_URL_EXPIRE_SECONDS: int = 15 * 60
+    # time left to confirm an upload through a presigned url once it has been issued
+    PRESIGNED_UPLOAD_COMPLETE_EXPIRE_SECONDS: int = 24 * 60 * 60
+    # content type prefixes accepted for presigned uploads. any type is accepted when empty
+    UPLOAD_ALLOWED_CONTENT_TYPES: list[str] = []
+    # resumable uploads are received in chunks and may be larger than single request uploads.
+    # client_max_body_size of /files/ in the nginx configs must be raised along with it
+    MAX_RESUMABLE_UPLOAD_SIZE_BYTES: int = 10 * 1024 * 1024 * 1024
+    # resumable uploads expire after this long without receiving a chunk
+    UPLOAD_SESSION_EXPIRE_SECONDS: int = 24 * 60 * 60
+    UPLOAD_SESSION_CLEANUP_INTERVAL_SECONDS: int = 10 * 60
+    # an upload receives one chunk at a time. the chunk being received holds it for at most this long
+    UPLOAD_SESSION_LOCK_SECONDS: int = 10 * 60
+    # variants generated by the worker for uploaded images, served with `?variant=<name>`. needs the `images` extra
+    IMAGE_VARIANTS: dict[str, ImageVariant] = {
+        "thumb": ImageVariant(width=256, height=256),
+        "webp": ImageVariant(),
+    }
+    # content types variants are generated for, matched by prefix
+    IMAGE_VARIANT_CONTENT_TYPES: list[str] = [
+        "image/jpeg",
+        "image/png",
+        "image/webp",
+        "image/gif",
+    ]
+    # larger images are not decoded so a small file can not expand into gigabytes of pixels
+    IMAGE_MAX_PIXELS: int = 50_000_000
+
+    # monitoring
+    METRICS_LATENCY_BUCKETS: list[float] = [
+        0.01,
+        0.05,
+        0.1,
+        0.25,
+        0.5,
+        1.0,
+        3.0,
+        7.5,
+        10.0,
+    ]
+    METRICS_SIZE_BUCKETS: list[float] = [
+        100,
+        500,
+        1000,
+        5000,
+        10000,
+        50000,
+        100000,
+        500000,
+        1000000,
+    ]
+    # upper bound on the label combinations recorded per metric
+    METRICS_MAX_LABEL_SETS: int = 2000
+    # compress responses with the first coding in the list the client accepts. br and zstd need the `compression` extra
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_ENCODINGS: list[str] = ["zstd", "br", "gzip"]
+    # smaller responses are sent as they are since compressing them saves little
+    COMPRESSION_MIN_SIZE_BYTES: int = 1000
+    # content types that are already compressed, matched by prefix
+    COMPRESSION_EXCLUDED_CONTENT_TYPES: list[str] = [
+        "image/",
+        "video/",
+        "audio/",
+        "font/woff",
+        "application/gzip",
+        "application/zip",
+        "application/zstd",
+        "application/x-brotli",
+        "application/pdf",
+        "application/octet-stream",
+    ]
+    # add a Server-Timing header breaking down where each request spent its time
+    SERVER_TIMING_ENABLED: bool = False
+    # event loop lag sampling. stacks of code blocking the loop for longer than the threshold are logged
+    LOOP_MONITOR_ENABLED: bool = True
+    LOOP_MONITOR_INTERVAL_SECONDS: float = 0.1
+    LOOP_BLOCKED_THRESHOLD_SECONDS: float = 0.25
+
+    # tracing
+    TRACING_ENABLED: bool = False
+    TRACING_EXPORTER: str = "otlp"  # otlp | memory
+    TRACING_OTLP_ENDPOINT: str = "http://localhost:4318"
+    # share of new traces to record. requests continuing a remote trace follow its sampling decision
+    TRACING_SAMPLE_RATE: float = 1.0
+    TRACING_SERVICE_NAME: str = "fastapi-starter"
+
+    # profiling and heap debugging. the superuser only debug endpoints are unavailable unless enabled
+    PROFILING_ENABLED: bool = False
+    PROFILING_MAX_SECONDS: int = 60
+    PROFILING_MAX_SAMPLE_RATE: int = 200
+    HEAP_DEBUG_ENABLED: bool = False
+    HEAP_MAX_SNAPSHOTS: int = 5
+    # stack depth recorded per allocation. deeper stacks cost more memory while tracing
+    HEAP_MAX_TRACE_FRAMES: int = 25
 
     # broker
     BROKER_URL: str
+    # redis used for shared application state. defaults to the broker url
+    REDIS_URL: str | None = None
 
     # compose cors allowed origins
     @property
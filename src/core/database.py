@@ -1,8 +1,11 @@
+import time
 from sqlmodel import create_engine, select
 from sqlalchemy import event
 from sqlalchemy.ext.asyncio import AsyncEngine
 from sqlmodel.ext.asyncio.session import AsyncSession
 from src.core.config import AppConfig
+from src.core.timing import record_timing, request_timings
+from src.core.tracing import SpanKind, current_span, tracer
 
 # disable strict single thread check
 connect_args = {"check_same_thread": False}
@@ -38,6 +41,66 @@ def configure_sqlite_connection(conn, record):
     conn.execute("PRAGMA cache_size = -64000;")
 
 
+# trace queries issued while handling a traced request or job
+def start_query_span(conn, cursor, statement, parameters, context, executemany):
+    # queries outside a trace, such as background syncs, are not recorded
+    if current_span.get() is None:
+        return
+
+    span = tracer.start_span(
+        f"sql {statement.split(None, 1)[0].upper() if statement else 'QUERY'}",
+        kind=SpanKind.CLIENT,
+        attributes={"db.system": conn.dialect.name, "db.statement": statement},
+    )
+    conn.info.setdefault("query_spans", []).append(span)
+
+
+def end_query_span(conn, cursor, statement, parameters, context, executemany):
+    spans = conn.info.get("query_spans")
+    if spans:
+        tracer.end_span(spans.pop())
+
+
+def end_failed_query_span(exception_context):
+    conn = exception_context.connection
+    spans = conn.info.get("query_spans") if conn is not None else None
+    if spans:
+        span = spans.pop()
+        span.record_exception(exception_context.original_exception)
+        tracer.end_span(span)
+
+
+if tracer.enabled:
+    event.listen(engine.sync_engine, "before_cursor_execute", start_query_span)
+    event.listen(engine.sync_engine, "after_cursor_execute", end_query_span)
+    event.listen(engine.sync_engine, "handle_error", end_failed_query_span)
+
+
+# time queries of requests reporting a Server-Timing header
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    if request_timings.get() is not None:
+        conn.info.setdefault("query_start_times", []).append(time.perf_counter())
+
+
+def stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+    start_times = conn.info.get("query_start_times")
+    if start_times:
+        record_timing("db", time.perf_counter() - start_times.pop())
+
+
+def stop_failed_query_timer(exception_context):
+    conn = exception_context.connection
+    start_times = conn.info.get("query_start_times") if conn is not None else None
+    if start_times:
+        record_timing("db", time.perf_counter() - start_times.pop())
+
+
+if AppConfig.SERVER_TIMING_ENABLED:
+    event.listen(engine.sync_engine, "before_cursor_execute", start_query_timer)
+    event.listen(engine.sync_engine, "after_cursor_execute", stop_query_timer)
+    event.listen(engine.sync_engine, "handle_error", stop_failed_query_timer)
+
+
 async def init_db():
     async with AsyncSession(engine) as session:
         # ensure db is responsive on startup
@@ -42,6 +42,13 @@ class ConflictError(AppException):
         super().__init__(message=message, status_code=409)
 
 
+class PayloadTooLargeError(AppException):
+    """Raise exception for request payloads above the allowed size"""
+
+    def __init__(self, message: str = "Payload too large") -> None:
+        super().__init__(message=message, status_code=413)
+
+
 class InternalServerError(AppException):
     """Raise exception for internal errors"""
 
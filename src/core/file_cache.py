@@ -0,0 +1,170 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+from collections import OrderedDict
+from pathlib import Path, PurePosixPath
+from typing import Awaitable, BinaryIO, Callable
+from fastapi.logger import logger
+from prometheus_client import Counter, Gauge
+from src.utils.heap import register_cache
+
+storage_cache_requests_counter = Counter(
+    name="storage_cache_requests_total",
+    documentation="Total number of storage cache lookups by result. Lookups joining a fill in progress are counted as shared",
+    labelnames=["result"],
+)
+storage_cache_evictions_counter = Counter(
+    name="storage_cache_evictions_total",
+    documentation="Total number of files evicted from the storage cache",
+)
+storage_cache_size_gauge = Gauge(
+    name="storage_cache_size_bytes",
+    documentation="Total size of the files held by the storage cache (bytes)",
+)
+
+# writes a file's contents to the given file object. returns False to skip caching the file
+Fetcher = Callable[[BinaryIO], Awaitable[bool]]
+# number of skipped keys remembered so they are not fetched again on every lookup
+MAX_SKIPPED_KEYS = 1024
+
+
+class FileCache:
+    """
+    Size bounded LRU cache of remote files on local disk.
+    Files are fetched into a temporary file and renamed into place so a partial file is never served,
+    and concurrent misses for the same key share a single fetch.
+    Workers sharing the directory each track the files they know of, so a file evicted by another worker is treated as a miss
+    """
+
+    def __init__(self, path: str, max_size: int) -> None:
+        self.root_path = Path(path)
+        self.max_size = max_size
+        self.size = 0
+        # key -> size of the cached file, least recently used first
+        self._entries: OrderedDict[str, int] = OrderedDict()
+        self._fills: dict[str, asyncio.Task] = {}
+        # names the fetcher declined to cache, least recently skipped first
+        self._skipped: OrderedDict[str, None] = OrderedDict()
+        self._load()
+        register_cache("storage_cache", lambda: len(self._entries))
+
+    def _load(self) -> None:
+        """Pick up files cached before a restart, treating the most recently written as the most recently used"""
+        self.root_path.mkdir(parents=True, exist_ok=True)
+        files = []
+        for entry in os.scandir(self.root_path):
+            if entry.is_file() and not entry.name.startswith("."):
+                stat_result = entry.stat()
+                files.append((stat_result.st_mtime, entry.name, stat_result.st_size))
+            elif entry.name.startswith(".fill-"):
+                # left behind by a fill that never finished
+                Path(entry.path).unlink(missing_ok=True)
+
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+            self.size += size
+        storage_cache_size_gauge.set(self.size)
+
+    def _get_name(self, key: str) -> str:
+        # keys are hashed into flat names. the extension is kept so the media type can still be guessed from the name
+        suffix = PurePosixPath(key).suffix
+        return hashlib.sha256(key.encode()).hexdigest() + (
+            suffix if suffix[1:].isalnum() else ""
+        )
+
+    async def get(self, key: str, fetch: Fetcher) -> tuple[Path, os.stat_result] | None:
+        """
+        Get the cached file of a key, fetching it on a miss. Returns None if the fetcher skipped caching the file.
+        Keys must name contents that never change since cached files are not revalidated
+        """
+        name = self._get_name(key)
+        if name in self._skipped:
+            storage_cache_requests_counter.labels("skip").inc()
+            return None
+        if name in self._entries:
+            file_path = self.root_path / name
+            try:
+                stat_result = await asyncio.to_thread(file_path.stat)
+                self._entries.move_to_end(name)
+                storage_cache_requests_counter.labels("hit").inc()
+                return file_path, stat_result
+            except FileNotFoundError:
+                self._forget(name)
+
+        task = self._fills.get(name)
+        if task is None:
+            storage_cache_requests_counter.labels("miss").inc()
+            task = asyncio.create_task(self._fill(name, fetch))
+            self._fills[name] = task
+            task.add_done_callback(lambda _: self._finish_fill(name, task))
+        else:
+            storage_cache_requests_counter.labels("shared").inc()
+
+        # a client going away must not cancel a fill other requests are waiting for
+        return await asyncio.shield(task)
+
+    async def _fill(
+        self, name: str, fetch: Fetcher
+    ) -> tuple[Path, os.stat_result] | None:
+        fd, temp_path = await asyncio.to_thread(
+            tempfile.mkstemp, dir=self.root_path, prefix=".fill-"
+        )
+        file_path = self.root_path / name
+        try:
+            with os.fdopen(fd, "wb") as file:
+                cached = await fetch(file)
+            if not cached:
+                await asyncio.to_thread(os.unlink, temp_path)
+                self._skipped[name] = None
+                if len(self._skipped) > MAX_SKIPPED_KEYS:
+                    self._skipped.popitem(last=False)
+                return None
+            await asyncio.to_thread(os.replace, temp_path, file_path)
+            stat_result = await asyncio.to_thread(file_path.stat)
+        except BaseException:
+            await asyncio.to_thread(Path(temp_path).unlink, missing_ok=True)
+            raise
+
+        self._forget(name)
+        self._entries[name] = stat_result.st_size
+        self.size += stat_result.st_size
+        await self._evict()
+        storage_cache_size_gauge.set(self.size)
+        return file_path, stat_result
+
+    def _finish_fill(self, name: str, task: asyncio.Task) -> None:
+        self._fills.pop(name, None)
+        # retrieve the error so it is not logged as unhandled when every waiter was cancelled
+        if not task.cancelled():
+            task.exception()
+
+    async def _evict(self) -> None:
+        """Delete the least recently used files until the cache fits its size"""
+        evicted = []
+        while self.size > self.max_size and len(self._entries) > 1:
+            name, size = self._entries.popitem(last=False)
+            self.size -= size
+            evicted.append(self.root_path / name)
+
+        if evicted:
+            storage_cache_evictions_counter.inc(len(evicted))
+            try:
+                await asyncio.to_thread(
+                    lambda: [path.unlink(missing_ok=True) for path in evicted]
+                )
+            except OSError:
+                logger.warning("Failed to delete evicted cache files", exc_info=True)
+
+    def _forget(self, name: str) -> None:
+        size = self._entries.pop(name, None)
+        if size is not None:
+            self.size -= size
+            storage_cache_size_gauge.set(self.size)
+
+    async def discard(self, key: str) -> None:
+        """Remove a key from the cache, such as when its remote file is deleted"""
+        name = self._get_name(key)
+        self._forget(name)
+        self._skipped.pop(name, None)
+        await asyncio.to_thread((self.root_path / name).unlink, missing_ok=True)
@@ -0,0 +1,226 @@
+import json
+import logging
+import queue
+import sys
+import threading
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler
+from typing import TextIO
+from src.core.config import AppConfig
+from src.core.tracing import current_span
+
+# id of the request being handled, attached to every record logged while handling it
+request_id_var: ContextVar[str | None] = ContextVar("request_id", default=None)
+
+
+class JSONFormatter(logging.Formatter):
+    """Formats records as one JSON object per line"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": datetime.fromtimestamp(
+                record.created, tz=timezone.utc
+            ).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key in ("request_id", "trace_id", "span_id", "suppressed"):
+            value = getattr(record, key, None)
+            if value:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+
+        return json.dumps(entry, default=str)
+
+
+class DuplicateErrorFilter(logging.Filter):
+    """
+    Samples bursts of repeated errors. Only the first `burst` errors with the same message template are logged per window,
+    and the next one logged reports how many were suppressed in between
+    """
+
+    def __init__(self, window: float, burst: int) -> None:
+        super().__init__()
+        self.window = window
+        self.burst = burst
+        # (logger, template) -> (window start, logged, suppressed)
+        self.seen: dict[tuple[str, str], tuple[float, int, int]] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.ERROR:
+            return True
+
+        key = (record.name, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            started_at, logged, suppressed = self.seen.get(key, (now, 0, 0))
+            if now - started_at >= self.window:
+                started_at, logged = now, 0
+
+            if logged >= self.burst:
+                self.seen[key] = (started_at, logged, suppressed + 1)
+                return False
+
+            self.seen[key] = (started_at, logged + 1, 0)
+            # keep memory bounded when many distinct messages are logged
+            if len(self.seen) > 10_000:
+                self.seen.clear()
+
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class LazyQueueHandler(QueueHandler):
+    """
+    Hands records to the listener thread without formatting them.
+    Context only available in the logging thread is captured here, and records are dropped instead of blocking when the queue is full
+    """
+
+    def __init__(self, queue: queue.Queue) -> None:
+        super().__init__(queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.request_id = request_id_var.get()
+        span = current_span.get()
+        if span is not None:
+            record.trace_id = span.trace_id
+            record.span_id = span.span_id
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class BatchingQueueListener:
+    """Formats queued records on a background thread and writes them to the stream in batches"""
+
+    def __init__(
+        self,
+        queue: queue.Queue,
+        formatter: logging.Formatter,
+        stream: TextIO,
+        batch_size: int = 256,
+        flush_interval: float = 0.5,
+    ) -> None:
+        self.queue = queue
+        self.formatter = formatter
+        self.stream = stream
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="log-writer", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self) -> None:
+        """Write out everything queued so far and stop the thread"""
+        if self._thread is not None:
+            self.queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            batch: list[logging.LogRecord] = []
+            # block until there is something to write, then collect whatever else arrives shortly after
+            record = self.queue.get()
+            deadline = time.monotonic() + self.flush_interval
+            while record is not None:
+                batch.append(record)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    record = self.queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+            else:
+                stopping = True
+
+            if batch:
+                self._write(batch)
+
+    def _write(self, batch: list[logging.LogRecord]) -> None:
+        lines = []
+        for record in batch:
+            try:
+                lines.append(self.formatter.format(record))
+            except Exception:
+                lines.append(f"Failed to format log record from {record.name}")
+        try:
+            self.stream.write("\n".join(lines) + "\n")
+            self.stream.flush()
+        except Exception:
+            # the writer thread must keep running, so like logging.Handler.handleError the loss is reported on the
+            # original stderr, which is left alone when that fails as well
+            if sys.__stderr__ is not None:
+                try:
+                    sys.__stderr__.write(
+                        f"Failed to write {len(batch)} log records, dropping them\n"
+                    )
+                    sys.__stderr__.flush()
+                except Exception:
+                    pass
+
+
+log_listener: BatchingQueueListener | None = None
+
+
+def configure_logging() -> None:
+    """Route all application logs through the queue to the background writer"""
+    global log_listener
+    if log_listener is not None:
+        return
+
+    log_queue: queue.Queue = queue.Queue(maxsize=AppConfig.LOG_QUEUE_SIZE)
+    formatter = (
+        JSONFormatter()
+        if AppConfig.LOG_FORMAT == "json"
+        else logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s")
+    )
+    log_listener = BatchingQueueListener(
+        queue=log_queue, formatter=formatter, stream=sys.stderr
+    )
+
+    handler = LazyQueueHandler(log_queue)
+    handler.addFilter(
+        DuplicateErrorFilter(
+            window=AppConfig.LOG_ERROR_SAMPLE_WINDOW_SECONDS,
+            burst=AppConfig.LOG_ERROR_SAMPLE_BURST,
+        )
+    )
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(AppConfig.LOG_LEVEL)
+    log_listener.start()
+
+
+def shutdown_logging() -> None:
+    """Flush queued logs and write anything logged afterwards directly"""
+    global log_listener
+    if log_listener is None:
+        return
+
+    handler = logging.StreamHandler(log_listener.stream)
+    handler.setFormatter(log_listener.formatter)
+    logging.getLogger().handlers = [handler]
+
+    log_listener.stop()
+    log_listener = None
@@ -0,0 +1,91 @@
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from fastapi.logger import logger
+from prometheus_client import Counter, Histogram
+from src.core.config import AppConfig
+
+event_loop_lag_histogram = Histogram(
+    name="event_loop_lag_seconds",
+    documentation="Delay of scheduled event loop callbacks past their due time (seconds)",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0, float("INF")),
+)
+event_loop_blocked_counter = Counter(
+    name="event_loop_blocked_total",
+    documentation="Total number of times the event loop was blocked past the threshold",
+)
+
+
+class EventLoopMonitor:
+    """
+    Measures event loop lag with a heartbeat task and names the code blocking the loop.
+    A watchdog thread notices when the heartbeat stalls and logs the stack of the loop thread while it is still blocked
+    """
+
+    def __init__(self, interval: float, threshold: float) -> None:
+        self.interval = interval
+        self.threshold = threshold
+        self._last_beat = time.monotonic()
+        self._loop_thread_id: int | None = None
+        self._task: asyncio.Task | None = None
+        self._thread: threading.Thread | None = None
+        self._stopped = threading.Event()
+
+    async def start(self) -> None:
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._thread = threading.Thread(
+            target=self._watch, name="event-loop-watchdog", daemon=True
+        )
+        self._thread.start()
+
+    async def stop(self) -> None:
+        self._stopped.set()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._thread:
+            self._thread.join(timeout=self.interval * 2)
+            self._thread = None
+
+    async def _heartbeat(self) -> None:
+        while True:
+            due = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            # the sleep ends late by however long other callbacks held the loop
+            event_loop_lag_histogram.observe(max(0, now - due))
+            self._last_beat = now
+
+    def _watch(self) -> None:
+        reported_beat = None
+        while not self._stopped.wait(self.interval):
+            last_beat = self._last_beat
+            blocked_for = time.monotonic() - last_beat - self.interval
+            # report each stall once, while the offending code is still on the stack
+            if blocked_for < self.threshold or last_beat == reported_beat:
+                continue
+
+            reported_beat = last_beat
+            event_loop_blocked_counter.inc()
+            frame = sys._current_frames().get(self._loop_thread_id)  # type: ignore
+            stack = "".join(traceback.format_stack(frame)) if frame else ""
+            logger.warning(
+                "Event loop blocked for more than %.3fs. Loop thread stack:\n%s",
+                blocked_for,
+                stack,
+            )
+
+
+loop_monitor = EventLoopMonitor(
+    interval=AppConfig.LOOP_MONITOR_INTERVAL_SECONDS,
+    threshold=AppConfig.LOOP_BLOCKED_THRESHOLD_SECONDS,
+)
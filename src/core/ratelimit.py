@@ -0,0 +1,219 @@
+import math
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from enum import StrEnum
+from prometheus_client import Counter, Histogram
+from src.core.config import AppConfig
+from src.core.redis import redis_client
+from src.core.timing import record_timing
+from src.utils.heap import register_cache
+
+rate_limit_requests_counter = Counter(
+    name="rate_limit_requests_total",
+    documentation="Total number of requests checked by the rate limiter",
+    labelnames=["policy", "decision"],
+)
+rate_limit_backend_latency_histogram = Histogram(
+    name="rate_limit_backend_latency_seconds",
+    documentation="Latency of rate limiter backend calls (seconds)",
+    labelnames=["backend"],
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, float("INF")),
+)
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    """A token bucket that holds `capacity` tokens and refills `rate` tokens per second"""
+
+    capacity: int
+    rate: float
+
+    @classmethod
+    def parse(cls, value: str) -> "RateLimit":
+        """Parse a limit such as `5/minute`. The full amount may be used in a single burst"""
+        amount, period = value.split("/")
+        return cls(capacity=int(amount), rate=int(amount) / PERIODS[period.strip()])
+
+
+@dataclass(frozen=True)
+class RateLimitResult:
+    allowed: bool
+    remaining: int
+    retry_after: float
+
+
+class RateLimitKey(StrEnum):
+    """What requests are grouped by when counting towards a limit"""
+
+    IP = "ip"
+    USER = "user"
+    TOKEN = "token"
+
+
+@dataclass(frozen=True)
+class RateLimitPolicy:
+    name: str
+    limit: RateLimit
+    key: RateLimitKey
+    # exact paths, or prefixes when ending with a slash
+    paths: tuple[str, ...]
+    methods: frozenset[str] | None = None
+
+    def matches(self, method: str, path: str) -> bool:
+        if self.methods and method not in self.methods:
+            return False
+
+        normalized = path.rstrip("/") or "/"
+        for pattern in self.paths:
+            if pattern.endswith("/"):
+                if normalized.startswith(pattern) or normalized == pattern[:-1]:
+                    return True
+            elif normalized == pattern:
+                return True
+        return False
+
+
+def get_rate_limit_policies() -> list[RateLimitPolicy]:
+    """Default policies protecting expensive endpoints"""
+    return [
+        # each login attempt costs a password hash
+        RateLimitPolicy(
+            name="login",
+            limit=RateLimit.parse(AppConfig.RATE_LIMIT_LOGIN),
+            key=RateLimitKey.IP,
+            paths=("/auth/login", "/auth/login/access-token"),
+            methods=frozenset({"POST"}),
+        ),
+        # each signup costs a password hash and an email
+        RateLimitPolicy(
+            name="signup",
+            limit=RateLimit.parse(AppConfig.RATE_LIMIT_SIGNUP),
+            key=RateLimitKey.IP,
+            paths=("/auth/signup",),
+            methods=frozenset({"POST"}),
+        ),
+        RateLimitPolicy(
+            name="tasks",
+            limit=RateLimit.parse(AppConfig.RATE_LIMIT_TASKS),
+            key=RateLimitKey.USER,
+            paths=("/tasks/",),
+        ),
+    ]
+
+
+class RateLimiter(ABC):
+    """Base class for token bucket rate limiters"""
+
+    name: str
+
+    async def hit(self, key: str, limit: RateLimit) -> RateLimitResult:
+        """Take one token from the bucket of `key`"""
+        start_time = time.perf_counter()
+        try:
+            return await self._hit(key=key, limit=limit)
+        finally:
+            latency = time.perf_counter() - start_time
+            rate_limit_backend_latency_histogram.labels(backend=self.name).observe(
+                latency
+            )
+            record_timing("ratelimit", latency)
+
+    @abstractmethod
+    async def _hit(self, key: str, limit: RateLimit) -> RateLimitResult:
+        pass
+
+
+class MemoryRateLimiter(RateLimiter):
+    """
+    In-process rate limiter for single worker deployments.
+    Buckets are updated without awaiting so every update runs to completion on the event loop and no lock is needed
+    """
+
+    name = "memory"
+
+    def __init__(self, max_keys: int = 100_000) -> None:
+        self.max_keys = max_keys
+        # key -> (tokens, last update) in least recently used order
+        self.buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        register_cache("rate_limit_buckets", lambda: len(self.buckets))
+
+    async def _hit(self, key: str, limit: RateLimit) -> RateLimitResult:
+        now = time.monotonic()
+        tokens, updated_at = self.buckets.pop(key, (float(limit.capacity), now))
+        tokens = min(limit.capacity, tokens + (now - updated_at) * limit.rate)
+
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+
+        self.buckets[key] = (tokens, now)
+        # evicting the least recently used bucket only forgets a partially refilled bucket
+        if len(self.buckets) > self.max_keys:
+            self.buckets.popitem(last=False)
+
+        return RateLimitResult(
+            allowed=allowed,
+            remaining=int(tokens),
+            retry_after=0 if allowed else (1 - tokens) / limit.rate,
+        )
+
+
+class RedisRateLimiter(RateLimiter):
+    """Rate limiter shared by all workers. Each bucket is updated atomically by a server-side script"""
+
+    name = "redis"
+
+    # uses the redis clock so workers with skewed clocks agree on refills
+    script = """
+    local capacity = tonumber(ARGV[1])
+    local rate = tonumber(ARGV[2])
+    local time = redis.call("TIME")
+    local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+
+    local bucket = redis.call("HMGET", KEYS[1], "tokens", "updated_at")
+    local tokens = tonumber(bucket[1]) or capacity
+    local updated_at = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - updated_at) * rate)
+
+    local allowed = 0
+    local retry_after = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+        allowed = 1
+    else
+        retry_after = (1 - tokens) / rate
+    end
+
+    redis.call("HSET", KEYS[1], "tokens", tokens, "updated_at", now)
+    -- drop the bucket once it would have refilled completely
+    redis.call("PEXPIRE", KEYS[1], math.ceil(capacity / rate * 1000))
+    return {allowed, tostring(tokens), tostring(retry_after)}
+    """
+
+    def __init__(self) -> None:
+        self._script = redis_client.register_script(self.script)
+
+    async def _hit(self, key: str, limit: RateLimit) -> RateLimitResult:
+        allowed, tokens, retry_after = await self._script(
+            keys=[f"ratelimit:{key}"], args=[limit.capacity, limit.rate]
+        )
+        return RateLimitResult(
+            allowed=bool(allowed),
+            remaining=int(float(tokens)),
+            retry_after=float(retry_after),
+        )
+
+
+def create_rate_limiter() -> RateLimiter:
+    if AppConfig.RATE_LIMIT_BACKEND == "redis":
+        return RedisRateLimiter()
+    return MemoryRateLimiter()
+
+
+def format_retry_after(retry_after: float) -> str:
+    """Retry-After is given in whole seconds"""
+    return str(max(1, math.ceil(retry_after)))
@@ -0,0 +1,5 @@
+from redis.asyncio import Redis
+from src.core.config import AppConfig
+
+# shared client for application state kept in redis. connections are created lazily on first use
+redis_client: Redis = Redis.from_url(AppConfig.REDIS_URL or AppConfig.BROKER_URL)
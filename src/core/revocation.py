@@ -0,0 +1,265 @@
+import asyncio
+import hashlib
+import math
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta, timezone
+from uuid import UUID
+from fastapi.logger import logger
+from sqlmodel.ext.asyncio.session import AsyncSession
+from src.core.config import AppConfig
+from src.core.database import engine
+from src.core.redis import redis_client
+from src.core.timing import timed
+from src.models.user import TokenPayload
+from src.repositories import TokenRepository
+from src.utils.heap import register_cache
+
+
+class BloomFilter:
+    """
+    A fixed size probabilistic set. Membership checks never return false negatives,
+    and return false positives at roughly the configured error rate while the filter holds at most `capacity` keys
+    """
+
+    def __init__(self, capacity: int, error_rate: float) -> None:
+        self.capacity = capacity
+        self.size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str) -> list[int]:
+        # derive all bit positions from one digest with double hashing
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, key: str) -> None:
+        positions = self._positions(key)
+        # only count keys that are new to the filter
+        if all(self.bits[p >> 3] & (1 << (p & 7)) for p in positions):
+            return
+        for position in positions:
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(key)
+        )
+
+    def __len__(self) -> int:
+        return self.count
+
+
+def token_key(jti: str) -> str:
+    """Revocation key of a single token"""
+    return f"jti:{jti}"
+
+
+def version_key(user_id: UUID, version: int) -> str:
+    """Revocation key of all tokens issued to a user under a token version"""
+    return f"ver:{user_id}:{version}"
+
+
+def get_revocation_keys(payload: TokenPayload) -> list[str]:
+    keys = [version_key(payload.sub, payload.ver)]
+    if payload.jti:
+        keys.append(token_key(payload.jti))
+    return keys
+
+
+class RevocationStore(ABC):
+    """
+    Base class for revoked token stores.
+    Every lookup goes through an in-memory bloom filter first so tokens that were never revoked are accepted without any I/O.
+    Only filter hits are confirmed against the backing store
+    """
+
+    def __init__(self) -> None:
+        self.filter = self._new_filter()
+        self._task: asyncio.Task | None = None
+
+    def _new_filter(self) -> BloomFilter:
+        return BloomFilter(
+            capacity=AppConfig.REVOCATION_FILTER_CAPACITY,
+            error_rate=AppConfig.REVOCATION_FILTER_ERROR_RATE,
+        )
+
+    async def start(self) -> None:
+        """Load active revocations and keep the filter in sync with other workers"""
+        await self.rebuild()
+        self._task = asyncio.create_task(self._sync_forever())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def rebuild(self) -> None:
+        """Replace the filter with one holding only unexpired revocations"""
+        new_filter = self._new_filter()
+        for key in await self._load_active():
+            new_filter.add(key)
+        self.filter = new_filter
+
+    async def is_revoked(self, payload: TokenPayload) -> bool:
+        """Check if a token has been revoked"""
+        with timed("cache"):
+            candidates = [
+                key for key in get_revocation_keys(payload) if key in self.filter
+            ]
+            # common case. none of the keys was ever revoked
+            if not candidates:
+                return False
+
+            return await self._exists(candidates)
+
+    async def revoke(self, key: str, expires_at: datetime) -> None:
+        """Revoke a key until the tokens it covers expire"""
+        await self._persist(key=key, expires_at=expires_at)
+        self.filter.add(key)
+
+    async def revoke_token(self, payload: TokenPayload) -> None:
+        """Revoke a single token"""
+        if not payload.jti:
+            return
+        expires_at = payload.exp or datetime.now(timezone.utc) + timedelta(
+            hours=AppConfig.REFRESH_TOKEN_EXPIRE_HOURS
+        )
+        await self.revoke(key=token_key(payload.jti), expires_at=expires_at)
+
+    async def revoke_version(self, user_id: UUID, version: int) -> None:
+        """Revoke all tokens issued to a user under a token version"""
+        # no token of the version can outlive the longest token lifetime
+        expires_at = datetime.now(timezone.utc) + timedelta(
+            hours=AppConfig.REFRESH_TOKEN_EXPIRE_HOURS
+        )
+        await self.revoke(key=version_key(user_id, version), expires_at=expires_at)
+
+    async def _sync_forever(self) -> None:
+        while True:
+            await asyncio.sleep(AppConfig.REVOCATION_SYNC_INTERVAL_SECONDS)
+            try:
+                await self.sync()
+            except Exception:
+                logger.error("Failed to sync revoked tokens", exc_info=True)
+
+    async def sync(self) -> None:
+        """Pick up revocations made by other workers"""
+        # rebuild once the filter is over capacity to keep the false positive rate bounded
+        if len(self.filter) > self.filter.capacity:
+            await self.rebuild()
+
+    @abstractmethod
+    async def _persist(self, key: str, expires_at: datetime) -> None:
+        pass
+
+    @abstractmethod
+    async def _exists(self, keys: list[str]) -> bool:
+        pass
+
+    @abstractmethod
+    async def _load_active(self) -> list[str]:
+        pass
+
+
+class DatabaseRevocationStore(RevocationStore):
+    """Revocation store backed by the `revoked_tokens` table. Other workers pick up revocations on the next sync"""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._last_sync: datetime | None = None
+
+    async def _persist(self, key: str, expires_at: datetime) -> None:
+        async with AsyncSession(engine) as session:
+            await TokenRepository(session=session).create_revocation(
+                key=key, expires_at=expires_at
+            )
+
+    async def _exists(self, keys: list[str]) -> bool:
+        async with AsyncSession(engine) as session:
+            return await TokenRepository(session=session).has_revocation(keys=keys)
+
+    async def _load_active(self) -> list[str]:
+        self._last_sync = datetime.now(timezone.utc)
+        async with AsyncSession(engine) as session:
+            repository = TokenRepository(session=session)
+            await repository.delete_expired_revocations()
+            return await repository.get_revocations()
+
+    async def sync(self) -> None:
+        await super().sync()
+
+        # overlap the previous window so rows committed late are not missed. re-adding a key is harmless
+        now = datetime.now(timezone.utc)
+        since = (self._last_sync or now) - timedelta(
+            seconds=AppConfig.REVOCATION_SYNC_INTERVAL_SECONDS
+        )
+        async with AsyncSession(engine) as session:
+            keys = await TokenRepository(session=session).get_revocations(since=since)
+        for key in keys:
+            self.filter.add(key)
+        self._last_sync = now
+
+
+class RedisRevocationStore(RevocationStore):
+    """Revocation store backed by redis. Revocations are broadcast to other workers immediately"""
+
+    key_prefix = "revoked:"
+    channel = "revocations"
+
+    async def _persist(self, key: str, expires_at: datetime) -> None:
+        # let redis drop the key once the tokens it covers have expired
+        await redis_client.set(
+            f"{self.key_prefix}{key}", 1, exat=int(expires_at.timestamp())
+        )
+        await redis_client.publish(self.channel, key)
+
+    async def _exists(self, keys: list[str]) -> bool:
+        count = await redis_client.exists(*[f"{self.key_prefix}{key}" for key in keys])
+        return count > 0
+
+    async def _load_active(self) -> list[str]:
+        keys = []
+        async for key in redis_client.scan_iter(
+            match=f"{self.key_prefix}*", count=1000
+        ):
+            keys.append(key.decode().removeprefix(self.key_prefix))
+        return keys
+
+    async def _sync_forever(self) -> None:
+        while True:
+            try:
+                async with redis_client.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            self.filter.add(message["data"].decode())
+                            await self.sync()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.error("Revocation subscription failed", exc_info=True)
+                await asyncio.sleep(AppConfig.REVOCATION_SYNC_INTERVAL_SECONDS)
+                # catch up on anything published while disconnected
+                try:
+                    await self.rebuild()
+                except Exception:
+                    logger.error("Failed to reload revoked tokens", exc_info=True)
+
+
+def create_revocation_store() -> RevocationStore:
+    if AppConfig.REVOCATION_BACKEND == "redis":
+        return RedisRevocationStore()
+    return DatabaseRevocationStore()
+
+
+revocation_store = create_revocation_store()
+register_cache("revocation_filter", lambda: len(revocation_store.filter))
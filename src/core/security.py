@@ -2,11 +2,14 @@ import jwt
 import random
 import urllib.parse
 import hashlib
+import secrets
 import threading
 from datetime import datetime, timedelta, timezone
 from passlib.context import CryptContext
 from src.core.config import AppConfig
 from src.models.user import TokenPayload, GoogleOAuthTokenPayload, OAuthProvider
+from src.utils.heap import register_cache
+from src.core.timing import timed
 from fastapi.logger import logger
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -18,7 +21,8 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     Verify if the input plain password matches the saved hashed password
     """
     try:
-        return pwd_context.verify(secret=plain_password, hash=hashed_password)
+        with timed("hash"):
+            return pwd_context.verify(secret=plain_password, hash=hashed_password)
     except (ValueError, TypeError):
         return False
 
@@ -28,7 +32,8 @@ def create_password_hash(password: str) -> str:
     """
     Create a hash of the input password
     """
-    return pwd_context.hash(password)
+    with timed("hash"):
+        return pwd_context.hash(password)
 
 
 def create_access_token(data: TokenPayload) -> str:
@@ -36,7 +41,8 @@ def create_access_token(data: TokenPayload) -> str:
     Create an encoded access token
     """
     to_encode = data.model_dump()
-    to_encode.update({"sub": str(data.sub)})
+    # every token gets a unique id so it can be revoked on its own
+    to_encode.update({"sub": str(data.sub), "jti": secrets.token_hex(16)})
 
     # set expiry
     expire = datetime.now(timezone.utc) + timedelta(
@@ -55,7 +61,10 @@ def create_refresh_token(data: TokenPayload) -> tuple[str, datetime]:
     Create an encoded refresh token
     """
     to_encode = data.model_dump()
-    to_encode.update({"sub": str(data.sub)})
+    # mark as refresh token so it is never accepted as an access token
+    to_encode.update(
+        {"sub": str(data.sub), "jti": secrets.token_hex(16), "typ": "refresh"}
+    )
 
     # set expiry
     expire = datetime.now(timezone.utc) + timedelta(
@@ -89,12 +98,12 @@ def decode_token(token: str) -> TokenPayload | None:
             return None
 
         sub = payload.get("sub")
-        if not sub:
+        if not sub or payload.get("typ") == "refresh":
             return None
 
         token_data = TokenPayload(**payload)
     except Exception as e:
-        logger.warning("Fatal Error. Token verification failed: ", str(e))
+        logger.warning("Fatal Error. Token verification failed: %s", e)
         raise
 
     return token_data
@@ -118,17 +127,54 @@ def decode_refresh_token(token: str) -> TokenPayload | None:
             return None
 
         sub = payload.get("sub")
-        if not sub:
+        if not sub or payload.get("typ") != "refresh":
             return None
 
         token_data = TokenPayload(**payload)
     except Exception as e:
-        logger.warning("Fatal Error. Token verification failed: ", str(e))
+        logger.warning("Fatal Error. Token verification failed: %s", e)
         return None
 
     return token_data
 
 
+def hash_token(token: str) -> str:
+    """
+    Create a hash of a token for storage. Tokens are long random strings so a fast digest is sufficient
+    """
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def create_file_token(data: dict, expires_in: int) -> tuple[str, datetime]:
+    """
+    Create a token granting a single action on a stored file, such as uploading or downloading it
+    """
+    expire = datetime.now(timezone.utc) + timedelta(seconds=expires_in)
+    # marked as a file token so it is never accepted as an access token
+    to_encode = {**data, "typ": "file", "exp": expire}
+
+    encoded_jwt = jwt.encode(
+        payload=to_encode, key=AppConfig.JWT_SECRET, algorithm=AppConfig.JWT_ALGORITHM
+    )
+    return encoded_jwt, expire
+
+
+def decode_file_token(token: str, action: str) -> dict | None:
+    """
+    Decode a file token. Returns None unless the token is valid, unexpired and grants the given action
+    """
+    try:
+        payload = jwt.decode(
+            jwt=token, key=AppConfig.JWT_SECRET, algorithms=AppConfig.JWT_ALGORITHM
+        )
+    except jwt.exceptions.InvalidTokenError:
+        return None
+
+    if payload.get("typ") != "file" or payload.get("act") != action:
+        return None
+    return payload
+
+
 def generate_otp(length: int = 6) -> tuple[str, datetime]:
     """
     Generate a new otp token
@@ -152,6 +198,7 @@ def generate_otp(length: int = 6) -> tuple[str, datetime]:
 # external oauth
 # store all clients that have initiated the oauth flow with their ttl
 connected_oath_clients: dict[str, datetime] = {}
+register_cache("connected_oath_clients", lambda: len(connected_oath_clients))
 lock = threading.Lock()
 
 # async def cleanup_stale_client_states():
@@ -234,7 +281,7 @@ def decode_google_token(token: str):
             return None
 
     except Exception as e:
-        logger.warning("Fatal Error. Token verification failed: ", str(e))
+        logger.warning("Fatal Error. Token verification failed: %s", e)
         return None
 
     return GoogleOAuthTokenPayload(**payload)
@@ -0,0 +1,55 @@
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# phase -> [seconds spent, number of calls] for the current request. only set when the Server-Timing header is enabled
+request_timings: ContextVar[dict[str, list[float]] | None] = ContextVar(
+    "request_timings", default=None
+)
+
+# descriptions shown next to each phase in browser dev tools
+TIMING_DESCRIPTIONS = {
+    "db": "SQL queries",
+    "cache": "Cache lookups",
+    "ratelimit": "Rate limiter",
+    "hash": "Password hashing",
+    "serialize": "Response validation and serialization",
+    "app": "Total",
+}
+
+
+def record_timing(phase: str, seconds: float) -> None:
+    """Add time spent in a phase to the current request. Does nothing outside of a timed request"""
+    timings = request_timings.get()
+    if timings is None:
+        return
+
+    timing = timings.setdefault(phase, [0.0, 0])
+    timing[0] += seconds
+    timing[1] += 1
+
+
+@contextmanager
+def timed(phase: str) -> Iterator[None]:
+    """Time a block of code as part of a phase of the current request"""
+    if request_timings.get() is None:
+        yield
+        return
+
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_timing(phase, time.perf_counter() - start_time)
+
+
+def format_server_timing(timings: dict[str, list[float]]) -> str:
+    """Compose a Server-Timing header such as `db;dur=3.1;desc="SQL queries (2)"`"""
+    metrics = []
+    for phase, (seconds, count) in timings.items():
+        description = TIMING_DESCRIPTIONS.get(phase, phase)
+        if count > 1:
+            description = f"{description} ({count})"
+        metrics.append(f'{phase};dur={seconds * 1000:.2f};desc="{description}"')
+    return ", ".join(metrics)
@@ -0,0 +1,475 @@
+import functools
+import inspect
+import queue
+import random
+import re
+import secrets
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Any, Callable, TypeVar
+import httpx
+from fastapi.logger import logger
+from src.core.config import AppConfig
+
+T = TypeVar("T")
+
+
+class SpanKind(IntEnum):
+    """Span kinds with their OTLP values"""
+
+    INTERNAL = 1
+    SERVER = 2
+    CLIENT = 3
+
+
+@dataclass(frozen=True)
+class SpanContext:
+    """The identity of a span that is propagated to child spans and other services"""
+
+    trace_id: str
+    span_id: str
+    sampled: bool = True
+
+
+@dataclass
+class Span:
+    name: str
+    context: SpanContext
+    parent_id: str | None = None
+    kind: SpanKind = SpanKind.INTERNAL
+    start_time: int = field(default_factory=time.time_ns)
+    end_time: int | None = None
+    attributes: dict[str, Any] = field(default_factory=dict)
+    error: str | None = None
+
+    @property
+    def trace_id(self) -> str:
+        return self.context.trace_id
+
+    @property
+    def span_id(self) -> str:
+        return self.context.span_id
+
+    @property
+    def duration(self) -> float:
+        """Duration of an ended span in seconds"""
+        return ((self.end_time or time.time_ns()) - self.start_time) / 1e9
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def record_exception(self, exc: BaseException) -> None:
+        self.error = f"{type(exc).__name__}: {exc}"
+
+
+# the span of the code currently executing. asyncio tasks and worker threads each get their own copy
+current_span: ContextVar[Span | None] = ContextVar("current_span", default=None)
+
+# https://www.w3.org/TR/trace-context/#traceparent-header
+TRACEPARENT_PATTERN = re.compile(
+    r"^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$"
+)
+
+
+def parse_traceparent(value: str | None) -> SpanContext | None:
+    """Parse a W3C `traceparent` header. Invalid headers are ignored"""
+    if not value:
+        return None
+
+    match = TRACEPARENT_PATTERN.match(value.strip().lower())
+    if not match:
+        return None
+
+    version, trace_id, span_id, flags = match.groups()
+    if version == "ff" or trace_id == "0" * 32 or span_id == "0" * 16:
+        return None
+
+    return SpanContext(
+        trace_id=trace_id, span_id=span_id, sampled=bool(int(flags, 16) & 1)
+    )
+
+
+def format_traceparent(context: SpanContext) -> str:
+    """Compose a W3C `traceparent` header for a span"""
+    return (
+        f"00-{context.trace_id}-{context.span_id}-{'01' if context.sampled else '00'}"
+    )
+
+
+class SpanExporter(ABC):
+    """Base class for sending finished spans to a backend"""
+
+    @abstractmethod
+    def export(self, spans: list[Span]) -> None:
+        pass
+
+    def shutdown(self) -> None:
+        pass
+
+
+class InMemorySpanExporter(SpanExporter):
+    """Keeps finished spans in memory so tests can assert on them"""
+
+    def __init__(self) -> None:
+        self.spans: list[Span] = []
+        self._lock = threading.Lock()
+
+    def export(self, spans: list[Span]) -> None:
+        with self._lock:
+            self.spans.extend(spans)
+
+    def get_finished_spans(self) -> list[Span]:
+        with self._lock:
+            return list(self.spans)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.spans.clear()
+
+    def get_span_tree(self) -> list[dict[str, Any]]:
+        """
+        Nest finished spans under their parents, e.g.
+        `[{"name": "GET /items", "children": [{"name": "route /items/", "children": [...]}]}]`
+        """
+        spans = sorted(self.get_finished_spans(), key=lambda span: span.start_time)
+        nodes = {
+            span.span_id: {"name": span.name, "span": span, "children": []}
+            for span in spans
+        }
+
+        roots = []
+        for span in spans:
+            parent = nodes.get(span.parent_id) if span.parent_id else None
+            if parent:
+                parent["children"].append(nodes[span.span_id])
+            else:
+                roots.append(nodes[span.span_id])
+        return roots
+
+
+class OTLPSpanExporter(SpanExporter):
+    """Sends spans to an OpenTelemetry collector with the OTLP/HTTP JSON protocol"""
+
+    def __init__(self, endpoint: str, service_name: str, timeout: float = 10) -> None:
+        self.url = f"{endpoint.rstrip('/')}/v1/traces"
+        self.service_name = service_name
+        self.client = httpx.Client(timeout=timeout)
+
+    def export(self, spans: list[Span]) -> None:
+        response = self.client.post(self.url, json=self._encode(spans))
+        response.raise_for_status()
+
+    def shutdown(self) -> None:
+        self.client.close()
+
+    def _encode(self, spans: list[Span]) -> dict[str, Any]:
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": self._encode_attributes(
+                            {"service.name": self.service_name}
+                        )
+                    },
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": __name__},
+                            "spans": [self._encode_span(span) for span in spans],
+                        }
+                    ],
+                }
+            ]
+        }
+
+    def _encode_span(self, span: Span) -> dict[str, Any]:
+        encoded = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": int(span.kind),
+            "startTimeUnixNano": str(span.start_time),
+            "endTimeUnixNano": str(span.end_time or span.start_time),
+            "attributes": self._encode_attributes(span.attributes),
+            # status code 0 is unset and 2 is error
+            "status": {"code": 2, "message": span.error} if span.error else {"code": 0},
+        }
+        if span.parent_id:
+            encoded["parentSpanId"] = span.parent_id
+        return encoded
+
+    def _encode_attributes(self, attributes: dict[str, Any]) -> list[dict[str, Any]]:
+        encoded = []
+        for key, value in attributes.items():
+            if isinstance(value, bool):
+                encoded_value = {"boolValue": value}
+            elif isinstance(value, int):
+                encoded_value = {"intValue": str(value)}
+            elif isinstance(value, float):
+                encoded_value = {"doubleValue": value}
+            else:
+                encoded_value = {"stringValue": str(value)}
+            encoded.append({"key": key, "value": encoded_value})
+        return encoded
+
+
+class SpanProcessor(ABC):
+    """Base class for handing finished spans to an exporter"""
+
+    def __init__(self, exporter: SpanExporter) -> None:
+        self.exporter = exporter
+
+    def start(self) -> None:
+        pass
+
+    @abstractmethod
+    def on_end(self, span: Span) -> None:
+        pass
+
+    def shutdown(self) -> None:
+        self.exporter.shutdown()
+
+
+class SimpleSpanProcessor(SpanProcessor):
+    """Exports every span as soon as it ends. Meant for the in-memory exporter"""
+
+    def on_end(self, span: Span) -> None:
+        self.exporter.export([span])
+
+
+class BatchSpanProcessor(SpanProcessor):
+    """
+    Exports spans in batches from a background thread so requests never wait on the exporter.
+    Spans are dropped instead of blocking when the queue is full
+    """
+
+    def __init__(
+        self,
+        exporter: SpanExporter,
+        max_queue_size: int = 2048,
+        max_batch_size: int = 512,
+        schedule_delay: float = 5.0,
+    ) -> None:
+        super().__init__(exporter)
+        self.queue: queue.Queue[Span | None] = queue.Queue(maxsize=max_queue_size)
+        self.max_batch_size = max_batch_size
+        self.schedule_delay = schedule_delay
+        self.dropped_spans = 0
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="span-exporter", daemon=True
+            )
+            self._thread.start()
+
+    def on_end(self, span: Span) -> None:
+        try:
+            self.queue.put_nowait(span)
+        except queue.Full:
+            self.dropped_spans += 1
+
+    def shutdown(self) -> None:
+        if self._thread is not None:
+            # wake the worker up to flush what is left
+            self.queue.put(None)
+            self._thread.join(timeout=self.schedule_delay)
+            self._thread = None
+        super().shutdown()
+
+    def _run(self) -> None:
+        while True:
+            batch: list[Span] = []
+            deadline = time.monotonic() + self.schedule_delay
+            stopping = False
+
+            while len(batch) < self.max_batch_size:
+                try:
+                    span = self.queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if span is None:
+                    stopping = True
+                    break
+                batch.append(span)
+
+            if batch:
+                try:
+                    self.exporter.export(batch)
+                except Exception:
+                    logger.warning(
+                        "Failed to export %d spans", len(batch), exc_info=True
+                    )
+
+            if stopping:
+                return
+
+
+class Tracer:
+    """Creates spans and propagates them through `contextvars`"""
+
+    def __init__(self, processor: SpanProcessor | None, sample_rate: float = 1.0):
+        self.processor = processor
+        self.sample_rate = sample_rate
+
+    @property
+    def enabled(self) -> bool:
+        return self.processor is not None
+
+    def start(self) -> None:
+        if self.processor:
+            self.processor.start()
+
+    def shutdown(self) -> None:
+        if self.processor:
+            self.processor.shutdown()
+
+    def start_span(
+        self,
+        name: str,
+        kind: SpanKind = SpanKind.INTERNAL,
+        attributes: dict[str, Any] | None = None,
+        parent: SpanContext | None = None,
+        start_time: int | None = None,
+    ) -> Span | None:
+        """
+        Create a span that is not made current. Children of the current span share its trace,
+        otherwise `parent` continues a remote trace or a new trace is sampled
+        """
+        if not self.enabled:
+            return None
+
+        local_parent = current_span.get()
+        if parent is None and local_parent is not None:
+            parent = local_parent.context
+
+        if parent is not None:
+            trace_id, sampled = parent.trace_id, parent.sampled
+        else:
+            trace_id, sampled = (
+                secrets.token_hex(16),
+                random.random() < self.sample_rate,
+            )
+
+        return Span(
+            name=name,
+            context=SpanContext(
+                trace_id=trace_id, span_id=secrets.token_hex(8), sampled=sampled
+            ),
+            parent_id=parent.span_id if parent else None,
+            kind=kind,
+            start_time=start_time or time.time_ns(),
+            attributes=attributes or {},
+        )
+
+    def end_span(self, span: Span | None, end_time: int | None = None) -> None:
+        if span is None:
+            return
+
+        span.end_time = end_time or time.time_ns()
+        # unsampled spans still propagate their context but are never exported
+        if self.processor and span.context.sampled:
+            self.processor.on_end(span)
+
+    @contextmanager
+    def span(
+        self,
+        name: str,
+        kind: SpanKind = SpanKind.INTERNAL,
+        attributes: dict[str, Any] | None = None,
+        parent: SpanContext | None = None,
+    ) -> Iterator[Span | None]:
+        """Run a block of code in a new current span"""
+        span = self.start_span(name, kind=kind, attributes=attributes, parent=parent)
+        if span is None:
+            yield None
+            return
+
+        token = current_span.set(span)
+        try:
+            yield span
+        except BaseException as exc:
+            span.record_exception(exc)
+            raise
+        finally:
+            current_span.reset(token)
+            self.end_span(span)
+
+    def record_span(
+        self, name: str, start_time: int, end_time: int, kind=SpanKind.INTERNAL
+    ) -> None:
+        """Record an already finished phase as a child of the current span"""
+        self.end_span(
+            self.start_span(name, kind=kind, start_time=start_time), end_time=end_time
+        )
+
+
+def traced(target: T) -> T:
+    """
+    Run a function in its own span named after it. Decorating a class traces all of its public methods,
+    e.g. `ItemService.get_all_items`. Calls made outside of a trace, such as background jobs, are not recorded.
+    Async generators are left as they are since they run after the call returns, usually once the response is streaming
+    """
+    if isinstance(target, type):
+        for attr, value in list(vars(target).items()):
+            if (
+                not attr.startswith("_")
+                and inspect.isfunction(value)
+                and not inspect.isasyncgenfunction(value)
+            ):
+                setattr(
+                    target,
+                    attr,
+                    _trace_function(value, f"{target.__name__}.{value.__name__}"),
+                )
+        return target
+
+    return _trace_function(target, target.__qualname__)  # type: ignore
+
+
+def _trace_function(func: Callable, name: str) -> Callable:
+    if inspect.iscoroutinefunction(func):
+
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            if current_span.get() is None:
+                return await func(*args, **kwargs)
+            with tracer.span(name):
+                return await func(*args, **kwargs)
+
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if current_span.get() is None:
+            return func(*args, **kwargs)
+        with tracer.span(name):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def create_span_processor() -> SpanProcessor | None:
+    if not AppConfig.TRACING_ENABLED:
+        return None
+
+    if AppConfig.TRACING_EXPORTER == "memory":
+        return SimpleSpanProcessor(InMemorySpanExporter())
+
+    return BatchSpanProcessor(
+        OTLPSpanExporter(
+            endpoint=AppConfig.TRACING_OTLP_ENDPOINT,
+            service_name=AppConfig.TRACING_SERVICE_NAME,
+        )
+    )
+
+
+tracer = Tracer(
+    processor=create_span_processor(), sample_rate=AppConfig.TRACING_SAMPLE_RATE
+)
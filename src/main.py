@@ -3,24 +3,59 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.logger import logger
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse
 from contextlib import asynccontextmanager
 from prometheus_client import make_asgi_app
 
 from src.core.config import AppConfig
 from src.core.database import init_db
+from src.core.logging import configure_logging, shutdown_logging
+from src.core.loop_monitor import loop_monitor
+from src.core.redis import redis_client
+from src.core.revocation import revocation_store
+from src.core.tracing import tracer
 from src.api.main import api_router
-from src.api.middleware import ExceptionHandlerMiddleware, MonitoringMiddleware
+from src.services import UploadCleaner, create_storage_service
+from src.api.middleware import (
+    CompressionMiddleware,
+    ExceptionHandlerMiddleware,
+    MonitoringMiddleware,
+    RateLimitMiddleware,
+    RequestIdMiddleware,
+    ServerTimingMiddleware,
+    TracingMiddleware,
+    UploadSizeLimitMiddleware,
+)
+
+# send logs through a background writer before anything else logs
+configure_logging()
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    tracer.start()
     await init_db()
+    await revocation_store.start()
+    # storage clients and their connection pools are shared by every request
+    app.state.storage_service = create_storage_service()
+    app.state.upload_cleaner = UploadCleaner(storage_service=app.state.storage_service)
+    await app.state.upload_cleaner.start()
+    if AppConfig.LOOP_MONITOR_ENABLED:
+        await loop_monitor.start()
     yield
+    await loop_monitor.stop()
+    await app.state.upload_cleaner.stop()
+    await app.state.storage_service.close()
+    await revocation_store.stop()
+    await redis_client.aclose()
+    # flush spans still waiting to be exported
+    tracer.shutdown()
+    shutdown_logging()
 
 
 app = FastAPI(
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
     title=AppConfig.PROJECT_TITLE,
     summary=AppConfig.PROJECT_DESCRIPTION,
     version=AppConfig.PROJECT_VERSION,
@@ -40,6 +75,12 @@ if AppConfig.IS_DEVELOPMENT:
     # alias the path name as /public
     app.mount("/public", StaticFiles(directory=AppConfig.LOCAL_STORAGE_PATH), "uploads")
 
+# uploads are limited innermost so requests are counted by the rate limiter before their bodies are read
+app.add_middleware(UploadSizeLimitMiddleware)
+# rate limiting sits inside the cors middleware so rejected requests still carry cors headers
+if AppConfig.RATE_LIMIT_ENABLED:
+    app.add_middleware(RateLimitMiddleware)
+
 # declare cors middleware
 app.add_middleware(
     CORSMiddleware,
@@ -54,7 +95,17 @@ app.add_middleware(
 
 # error middleware is placed first since FastAPI loads middlewares in a sequential order unto a stack for further processing
 app.add_middleware(ExceptionHandlerMiddleware)
+# compression sits inside monitoring so response sizes are recorded as sent over the wire
+if AppConfig.COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware)
 app.add_middleware(MonitoringMiddleware)
+# tracing wraps every other middleware so the server span covers the whole request
+app.add_middleware(TracingMiddleware)
+# timing wraps the rate limiter and tracing so their overhead is included in the breakdown
+if AppConfig.SERVER_TIMING_ENABLED:
+    app.add_middleware(ServerTimingMiddleware)
+# request ids are assigned first so every log of a request carries its id
+app.add_middleware(RequestIdMiddleware)
 
 
 # exception handlers
@@ -0,0 +1,52 @@
+"""add stored files
+
+Revision ID: c4e8b2a7f915
+Revises: a3f1c9d2e4b7
+Create Date: 2026-10-19 14:03:51.482916
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision: str = "c4e8b2a7f915"
+down_revision: Union[str, None] = "a3f1c9d2e4b7"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "stored_files",
+        sa.Column("id", sa.Uuid(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.Column(
+            "sha256", sqlmodel.sql.sqltypes.AutoString(length=64), nullable=False
+        ),
+        sa.Column("path", sqlmodel.sql.sqltypes.AutoString(length=255), nullable=False),
+        sa.Column("size", sa.Integer(), nullable=False),
+        sa.Column(
+            "content_type", sqlmodel.sql.sqltypes.AutoString(length=255), nullable=True
+        ),
+        sa.Column("ref_count", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_stored_files_id"), "stored_files", ["id"], unique=False)
+    op.create_index(op.f("ix_stored_files_path"), "stored_files", ["path"], unique=True)
+    op.create_index(
+        op.f("ix_stored_files_sha256"), "stored_files", ["sha256"], unique=True
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_stored_files_sha256"), table_name="stored_files")
+    op.drop_index(op.f("ix_stored_files_path"), table_name="stored_files")
+    op.drop_index(op.f("ix_stored_files_id"), table_name="stored_files")
+    op.drop_table("stored_files")
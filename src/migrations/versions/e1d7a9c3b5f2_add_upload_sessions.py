@@ -0,0 +1,69 @@
+"""add upload sessions
+
+Revision ID: e1d7a9c3b5f2
+Revises: c4e8b2a7f915
+Create Date: 2026-10-19 16:21:07.635402
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision: str = "e1d7a9c3b5f2"
+down_revision: Union[str, None] = "c4e8b2a7f915"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # resumable uploads can be larger than a 32 bit integer holds
+    with op.batch_alter_table("stored_files") as batch_op:
+        batch_op.alter_column("size", existing_type=sa.Integer(), type_=sa.BigInteger())
+
+    op.create_table(
+        "upload_sessions",
+        sa.Column("id", sa.Uuid(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.Column("path", sqlmodel.sql.sqltypes.AutoString(length=255), nullable=False),
+        sa.Column(
+            "content_type", sqlmodel.sql.sqltypes.AutoString(length=255), nullable=True
+        ),
+        sa.Column("size", sa.BigInteger(), nullable=False),
+        sa.Column(
+            "sha256", sqlmodel.sql.sqltypes.AutoString(length=64), nullable=False
+        ),
+        sa.Column("offset", sa.BigInteger(), nullable=False),
+        sa.Column(
+            "storage_upload_id",
+            sqlmodel.sql.sqltypes.AutoString(length=1024),
+            nullable=True,
+        ),
+        sa.Column("expires_at", sa.DateTime(), nullable=False),
+        sa.Column("locked_until", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        op.f("ix_upload_sessions_expires_at"),
+        "upload_sessions",
+        ["expires_at"],
+        unique=False,
+    )
+    op.create_index(
+        op.f("ix_upload_sessions_id"), "upload_sessions", ["id"], unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_upload_sessions_id"), table_name="upload_sessions")
+    op.drop_index(op.f("ix_upload_sessions_expires_at"), table_name="upload_sessions")
+    op.drop_table("upload_sessions")
+
+    with op.batch_alter_table("stored_files") as batch_op:
+        batch_op.alter_column("size", existing_type=sa.BigInteger(), type_=sa.Integer())
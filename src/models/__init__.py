@@ -7,6 +7,8 @@ from pydantic import ConfigDict
 # all tables created in the application should be imported here to allow alembic to pick it up easily when using revision autogenerate
 from .user import User as User
 from .item import Item as Item
+from .token import RefreshToken as RefreshToken, RevokedToken as RevokedToken
+from .file import StoredFile as StoredFile
 
 
 # Generic message for all API responses
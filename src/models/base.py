@@ -1,4 +1,5 @@
 import uuid
+from enum import StrEnum
 from sqlmodel import SQLModel, Field
 from datetime import datetime, timezone, date
 from pydantic.alias_generators import to_camel
@@ -34,3 +35,8 @@ class BaseSearch(SQLModel):
         alias_generator=to_camel,
         populate_by_name=True,
     )
+
+
+class ExportFormat(StrEnum):
+    NDJSON = "ndjson"
+    CSV = "csv"
@@ -0,0 +1,126 @@
+from datetime import datetime
+from enum import StrEnum
+from sqlmodel import Field, SQLModel
+from pydantic.alias_generators import to_camel
+from pydantic import ConfigDict
+
+
+class ProfileFormat(StrEnum):
+    COLLAPSED = "collapsed"
+    SPEEDSCOPE = "speedscope"
+
+
+class HeapGroupBy(StrEnum):
+    FILENAME = "filename"
+    LINENO = "lineno"
+
+
+class HeapSnapshotCreate(SQLModel):
+    name: str = Field(
+        title="Name",
+        description="Name of the snapshot. Taking a snapshot with an existing name replaces it",
+        min_length=1,
+        max_length=64,
+    )
+
+    model_config = ConfigDict(  # type: ignore
+        alias_generator=to_camel,
+        populate_by_name=True,
+    )
+
+
+class HeapSnapshot(HeapSnapshotCreate):
+    created_at: datetime = Field(
+        title="Created At", description="When the snapshot was taken"
+    )
+    size: int = Field(
+        title="Size", description="Total size of traced allocations in bytes"
+    )
+
+
+class HeapStatus(SQLModel):
+    tracing: bool = Field(
+        title="Tracing", description="Whether allocations are being traced"
+    )
+    current_size: int = Field(
+        title="Current Size", description="Size of traced allocations in bytes"
+    )
+    peak_size: int = Field(
+        title="Peak Size",
+        description="Peak size of traced allocations since tracing started in bytes",
+    )
+    snapshots: list[HeapSnapshot]
+
+    model_config = ConfigDict(  # type: ignore
+        alias_generator=to_camel,
+        populate_by_name=True,
+    )
+
+
+class AllocationDiff(SQLModel):
+    location: str = Field(
+        title="Location", description="The file, or file and line, allocating memory"
+    )
+    size: int = Field(title="Size", description="Allocated bytes in the target")
+    size_diff: int = Field(
+        title="Size Diff", description="Change in allocated bytes since the base"
+    )
+    count: int = Field(title="Count", description="Allocated blocks in the target")
+    count_diff: int = Field(
+        title="Count Diff", description="Change in allocated blocks since the base"
+    )
+
+    model_config = ConfigDict(  # type: ignore
+        alias_generator=to_camel,
+        populate_by_name=True,
+    )
+
+
+class HeapDiff(SQLModel):
+    base: str
+    target: str | None = Field(
+        default=None,
+        title="Target",
+        description="The snapshot compared against the base. Empty when compared against the current heap",
+    )
+    group_by: HeapGroupBy
+    allocations: list[AllocationDiff]
+
+    model_config = ConfigDict(  # type: ignore
+        alias_generator=to_camel,
+        populate_by_name=True,
+    )
+
+
+class HeapObjects(SQLModel):
+    models: dict[str, int] = Field(
+        title="Models", description="Live SQLModel instances per class"
+    )
+    caches: dict[str, int] = Field(
+        title="Caches", description="Number of entries in each registered cache"
+    )
+
+    model_config = ConfigDict(  # type: ignore
+        alias_generator=to_camel,
+        populate_by_name=True,
+    )
+
+
+class HeapStatusResponse(SQLModel):
+    message: str
+    data: HeapStatus
+
+
+class HeapSnapshotResponse(SQLModel):
+    message: str
+    data: HeapSnapshot
+
+
+class HeapDiffResponse(SQLModel):
+    message: str
+    data: HeapDiff
+
+
+class HeapObjectsResponse(SQLModel):
+    message: str
+    data: HeapObjects
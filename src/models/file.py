@@ -1,10 +1,53 @@
+import uuid
+from datetime import datetime
+from enum import StrEnum
+from sqlalchemy import BigInteger
 from sqlmodel import Field, SQLModel
 from pydantic.alias_generators import to_camel
 from pydantic import ConfigDict
 
+from src.models.base import Base
+
+
+# Database model for content addressed files. a file is shared by every upload of the same contents and removed once nothing references it
+class StoredFile(Base, table=True):
+    __tablename__ = "stored_files"  # type: ignore
+
+    sha256: str = Field(unique=True, index=True, max_length=64)
+    path: str = Field(unique=True, index=True, max_length=255)
+    size: int = Field(nullable=False, sa_type=BigInteger)
+    content_type: str | None = Field(default=None, max_length=255)
+    ref_count: int = Field(default=1, nullable=False)
+
+
+# Database model for resumable uploads. the received bytes are kept by the storage backend until the upload is completed
+class UploadSession(Base, table=True):
+    __tablename__ = "upload_sessions"  # type: ignore
+
+    path: str = Field(max_length=255)
+    content_type: str | None = Field(default=None, max_length=255)
+    size: int = Field(nullable=False, sa_type=BigInteger)
+    sha256: str = Field(max_length=64)
+    # number of bytes received so far
+    offset: int = Field(default=0, nullable=False, sa_type=BigInteger)
+    # id of the s3 multipart upload holding the received parts
+    storage_upload_id: str | None = Field(default=None, max_length=1024)
+    expires_at: datetime = Field(nullable=False, index=True)
+    # set while a chunk is being received so chunks are never appended concurrently
+    locked_until: datetime | None = Field(default=None)
+
 
 class FilePublic(SQLModel):
     path: str = Field(title="Path", description="The file path")
+    size: int = Field(title="Size", description="The file size in bytes")
+    sha256: str = Field(
+        title="SHA-256", description="Hex encoded SHA-256 digest of the file contents"
+    )
+    variants_task_id: str | None = Field(
+        default=None,
+        title="Variants Task ID",
+        description="ID of the task generating image variants of the file, whose progress is reported by the task status endpoint",
+    )
 
     model_config = ConfigDict(  # type: ignore
         alias_generator=to_camel,
@@ -20,3 +63,188 @@ class FilePublicResponse(SQLModel):
         alias_generator=to_camel,
         populate_by_name=True,
     )
+
+
+class FileBatchDelete(SQLModel):
+    paths: list[str] = Field(
+        title="Paths",
+        description="Paths of the files to delete",
+        min_length=1,
+    )
+
+    model_config = ConfigDict(  # type: ignore
+        alias_generator=to_camel,
+        populate_by_name=True,
+    )
+
+
+class FileDeleteResult(SQLModel):
+    path: str = Field(title="Path", description="The file path")
+    deleted: bool = Field(
+        title="Deleted",
+        description="Whether the file was deleted. S3 storage does not report missing files, so they count as deleted there",
+    )
+
+    model_config = ConfigDict(  # type: ignore
+        alias_generator=to_camel,
+        populate_by_name=True,
+    )
+
+
+class FileBatchDeletePublic(SQLModel):
+    deleted: int = Field(
+        title="Deleted",
+        description="Number of files deleted. Includes missing files on S3 storage",
+    )
+    results: list[FileDeleteResult] = Field(
+        title="Results", description="Outcome for each requested path"
+    )
+
+    model_config = ConfigDict(  # type: ignore
+        alias_generator=to_camel,
+        populate_by_name=True,
+    )
+
+
+class FileBatchDeleteResponse(SQLModel):
+    message: str
+    data: FileBatchDeletePublic
+
+
+class PresignedUploadMethod(StrEnum):
+    PUT = "PUT"
+    POST = "POST"
+
+
+# Properties to receive when requesting a presigned upload
+class PresignedUploadCreate(SQLModel):
+    filename: str | None = Field(
+        default=None,
+        title="Filename",
+        description="Name of the file, used for its extension",
+        max_length=255,
+    )
+    content_type: str = Field(
+        title="Content Type",
+        description="Media type the file is uploaded with",
+        min_length=1,
+        max_length=255,
+    )
+    size: int = Field(title="Size", description="The file size in bytes", gt=0)
+    sha256: str = Field(
+        title="SHA-256",
+        description="Hex encoded SHA-256 digest of the file contents, checked by storage on upload",
+        regex=r"^[0-9a-f]{64}$",
+    )
+    method: PresignedUploadMethod = Field(
+        default=PresignedUploadMethod.PUT,
+        title="Method",
+        description="PUT to send the raw contents or POST to send a multipart form",
+    )
+
+    model_config = ConfigDict(  # type: ignore
+        alias_generator=to_camel,
+        populate_by_name=True,
+    )
+
+
+class PresignedUpload(SQLModel):
+    path: str = Field(title="Path", description="Path the file is stored at")
+    url: str = Field(title="URL", description="URL to upload the file to")
+    method: PresignedUploadMethod = Field(
+        title="Method", description="HTTP method of the upload request"
+    )
+    headers: dict[str, str] = Field(
+        title="Headers", description="Headers to send with the upload request"
+    )
+    fields: dict[str, str] = Field(
+        title="Fields",
+        description="Form fields to send before the file, which is sent in the `file` field of POST uploads",
+    )
+    expires_at: datetime = Field(
+        title="Expires At", description="Date and time the upload url expires"
+    )
+    token: str = Field(
+        title="Token", description="Token to confirm the upload with once it is done"
+    )
+
+    model_config = ConfigDict(  # type: ignore
+        alias_generator=to_camel,
+        populate_by_name=True,
+    )
+
+
+class PresignedUploadResponse(SQLModel):
+    message: str
+    data: PresignedUpload
+
+
+# Properties to receive when confirming a presigned upload
+class PresignedUploadComplete(SQLModel):
+    token: str = Field(
+        title="Token", description="Token issued with the presigned upload"
+    )
+
+
+class PresignedDownload(SQLModel):
+    url: str = Field(title="URL", description="URL to download the file from")
+    expires_at: datetime = Field(
+        title="Expires At", description="Date and time the download url expires"
+    )
+
+    model_config = ConfigDict(  # type: ignore
+        alias_generator=to_camel,
+        populate_by_name=True,
+    )
+
+
+class PresignedDownloadResponse(SQLModel):
+    message: str
+    data: PresignedDownload
+
+
+# Properties to receive when starting a resumable upload
+class UploadSessionCreate(SQLModel):
+    filename: str | None = Field(
+        default=None,
+        title="Filename",
+        description="Name of the file, used for its extension",
+        max_length=255,
+    )
+    content_type: str = Field(
+        title="Content Type",
+        description="Media type of the file",
+        min_length=1,
+        max_length=255,
+    )
+    size: int = Field(title="Size", description="The file size in bytes", gt=0)
+    sha256: str = Field(
+        title="SHA-256",
+        description="Hex encoded SHA-256 digest of the file contents, checked once the upload is completed",
+        regex=r"^[0-9a-f]{64}$",
+    )
+
+    model_config = ConfigDict(  # type: ignore
+        alias_generator=to_camel,
+        populate_by_name=True,
+    )
+
+
+class UploadSessionPublic(SQLModel):
+    id: uuid.UUID = Field(title="ID", description="ID of the upload")
+    size: int = Field(title="Size", description="The file size in bytes")
+    offset: int = Field(title="Offset", description="Number of bytes received so far")
+    expires_at: datetime = Field(
+        title="Expires At",
+        description="Date and time the upload expires unless another chunk is received",
+    )
+
+    model_config = ConfigDict(  # type: ignore
+        alias_generator=to_camel,
+        populate_by_name=True,
+    )
+
+
+class UploadSessionPublicResponse(SQLModel):
+    message: str
+    data: UploadSessionPublic
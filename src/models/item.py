@@ -1,4 +1,5 @@
 import uuid
+from typing import Any
 
 from sqlmodel import Field, Relationship, SQLModel
 from pydantic.alias_generators import to_camel
@@ -93,6 +94,12 @@ class ItemsPublic(SQLModel):
     count: int
 
 
+# list of items limited to the requested fields, keyed by their public names
+class ItemsPartialPublic(SQLModel):
+    data: list[dict[str, Any]]
+    count: int
+
+
 class ItemPublicResponse(SQLModel):
     message: str
     data: ItemPublic
@@ -100,3 +107,7 @@ class ItemPublicResponse(SQLModel):
 
 class ItemsPublicResponse(ItemsPublic):
     message: str
+
+
+class ItemsPartialPublicResponse(ItemsPartialPublic):
+    message: str
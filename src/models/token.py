@@ -0,0 +1,32 @@
+import uuid
+
+from sqlmodel import Field, SQLModel
+from datetime import datetime, timezone
+
+from src.models.base import Base
+
+
+# Database model for issued refresh tokens. only the token hash is stored
+class RefreshToken(Base, table=True):
+    __tablename__ = "refresh_tokens"  # type: ignore
+
+    user_id: uuid.UUID = Field(
+        foreign_key="users.id", nullable=False, ondelete="CASCADE", index=True
+    )
+    token_hash: str = Field(unique=True, index=True, max_length=64)
+    expires_at: datetime = Field(nullable=False)
+    # set once the token has been rotated or revoked
+    revoked_at: datetime | None = Field(default=None)
+
+
+# Database model for revoked token keys. keys are either `jti:<jti>` for single tokens or `ver:<user_id>:<version>` for all tokens of a user version
+class RevokedToken(SQLModel, table=True):
+    __tablename__ = "revoked_tokens"  # type: ignore
+
+    key: str = Field(primary_key=True, max_length=255)
+    expires_at: datetime = Field(nullable=False, index=True)
+    created_at: datetime = Field(
+        default_factory=lambda: datetime.now(tz=timezone.utc),
+        nullable=False,
+        index=True,
+    )
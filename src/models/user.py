@@ -4,7 +4,7 @@ from pydantic import EmailStr
 from sqlmodel import Field, Relationship, SQLModel
 from pydantic.alias_generators import to_camel
 from pydantic import ConfigDict
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Any
 from src.models.base import Base, BaseSearch
 from enum import StrEnum
 from datetime import datetime
@@ -59,6 +59,8 @@ class User(Base, UserBase, table=True):
     __tablename__ = "users"  # type: ignore
 
     password: str
+    # incremented to invalidate every token issued to the user
+    token_version: int = Field(default=0, nullable=False)
 
     # relationship
     items: list["Item"] = Relationship(back_populates="user", cascade_delete=True)
@@ -207,6 +209,12 @@ class UsersPublic(SQLModel):
     count: int
 
 
+# list of users limited to the requested fields, keyed by their public names
+class UsersPartialPublic(SQLModel):
+    data: list[dict[str, Any]]
+    count: int
+
+
 # response models
 class UserPublicResponse(SQLModel):
     message: str
@@ -217,6 +225,10 @@ class UsersPublicResponse(UsersPublic):
     message: str
 
 
+class UsersPartialPublicResponse(UsersPartialPublic):
+    message: str
+
+
 class OAuthInitResponse(SQLModel):
     url: str
 
@@ -242,6 +254,9 @@ class TokenRefreshResponse(Token):
 class TokenPayload(SQLModel):
     sub: uuid.UUID
     role: str
+    jti: str | None = None  # unique token id
+    ver: int = 0  # token version of the user at the time of issue
+    exp: datetime | None = None
 
 
 class NewPassword(SQLModel):
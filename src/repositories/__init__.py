@@ -1,2 +1,5 @@
 from .user import UserRepository as UserRepository
 from .item import ItemRepository as ItemRepository
+from .token import TokenRepository as TokenRepository
+from .file import FileRepository as FileRepository
+from .upload import UploadRepository as UploadRepository
@@ -0,0 +1,118 @@
+from datetime import datetime, timezone
+from src.models.file import StoredFile
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import select, delete, update, col
+from sqlmodel.ext.asyncio.session import AsyncSession
+from src.core.tracing import traced
+
+
+@traced
+class FileRepository:
+    def __init__(self, session: AsyncSession) -> None:
+        self.session = session
+
+    async def create(
+        self, sha256: str, path: str, size: int, content_type: str | None = None
+    ) -> StoredFile | None:
+        """Record a newly stored file with a single reference. Returns None if the contents were recorded concurrently"""
+        stored_file = StoredFile(
+            sha256=sha256, path=path, size=size, content_type=content_type
+        )
+
+        self.session.add(stored_file)
+        try:
+            await self.session.commit()
+        except IntegrityError:
+            await self.session.rollback()
+            return None
+        return stored_file
+
+    async def get_by_hash(self, sha256: str) -> StoredFile | None:
+        """Get one stored file by the digest of its contents"""
+        query = select(StoredFile).where(StoredFile.sha256 == sha256)
+        result = await self.session.exec(query)
+        return result.first()
+
+    async def add_reference(self, sha256: str) -> bool:
+        """Add a reference to a stored file. Returns False if it is no longer recorded"""
+        query = (
+            update(StoredFile)
+            .where(col(StoredFile.sha256) == sha256, col(StoredFile.ref_count) > 0)
+            .values(
+                ref_count=col(StoredFile.ref_count) + 1,
+                updated_at=datetime.now(tz=timezone.utc),
+            )
+            .returning(StoredFile.id)  # type: ignore
+        )
+
+        result = await self.session.exec(query)  # type: ignore
+        added = result.first()
+        await self.session.commit()
+
+        return added is not None
+
+    async def remove_reference(self, path: str) -> tuple[str, int] | None:
+        """Remove a reference to the file stored at a path. Returns its digest and remaining references, or None if it is not recorded"""
+        query = (
+            update(StoredFile)
+            .where(col(StoredFile.path) == path, col(StoredFile.ref_count) > 0)
+            .values(
+                ref_count=col(StoredFile.ref_count) - 1,
+                updated_at=datetime.now(tz=timezone.utc),
+            )
+            .returning(StoredFile.sha256, StoredFile.ref_count)  # type: ignore
+        )
+
+        result = await self.session.exec(query)  # type: ignore
+        removed = result.first()
+        await self.session.commit()
+
+        return (removed[0], removed[1]) if removed else None
+
+    async def delete_unreferenced(self, sha256: str) -> bool:
+        """Delete the record of a stored file if nothing references it anymore. Returns False if it was referenced again"""
+        query = (
+            delete(StoredFile)
+            .where(col(StoredFile.sha256) == sha256, col(StoredFile.ref_count) <= 0)
+            .returning(StoredFile.id)  # type: ignore
+        )
+
+        result = await self.session.exec(query)  # type: ignore
+        deleted = result.first()
+        await self.session.commit()
+
+        return deleted is not None
+
+    async def remove_references(self, paths: list[str]) -> dict[str, tuple[str, int]]:
+        """Remove a reference to each of the files stored at the given paths. Returns the digest and remaining references of every recorded path"""
+        query = (
+            update(StoredFile)
+            .where(col(StoredFile.path).in_(paths), col(StoredFile.ref_count) > 0)
+            .values(
+                ref_count=col(StoredFile.ref_count) - 1,
+                updated_at=datetime.now(tz=timezone.utc),
+            )
+            .returning(StoredFile.path, StoredFile.sha256, StoredFile.ref_count)  # type: ignore
+        )
+
+        result = await self.session.exec(query)  # type: ignore
+        removed = {
+            path: (sha256, ref_count) for path, sha256, ref_count in result.all()
+        }
+        await self.session.commit()
+
+        return removed
+
+    async def delete_unreferenced_many(self, sha256s: list[str]) -> int:
+        """Delete the records of stored files nothing references anymore. Returns the number of records deleted"""
+        query = (
+            delete(StoredFile)
+            .where(col(StoredFile.sha256).in_(sha256s), col(StoredFile.ref_count) <= 0)
+            .returning(StoredFile.id)  # type: ignore
+        )
+
+        result = await self.session.exec(query)  # type: ignore
+        deleted = len(result.all())
+        await self.session.commit()
+
+        return deleted
@@ -2,8 +2,12 @@ from src.models.item import ItemCreate, Item, ItemUpdate
 from sqlmodel import select, func, delete, update, col
 from sqlmodel.ext.asyncio.session import AsyncSession
 from uuid import UUID
+from typing import AsyncIterator, Sequence
+from sqlalchemy import RowMapping
+from src.core.tracing import traced
 
 
+@traced
 class ItemRepository:
     """A CRUD base repository for all interactions with the database.
     The same code can be replicated for other entities depending on the system's business rules
@@ -46,6 +50,42 @@ class ItemRepository:
 
         return list(items), count
 
+    async def get_all_partial(
+        self, skip: int, limit: int, filters: list, columns: list[str]
+    ) -> tuple[list[RowMapping], int]:
+        """Get the selected columns of all paginated item records"""
+        count_query = select(func.count()).select_from(Item)
+        result = await self.session.exec(count_query)
+        count = result.one()
+
+        query = (
+            select(*(getattr(Item, column) for column in columns))
+            .offset(skip)
+            .limit(limit)
+        )
+        for clause in filters:
+            query = query.where(clause)
+
+        results = await self.session.execute(query)
+        return list(results.mappings().all()), count
+
+    async def stream_all(
+        self, filters: list, columns: list[str], chunk_size: int
+    ) -> AsyncIterator[Sequence[RowMapping]]:
+        """
+        Stream the selected columns of all matching item records in chunks of `chunk_size` rows.
+        Rows are read through a server side cursor so only one chunk is held in memory at a time
+        """
+        query = select(*(getattr(Item, column) for column in columns))
+        for clause in filters:
+            query = query.where(clause)
+
+        result = await self.session.stream(
+            query.execution_options(yield_per=chunk_size)
+        )
+        async for partition in result.mappings().partitions():
+            yield partition
+
     async def update(self, id: UUID, data: ItemUpdate) -> Item | None:
         """Update item by id"""
         # remove unset fields
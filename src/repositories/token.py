@@ -0,0 +1,98 @@
+from datetime import datetime, timezone
+from src.models.token import RefreshToken, RevokedToken
+from sqlmodel import select, delete, update, col
+from sqlmodel.ext.asyncio.session import AsyncSession
+from uuid import UUID
+from src.core.tracing import traced
+
+
+@traced
+class TokenRepository:
+    def __init__(self, session: AsyncSession) -> None:
+        self.session = session
+
+    async def create_refresh_token(
+        self, user_id: UUID, token_hash: str, expires_at: datetime
+    ) -> RefreshToken:
+        """Store the hash of a newly issued refresh token"""
+        token = RefreshToken(
+            user_id=user_id, token_hash=token_hash, expires_at=expires_at
+        )
+
+        self.session.add(token)
+        await self.session.commit()
+        return token
+
+    async def get_refresh_token(self, token_hash: str) -> RefreshToken | None:
+        """Get one refresh token by its hash"""
+        query = select(RefreshToken).where(RefreshToken.token_hash == token_hash)
+        result = await self.session.exec(query)
+        return result.first()
+
+    async def revoke_refresh_token(self, id: UUID) -> bool:
+        """Revoke a refresh token. Returns False if it was already revoked, which makes rotation atomic"""
+        query = (
+            update(RefreshToken)
+            .where(col(RefreshToken.id) == id, col(RefreshToken.revoked_at).is_(None))
+            .values(revoked_at=datetime.now(tz=timezone.utc))
+            .returning(RefreshToken.id)  # type: ignore
+        )
+
+        result = await self.session.exec(query)  # type: ignore
+        revoked = result.first()
+        await self.session.commit()
+
+        return revoked is not None
+
+    async def revoke_user_refresh_tokens(self, user_id: UUID) -> None:
+        """Revoke all active refresh tokens of a user"""
+        query = (
+            update(RefreshToken)
+            .where(
+                col(RefreshToken.user_id) == user_id,
+                col(RefreshToken.revoked_at).is_(None),
+            )
+            .values(revoked_at=datetime.now(tz=timezone.utc))
+        )
+
+        await self.session.exec(query)  # type: ignore
+        await self.session.commit()
+
+    async def create_revocation(self, key: str, expires_at: datetime) -> None:
+        """Record a revoked token key. Revoking the same key twice is a no-op"""
+        await self.session.merge(RevokedToken(key=key, expires_at=expires_at))
+        await self.session.commit()
+
+    async def get_revocations(self, since: datetime | None = None) -> list[str]:
+        """Get the keys of all unexpired revocations, optionally only those recorded after `since`"""
+        query = select(RevokedToken.key).where(
+            col(RevokedToken.expires_at) > datetime.now(tz=timezone.utc)
+        )
+        if since:
+            query = query.where(col(RevokedToken.created_at) >= since)
+
+        result = await self.session.exec(query)
+        return list(result.all())
+
+    async def has_revocation(self, keys: list[str]) -> bool:
+        """Check if any of the keys has an unexpired revocation"""
+        query = (
+            select(RevokedToken.key)
+            .where(
+                col(RevokedToken.key).in_(keys),
+                col(RevokedToken.expires_at) > datetime.now(tz=timezone.utc),
+            )
+            .limit(1)
+        )
+
+        result = await self.session.exec(query)
+        return result.first() is not None
+
+    async def delete_expired_revocations(self) -> None:
+        """Remove revocations of tokens that have expired on their own"""
+        query = delete(RevokedToken).where(
+            col(RevokedToken.expires_at) <= datetime.now(tz=timezone.utc)
+        )
+
+        await self.session.exec(query)  # type: ignore
+        await self.session.commit()
@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta, timezone
+from src.models.file import UploadSession
+from sqlmodel import select, delete, update, col, or_
+from sqlmodel.ext.asyncio.session import AsyncSession
+from uuid import UUID
+from src.core.tracing import traced
+
+
+@traced
+class UploadRepository:
+    def __init__(self, session: AsyncSession) -> None:
+        self.session = session
+
+    async def create(self, upload: UploadSession) -> UploadSession:
+        """Record a new resumable upload"""
+        self.session.add(upload)
+        await self.session.commit()
+        return upload
+
+    async def get_by_id(self, id: UUID) -> UploadSession | None:
+        """Get one upload by id"""
+        return await self.session.get(UploadSession, id)
+
+    async def lock(self, id: UUID, offset: int, lock_seconds: int) -> bool:
+        """
+        Hold an upload while a chunk is received at the given offset.
+        Returns False if the upload has moved past the offset or is already held, which makes appends atomic
+        """
+        now = datetime.now(tz=timezone.utc)
+        query = (
+            update(UploadSession)
+            .where(
+                col(UploadSession.id) == id,
+                col(UploadSession.offset) == offset,
+                or_(
+                    col(UploadSession.locked_until).is_(None),
+                    col(UploadSession.locked_until) < now,
+                ),
+            )
+            .values(locked_until=now + timedelta(seconds=lock_seconds))
+            .returning(UploadSession.id)  # type: ignore
+        )
+
+        result = await self.session.exec(query)  # type: ignore
+        locked = result.first()
+        await self.session.commit()
+
+        return locked is not None
+
+    async def advance(self, id: UUID, offset: int, expires_at: datetime) -> None:
+        """Record the bytes received by a chunk and release the upload"""
+        query = (
+            update(UploadSession)
+            .where(col(UploadSession.id) == id)
+            .values(
+                offset=offset,
+                expires_at=expires_at,
+                locked_until=None,
+                updated_at=datetime.now(tz=timezone.utc),
+            )
+        )
+
+        await self.session.exec(query)  # type: ignore
+        await self.session.commit()
+
+    async def unlock(self, id: UUID) -> None:
+        """Release an upload without recording any bytes"""
+        query = (
+            update(UploadSession)
+            .where(col(UploadSession.id) == id)
+            .values(locked_until=None)
+        )
+
+        await self.session.exec(query)  # type: ignore
+        await self.session.commit()
+
+    async def delete(self, id: UUID) -> None:
+        """Delete the record of an upload"""
+        query = delete(UploadSession).where(col(UploadSession.id) == id)
+
+        await self.session.exec(query)  # type: ignore
+        await self.session.commit()
+
+    async def get_expired(self, limit: int) -> list[UploadSession]:
+        """Get uploads that have not received a chunk for too long"""
+        query = (
+            select(UploadSession)
+            .where(col(UploadSession.expires_at) <= datetime.now(tz=timezone.utc))
+            .limit(limit)
+        )
+
+        result = await self.session.exec(query)
+        return list(result.all())
@@ -2,8 +2,12 @@ from src.models.user import UserCreate, User, UserUpdate
 from sqlmodel import select, func, update, col
 from sqlmodel.ext.asyncio.session import AsyncSession
 from uuid import UUID
+from typing import AsyncIterator, Sequence
+from sqlalchemy import RowMapping
+from src.core.tracing import traced
 
 
+@traced
 class UserRepository:
     def __init__(self, session: AsyncSession) -> None:
         self.session = session
@@ -58,6 +62,42 @@ class UserRepository:
 
         return list(users), count
 
+    async def get_all_partial(
+        self, skip: int, limit: int, filters: list, columns: list[str]
+    ) -> tuple[list[RowMapping], int]:
+        """Get the selected columns of all paginated user records"""
+        count_query = select(func.count()).select_from(User)
+        result = await self.session.exec(count_query)
+        count = result.one()
+
+        query = (
+            select(*(getattr(User, column) for column in columns))
+            .offset(skip)
+            .limit(limit)
+        )
+        for clause in filters:
+            query = query.where(clause)
+
+        results = await self.session.execute(query)
+        return list(results.mappings().all()), count
+
+    async def stream_all(
+        self, filters: list, columns: list[str], chunk_size: int
+    ) -> AsyncIterator[Sequence[RowMapping]]:
+        """
+        Stream the selected columns of all matching user records in chunks of `chunk_size` rows.
+        Rows are read through a server side cursor so only one chunk is held in memory at a time
+        """
+        query = select(*(getattr(User, column) for column in columns))
+        for clause in filters:
+            query = query.where(clause)
+
+        result = await self.session.stream(
+            query.execution_options(yield_per=chunk_size)
+        )
+        async for partition in result.mappings().partitions():
+            yield partition
+
     async def update(self, id: UUID, data: UserUpdate) -> User | None:
         """Update user by id"""
         # remove default field values
@@ -75,3 +115,18 @@ class UserRepository:
         await self.session.commit()
 
         return user
+
+    async def increment_token_version(self, id: UUID) -> int | None:
+        """Increment the token version of a user and return the new version"""
+        query = (
+            update(User)
+            .where(col(User.id) == id)
+            .values(token_version=col(User.token_version) + 1)
+            .returning(User.token_version)  # type: ignore
+        )
+
+        result = await self.session.exec(query)  # type: ignore
+        version = result.first()
+        await self.session.commit()
+
+        return version[0] if version else None
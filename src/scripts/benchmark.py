@@ -0,0 +1,193 @@
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+import httpx
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from src.core.database import engine
+from src.core.security import create_password_hash
+from src.models.item import Item, ItemsPublicResponse
+from src.models.user import User, UserRole
+
+BENCHMARK_USER_EMAIL = "benchmark@example.com"
+
+
+async def seed_items(count: int):
+    """Ensure the database holds at least `count` items to read back"""
+    async with AsyncSession(engine) as session:
+        result = await session.exec(
+            select(User).where(User.email == BENCHMARK_USER_EMAIL)
+        )
+        user = result.first()
+        if not user:
+            user = User(
+                email=BENCHMARK_USER_EMAIL,
+                password=create_password_hash("benchmark-password"),
+                role=UserRole.USER,
+            )
+            session.add(user)
+            await session.commit()
+            await session.refresh(user)
+
+        result = await session.exec(select(Item).where(Item.user_id == user.id))
+        existing = len(result.all())
+        for i in range(existing, count):
+            session.add(Item(title=f"Benchmark item {i}", user_id=user.id))
+        await session.commit()
+
+
+async def run_load(
+    client: httpx.AsyncClient, path: str, requests: int, concurrency: int
+) -> tuple[list[float], float]:
+    """Send `requests` GET requests with at most `concurrency` in flight
+
+    Returns:
+        tuple[latencies, elapsed]: request latencies and the total duration in seconds
+    """
+    latencies: list[float] = []
+    remaining = iter(range(requests))
+
+    async def worker():
+        for _ in remaining:
+            start_time = time.perf_counter()
+            response = await client.get(path)
+            latencies.append(time.perf_counter() - start_time)
+            response.raise_for_status()
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, time.perf_counter() - start_time
+
+
+def report(name: str, latencies: list[float], elapsed: float):
+    """Print throughput and latency percentiles of a run"""
+    percentiles = statistics.quantiles(latencies, n=100)
+    print(
+        f"{name}: {len(latencies) / elapsed:.0f} req/s, "
+        f"p50 {percentiles[49] * 1000:.2f} ms, p99 {percentiles[98] * 1000:.2f} ms"
+    )
+
+
+async def benchmark_endpoint(args: argparse.Namespace):
+    """Load test an endpoint, either in-process through the full middleware stack or against a running server"""
+    if args.seed:
+        await seed_items(args.seed)
+
+    if args.url:
+        transport = None
+        base_url = args.url
+    else:
+        from src.main import app
+
+        transport = httpx.ASGITransport(app=app)
+        base_url = "http://benchmark"
+
+    async with httpx.AsyncClient(
+        transport=transport, base_url=base_url, timeout=60
+    ) as client:
+        # warm up connection pools and caches before measuring
+        await run_load(client, args.path, args.warmup, args.concurrency)
+        latencies, elapsed = await run_load(
+            client, args.path, args.requests, args.concurrency
+        )
+
+    report(f"GET {args.path}", latencies, elapsed)
+    await engine.dispose()
+
+
+async def benchmark_serialization(args: argparse.Namespace):
+    """
+    Compare the ways a `GET /items?limit=100` response can be serialized:
+    FastAPI validating the response model again and encoding it with the stdlib or orjson, and dumping the model directly
+    """
+    from src.api.routing import AppRoute
+
+    response_model = ItemsPublicResponse
+    route = AppRoute("/items/", endpoint=lambda: None, response_model=response_model)
+    user_id = uuid.uuid4()
+    items = [Item(title=f"Benchmark item {i}", user_id=user_id) for i in range(100)]
+    content = response_model(data=items, count=len(items), message="Items retrieved")
+
+    async def revalidate(response_class):
+        data = await serialize_response(
+            field=route.response_field, response_content=content, is_coroutine=True
+        )
+        return response_class(data).body
+
+    async def dump():
+        return content.model_dump_json(by_alias=True)
+
+    for name, serialize in (
+        ("revalidate + json", lambda: revalidate(JSONResponse)),
+        ("revalidate + orjson", lambda: revalidate(ORJSONResponse)),
+        ("model_dump_json", dump),
+    ):
+        latencies = []
+        start_time = time.perf_counter()
+        for _ in range(args.requests):
+            serialize_start = time.perf_counter()
+            await serialize()
+            latencies.append(time.perf_counter() - serialize_start)
+        report(name, latencies, time.perf_counter() - start_time)
+
+
+def benchmark_storage_dependency(args: argparse.Namespace):
+    """
+    Compare the per-request cost of the storage dependency:
+    building a new backend for every request against returning the one created at startup
+    """
+    from starlette.datastructures import State
+    from starlette.requests import Request
+    from src.api.dependencies import get_storage_service
+    from src.services import LocalStorageService, S3StorageService
+
+    state = State()
+    state.storage_service = S3StorageService()
+    request = Request({"type": "http", "app": argparse.Namespace(state=state)})
+
+    for name, create in (
+        ("new LocalStorageService", LocalStorageService),
+        ("new S3StorageService", S3StorageService),
+        ("shared backend", lambda: get_storage_service(request)),
+    ):
+        latencies = []
+        start_time = time.perf_counter()
+        for _ in range(args.requests):
+            create_start = time.perf_counter()
+            create()
+            latencies.append(time.perf_counter() - create_start)
+        report(name, latencies, time.perf_counter() - start_time)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark API endpoints")
+    parser.add_argument("--path", default="/items/", help="Endpoint to request")
+    parser.add_argument("--url", help="Base url of a running server")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument(
+        "--seed", type=int, default=0, help="Number of items to ensure exist"
+    )
+    parser.add_argument(
+        "--serialization",
+        action="store_true",
+        help="Benchmark response serialization alone instead of an endpoint",
+    )
+    parser.add_argument(
+        "--storage-dependency",
+        action="store_true",
+        help="Benchmark resolving the storage dependency alone instead of an endpoint",
+    )
+
+    args = parser.parse_args()
+    if args.serialization:
+        asyncio.run(benchmark_serialization(args))
+    elif args.storage_dependency:
+        benchmark_storage_dependency(args)
+    else:
+        asyncio.run(benchmark_endpoint(args))
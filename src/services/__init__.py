@@ -2,6 +2,10 @@ from .item import ItemService as ItemService
 from .user import UserService as UserService
 from .auth import AuthService as AuthService
 from .storage import (
+    BaseStorageService as BaseStorageService,
     LocalStorageService as LocalStorageService,
     S3StorageService as S3StorageService,
+    create_storage_service as create_storage_service,
 )
+from .file import FileService as FileService
+from .upload import UploadService as UploadService, UploadCleaner as UploadCleaner
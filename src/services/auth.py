@@ -9,7 +9,7 @@ from src.core.exceptions import (
     AuthenticationError,
 )
 from src.core.config import AppConfig
-from src.repositories import UserRepository
+from src.repositories import UserRepository, TokenRepository
 from src.models.user import (
     UserCreate,
     UserUpdate,
@@ -29,18 +29,23 @@ from src.core.security import (
     create_access_token,
     create_refresh_token,
     decode_refresh_token,
+    hash_token,
     get_external_oauth_url,
     decode_google_token,
     update_client_state,
     check_client_state,
 )
+from src.core.revocation import revocation_store
 from pydantic import UUID4
 from sqlmodel.ext.asyncio.session import AsyncSession
+from src.core.tracing import traced
 
 
+@traced
 class AuthService:
     def __init__(self, session: AsyncSession) -> None:
         self.user_repository = UserRepository(session=session)
+        self.token_repository = TokenRepository(session=session)
 
     async def signup(self, data: UserRegister):
         """Create a new user account"""
@@ -74,9 +79,7 @@ class AuthService:
             raise BadActionError("Incorrect email or password")
 
         # generate tokens
-        token_data = TokenPayload(sub=user.id, role=user.role)
-        access_token = create_access_token(token_data)
-        refresh_token = create_access_token(token_data)
+        access_token, refresh_token = await self._issue_tokens(user)
         return user, access_token, refresh_token
 
     async def login_access_token(self, data: OAuth2PasswordRequestForm):
@@ -90,17 +93,56 @@ class AuthService:
 
         # generate and return tokens
         # generate tokens
-        token_data = TokenPayload(sub=user.id, role=user.role)
+        token_data = TokenPayload(sub=user.id, role=user.role, ver=user.token_version)
         return create_access_token(token_data)
 
-    async def refresh_session(self, refresh_token: str) -> str:
-        """validate refresh token and generate new access token"""
+    async def refresh_session(self, refresh_token: str) -> tuple[str, str]:
+        """Validate refresh token and rotate it for a new access and refresh token pair
+
+        Returns:
+            tuple[access_token, refresh_token]
+        """
         data = decode_refresh_token(token=refresh_token)
         if not data:
             raise BadActionError("Invalid refresh token")
 
-        access_token = create_access_token(data)
-        return access_token
+        stored_token = await self.token_repository.get_refresh_token(
+            token_hash=hash_token(refresh_token)
+        )
+        if not stored_token or await revocation_store.is_revoked(data):
+            raise AuthenticationError("Invalid refresh token")
+
+        # a rotated token being presented again means it has leaked. end all sessions of the user
+        if not await self.token_repository.revoke_refresh_token(id=stored_token.id):
+            logger.warning("Refresh token reuse detected for user %s", data.sub)
+            await self.revoke_all_tokens(user_id=data.sub)
+            raise AuthenticationError("Refresh token has already been used")
+
+        user = await self.user_repository.get_by_id(id=data.sub)
+        if not user or not user.is_active or user.token_version != data.ver:
+            raise AuthenticationError("Invalid refresh token")
+
+        return await self._issue_tokens(user)
+
+    async def logout(self, current_user: TokenPayload, refresh_token: str | None):
+        """Revoke the current access token and its refresh token"""
+        await revocation_store.revoke_token(current_user)
+
+        if refresh_token:
+            stored_token = await self.token_repository.get_refresh_token(
+                token_hash=hash_token(refresh_token)
+            )
+            if stored_token and stored_token.user_id == current_user.sub:
+                await self.token_repository.revoke_refresh_token(id=stored_token.id)
+
+    async def revoke_all_tokens(self, user_id: UUID4):
+        """Invalidate every access and refresh token issued to a user"""
+        version = await self.user_repository.increment_token_version(id=user_id)
+        if version is None:
+            raise NotFoundError("User not found")
+
+        await revocation_store.revoke_version(user_id=user_id, version=version - 1)
+        await self.token_repository.revoke_user_refresh_tokens(user_id=user_id)
 
     async def deactivate_account(self, id: UUID4, role: UserRole):
         """Update user details"""
@@ -111,6 +153,8 @@ class AuthService:
         user = await self.user_repository.update(
             id=id, data=UserUpdate(is_active=False)
         )
+        # existing sessions must not outlive the account
+        await self.revoke_all_tokens(user_id=id)
         return user
 
     async def update_password(self, id: UUID4, data: UpdatePassword):
@@ -123,7 +167,10 @@ class AuthService:
             raise BadActionError("Incorrect password")
 
         user.password = create_password_hash(password=data.new_password)
-        updated_user = self.user_repository.save(user)
+        updated_user = await self.user_repository.save(user)
+
+        # sign out all sessions that were started with the old password
+        await self.revoke_all_tokens(user_id=id)
 
         return updated_user
 
@@ -191,11 +238,19 @@ class AuthService:
             user = await self.user_repository.create(user_data)
 
         # create tokens
-        token_data = TokenPayload(sub=user.id, role=user.role)
+        access_token, refresh_token = await self._issue_tokens(user)
+        return user, access_token, refresh_token
+
+    async def _issue_tokens(self, user: User) -> tuple[str, str]:
+        """Create an access and refresh token pair. Only the hash of the refresh token is stored"""
+        token_data = TokenPayload(sub=user.id, role=user.role, ver=user.token_version)
 
         access_token = create_access_token(token_data)
-        refresh_token, _ = create_refresh_token(token_data)
-        return user, access_token, refresh_token
+        refresh_token, expiry = create_refresh_token(token_data)
+        await self.token_repository.create_refresh_token(
+            user_id=user.id, token_hash=hash_token(refresh_token), expires_at=expiry
+        )
+        return access_token, refresh_token
 
     async def _get_google_token(
         self, code: str, client_origin: str, state: str, provider=OAuthProvider.GOOGLE
@@ -0,0 +1,394 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import PurePosixPath
+from typing import AsyncIterator, Mapping
+from starlette.datastructures import UploadFile
+from starlette.responses import Response
+from src.core.config import AppConfig
+from src.core.exceptions import (
+    BadActionError,
+    ConflictError,
+    NotFoundError,
+    PayloadTooLargeError,
+    PermissionDeniedError,
+)
+from src.core.security import create_file_token, decode_file_token
+from src.models.file import (
+    PresignedDownload,
+    PresignedUpload,
+    PresignedUploadCreate,
+    StoredFile,
+)
+from src.repositories import FileRepository
+from src.services.storage import (
+    BaseStorageService,
+    FileInfo,
+    LocalStorageService,
+    is_hidden_path,
+)
+from src.tasks import image as image_tasks
+from src.utils.image import get_variant_paths
+from sqlmodel.ext.asyncio.session import AsyncSession
+from src.core.tracing import traced
+
+# uploads are written under hidden paths until their digest is known. local downloads never serve hidden paths
+STAGING_PREFIX = ".staging"
+# how long an upload waits for a file with the same contents to finish being deleted
+DELETE_WAIT_ATTEMPTS = 10
+DELETE_WAIT_SECONDS = 0.05
+# number of paths updated per query when references are removed in bulk
+REFERENCE_BATCH_SIZE = 500
+
+
+def get_file_extension(filename: str | None) -> str:
+    """Get the extension of an uploaded file's name including its dot, ignoring anything that is not alphanumeric"""
+    suffix = PurePosixPath(filename or "").suffix
+    return suffix if suffix[1:].isalnum() else ""
+
+
+@traced
+class FileService:
+    """
+    Stores uploads and tracks references to them. In content addressed mode files are named after the sha-256 digest
+    of their contents, so identical uploads share one stored file which is only deleted once nothing references it
+    """
+
+    def __init__(
+        self, session: AsyncSession, storage_service: BaseStorageService
+    ) -> None:
+        self.file_repository = FileRepository(session=session)
+        self.storage_service = storage_service
+
+    async def upload_file(self, file: UploadFile) -> FileInfo:
+        """Store an uploaded file under a unique name, or under its digest in content addressed mode"""
+        extension = get_file_extension(file.filename)
+        if not AppConfig.STORAGE_CONTENT_ADDRESSED:
+            path = f"{uuid.uuid4()}{extension}"
+            info = await self.storage_service.upload_file(
+                file=file, path=path, content_type=file.content_type
+            )
+            info.variants_task_id = await self.schedule_image_variants(
+                path, file.content_type
+            )
+            return info
+
+        # the digest is only known once every byte is read so the upload is staged and moved into place afterwards
+        staging_path = f"{STAGING_PREFIX}/{uuid.uuid4()}"
+        info = await self.storage_service.upload_file(
+            file=file, path=staging_path, content_type=file.content_type
+        )
+
+        created = False
+        try:
+            stored_file, created = await self.reference_file(
+                sha256=info.sha256,
+                path=f"{info.sha256}{extension}",
+                size=info.size,
+                content_type=file.content_type,
+            )
+            if created:
+                await self.storage_service.move_file(staging_path, stored_file.path)
+            else:
+                await self.storage_service.delete_file(staging_path)
+        except BaseException:
+            await self.storage_service.delete_file(staging_path)
+            if created:
+                await self.release_file(stored_file.path)
+            raise
+
+        return FileInfo(
+            path=self.storage_service.get_public_path(stored_file.path),
+            size=stored_file.size,
+            sha256=stored_file.sha256,
+            variants_task_id=await self.schedule_image_variants(
+                stored_file.path, file.content_type
+            ),
+        )
+
+    async def schedule_image_variants(
+        self, path: str, content_type: str | None
+    ) -> str | None:
+        """Queue generating the variants of a stored image. Returns the id of the task, or None if the file has no variants"""
+        # queueing talks to the broker with blocking calls
+        return await asyncio.to_thread(
+            image_tasks.schedule_image_variants, path, content_type
+        )
+
+    async def reference_file(
+        self, sha256: str, path: str, size: int, content_type: str | None
+    ) -> tuple[StoredFile, bool]:
+        """
+        Reference the stored file with the given digest, recording a new one at `path` if there is none.
+        Returns the stored file and whether it was recorded by this call
+        """
+        # the extra attempt records the file once a record left behind is cleared
+        for attempt in range(DELETE_WAIT_ATTEMPTS + 2):
+            stored_file = await self.file_repository.get_by_hash(sha256)
+            if stored_file is None:
+                # the record is created before the file is in place so a concurrent delete of the same contents can not remove it
+                stored_file = await self.file_repository.create(
+                    sha256=sha256, path=path, size=size, content_type=content_type
+                )
+                if stored_file is not None:
+                    return stored_file, True
+            elif await self.file_repository.add_reference(sha256):
+                return stored_file, False
+            elif attempt < DELETE_WAIT_ATTEMPTS:
+                # the last reference was just removed. wait for the file to be deleted before storing it again
+                await asyncio.sleep(DELETE_WAIT_SECONDS)
+            else:
+                # a delete that never finished left its record behind
+                await self.file_repository.delete_unreferenced(sha256)
+
+        raise ConflictError("File is being modified, try again")
+
+    async def create_presigned_upload(
+        self, data: PresignedUploadCreate
+    ) -> PresignedUpload:
+        """Issue a presigned request uploading a file straight to storage, so its contents never pass through the api"""
+        if data.size > AppConfig.MAX_UPLOAD_SIZE_BYTES:
+            raise PayloadTooLargeError(
+                f"File exceeds the maximum size of {AppConfig.MAX_UPLOAD_SIZE_BYTES} bytes"
+            )
+        if AppConfig.UPLOAD_ALLOWED_CONTENT_TYPES and not data.content_type.startswith(
+            tuple(AppConfig.UPLOAD_ALLOWED_CONTENT_TYPES)
+        ):
+            raise BadActionError("Unsupported content type")
+
+        extension = get_file_extension(data.filename)
+        # storage checks the digest of presigned uploads so content addressed files are uploaded to their final path
+        path = (
+            f"{data.sha256}{extension}"
+            if AppConfig.STORAGE_CONTENT_ADDRESSED
+            else f"{uuid.uuid4()}{extension}"
+        )
+        upload = await self.storage_service.create_upload_url(
+            path=path,
+            content_type=data.content_type,
+            size=data.size,
+            sha256=data.sha256,
+            method=data.method,
+            expires_in=AppConfig.PRESIGNED_URL_EXPIRE_SECONDS,
+        )
+        token, _ = create_file_token(
+            {
+                "act": "complete",
+                "path": path,
+                "content_type": data.content_type,
+                "size": data.size,
+                "sha256": data.sha256,
+            },
+            expires_in=AppConfig.PRESIGNED_UPLOAD_COMPLETE_EXPIRE_SECONDS,
+        )
+
+        return PresignedUpload(
+            path=self.storage_service.get_public_path(path),
+            url=upload.url,
+            method=data.method,
+            headers=upload.headers,
+            fields=upload.fields,
+            expires_at=datetime.now(tz=timezone.utc)
+            + timedelta(seconds=AppConfig.PRESIGNED_URL_EXPIRE_SECONDS),
+            token=token,
+        )
+
+    async def complete_presigned_upload(self, token: str) -> FileInfo:
+        """Confirm a presigned upload once it is done, checking the stored file and recording it in content addressed mode"""
+        payload = decode_file_token(token, action="complete")
+        if payload is None:
+            raise PermissionDeniedError("Invalid or expired upload token")
+        path, size, sha256 = payload["path"], payload["size"], payload["sha256"]
+
+        if not AppConfig.STORAGE_CONTENT_ADDRESSED:
+            await self._verify_upload(path=path, size=size, sha256=sha256)
+            return FileInfo(
+                path=self.storage_service.get_public_path(path),
+                size=size,
+                sha256=sha256,
+                variants_task_id=await self.schedule_image_variants(
+                    path, payload["content_type"]
+                ),
+            )
+
+        # the reference is added first so a concurrent delete of the same contents can not remove the file while it is checked
+        stored_file, _ = await self.reference_file(
+            sha256=sha256, path=path, size=size, content_type=payload["content_type"]
+        )
+        try:
+            await self._verify_upload(path=path, size=size, sha256=sha256)
+        except BaseException:
+            await self.release_file(stored_file.path)
+            raise
+        # the same contents were already stored with another extension
+        if stored_file.path != path:
+            await self.storage_service.delete_file(path)
+
+        return FileInfo(
+            path=self.storage_service.get_public_path(stored_file.path),
+            size=stored_file.size,
+            sha256=stored_file.sha256,
+            variants_task_id=await self.schedule_image_variants(
+                stored_file.path, payload["content_type"]
+            ),
+        )
+
+    async def _verify_upload(self, path: str, size: int, sha256: str) -> None:
+        if not await self.storage_service.verify_upload(
+            path=path, size=size, sha256=sha256
+        ):
+            await self.storage_service.delete_file(path)
+            raise BadActionError(
+                "File contents do not match the declared size and digest"
+            )
+
+    async def create_presigned_download(self, path: str) -> PresignedDownload:
+        """Issue a presigned url downloading a file straight from storage"""
+        url = await self.storage_service.create_download_url(
+            path=path, expires_in=AppConfig.PRESIGNED_URL_EXPIRE_SECONDS
+        )
+        return PresignedDownload(
+            url=url,
+            expires_at=datetime.now(tz=timezone.utc)
+            + timedelta(seconds=AppConfig.PRESIGNED_URL_EXPIRE_SECONDS),
+        )
+
+    def _get_signed_transfer(self, token: str, path: str, action: str) -> dict:
+        """Check that a token signed by the local storage grants an action on a path"""
+        payload = decode_file_token(token, action=action)
+        if payload is None or payload["path"] != path:
+            raise PermissionDeniedError("Invalid or expired signature")
+        # s3 serves presigned requests itself so only local storage accepts them
+        if not isinstance(self.storage_service, LocalStorageService):
+            raise NotFoundError("Signed transfers are not supported by the storage")
+        return payload
+
+    async def upload_signed_file(
+        self,
+        token: str,
+        path: str,
+        chunks: AsyncIterator[bytes],
+        content_type: str | None,
+    ) -> FileInfo:
+        """Store the body of an upload signed by the local storage"""
+        payload = self._get_signed_transfer(token=token, path=path, action="upload")
+        if content_type != payload["content_type"]:
+            raise BadActionError("Content type does not match the signed upload")
+
+        return await self.storage_service.upload_stream(  # type: ignore
+            chunks=chunks, path=path, size=payload["size"], sha256=payload["sha256"]
+        )
+
+    async def get_signed_download(
+        self, token: str, path: str, headers: Mapping[str, str]
+    ) -> Response:
+        """Send a file for a download url signed by the local storage"""
+        self._get_signed_transfer(token=token, path=path, action="download")
+        return await self.storage_service.get_download(path=path, headers=headers)
+
+    async def get_file_by_hash(self, sha256: str) -> FileInfo:
+        """Get a stored file by the digest of its contents"""
+        stored_file = (
+            await self.file_repository.get_by_hash(sha256)
+            if AppConfig.STORAGE_CONTENT_ADDRESSED
+            else None
+        )
+        if not stored_file or stored_file.ref_count <= 0:
+            raise NotFoundError("File not found")
+
+        return FileInfo(
+            path=self.storage_service.get_public_path(stored_file.path),
+            size=stored_file.size,
+            sha256=stored_file.sha256,
+        )
+
+    async def add_file_reference(self, sha256: str) -> FileInfo:
+        """Reference a file that is already stored instead of uploading its contents again"""
+        info = await self.get_file_by_hash(sha256)
+        if not await self.file_repository.add_reference(sha256):
+            raise NotFoundError("File not found")
+        return info
+
+    async def delete_file(self, path: str) -> bool:
+        """Delete a file. Content addressed files lose one reference and are only deleted once none are left"""
+        # hidden files such as staged and partial uploads are managed by the api alone
+        if is_hidden_path(path):
+            return False
+        if not AppConfig.STORAGE_CONTENT_ADDRESSED:
+            return await self._delete_stored_file(path)
+
+        # files stored before content addressing was enabled are not tracked
+        if not await self.release_file(path):
+            return await self._delete_stored_file(path)
+        return True
+
+    async def _delete_stored_file(self, path: str) -> bool:
+        """Delete a file from storage along with its image variants"""
+        deleted = await self.storage_service.delete_file(path=path)
+        if variant_paths := get_variant_paths(path):
+            await self.storage_service.delete_files(variant_paths)
+        return deleted
+
+    async def delete_files(self, paths: list[str]) -> dict[str, bool]:
+        """
+        Delete many files at once, returning whether each path was deleted. Content addressed files lose one reference each
+        and only the files left without references are deleted from storage, together in one batch
+        """
+        if len(paths) > AppConfig.MAX_BATCH_DELETE_PATHS:
+            raise BadActionError(
+                f"At most {AppConfig.MAX_BATCH_DELETE_PATHS} files can be deleted at once"
+            )
+        # a path listed twice would otherwise remove two references
+        paths = list(dict.fromkeys(paths))
+        if not AppConfig.STORAGE_CONTENT_ADDRESSED:
+            return await self._delete_stored_files(paths)
+
+        removed: dict[str, tuple[str, int]] = {}
+        for i in range(0, len(paths), REFERENCE_BATCH_SIZE):
+            removed.update(
+                await self.file_repository.remove_references(
+                    paths[i : i + REFERENCE_BATCH_SIZE]
+                )
+            )
+
+        # files stored before content addressing was enabled are not tracked
+        unreferenced = [path for path in paths if removed.get(path, ("", 0))[1] <= 0]
+        try:
+            results = await self._delete_stored_files(unreferenced)
+        finally:
+            sha256s = [
+                sha256 for sha256, ref_count in removed.values() if ref_count <= 0
+            ]
+            for i in range(0, len(sha256s), REFERENCE_BATCH_SIZE):
+                await self.file_repository.delete_unreferenced_many(
+                    sha256s[i : i + REFERENCE_BATCH_SIZE]
+                )
+
+        # a reference was removed from every recorded path, whether or not its file was deleted yet
+        results.update(dict.fromkeys(removed, True))
+        return {path: results[path] for path in paths}
+
+    async def _delete_stored_files(self, paths: list[str]) -> dict[str, bool]:
+        """Delete files from storage along with their image variants, which go in the same batches"""
+        variant_paths = [
+            variant_path for path in paths for variant_path in get_variant_paths(path)
+        ]
+        results = await self.storage_service.delete_files(paths + variant_paths)
+        return {path: results[path] for path in paths}
+
+    async def release_file(self, path: str) -> bool:
+        """
+        Remove a reference to a content addressed file and delete the file along with its record once none are left.
+        The record outlives the file so an upload of the same contents waits instead of storing a file that is about to be deleted
+        """
+        removed = await self.file_repository.remove_reference(path)
+        if removed is None:
+            return False
+
+        sha256, ref_count = removed
+        if ref_count <= 0:
+            try:
+                await self._delete_stored_file(path)
+            finally:
+                await self.file_repository.delete_unreferenced(sha256)
+        return True
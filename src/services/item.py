@@ -1,11 +1,25 @@
 from src.core.exceptions import NotFoundError
 from src.repositories import ItemRepository
-from src.models.item import ItemCreate, ItemUpdate, Item, ItemsPublic
-from src.utils.database import build_query_filter
+from src.models.item import (
+    ItemCreate,
+    ItemUpdate,
+    Item,
+    ItemsPublic,
+    ItemsPartialPublic,
+    ItemPublic,
+)
+from src.utils.database import build_query_filter, parse_fieldset
+from src.utils.export import encode_export, get_export_fields
+from src.core.config import AppConfig
+from src.core.database import engine
+from src.models.base import ExportFormat
+from typing import AsyncIterator
 from pydantic import UUID4
 from sqlmodel.ext.asyncio.session import AsyncSession
+from src.core.tracing import traced
 
 
+@traced
 class ItemService:
     def __init__(self, session: AsyncSession) -> None:
         self.item_repository = ItemRepository(session=session)
@@ -20,19 +34,60 @@ class ItemService:
             raise NotFoundError("Item not found")
         return item
 
-    async def get_all_items(self, skip: int, limit: int, query):
-        """Get all items"""
+    async def get_all_items(
+        self, skip: int, limit: int, query, fields: str | None = None
+    ):
+        """Get all items. Only the given comma separated fields are selected and returned when set"""
         # build filters. exclude unset and none fields
         filters = build_query_filter(
             model=Item,
             query=query.model_dump(exclude_unset=True, exclude_none=True),
         )
+        if fields:
+            selected = parse_fieldset(model=ItemPublic, fields=fields)
+            rows, count = await self.item_repository.get_all_partial(
+                skip=skip, limit=limit, filters=filters, columns=list(selected)
+            )
+            return ItemsPartialPublic(
+                data=[
+                    {alias: row[column] for column, alias in selected.items()}
+                    for row in rows
+                ],
+                count=count,
+            )
+
         items, count = await self.item_repository.get_all(
             skip=skip, limit=limit, filters=filters
         )
 
         return ItemsPublic(data=items, count=count)
 
+    def export_items(
+        self, query, format: ExportFormat, gzip: bool = False
+    ) -> AsyncIterator[bytes]:
+        """Encode all items matching the query as a stream of export chunks"""
+        filters = build_query_filter(
+            model=Item,
+            query=query.model_dump(exclude_unset=True, exclude_none=True),
+        )
+        fields = get_export_fields(ItemPublic)
+        return encode_export(
+            self._stream_items(filters=filters, columns=list(fields)),
+            fields=fields,
+            format=format,
+            gzip=gzip,
+        )
+
+    async def _stream_items(self, filters: list, columns: list[str]):
+        # the response is streamed after the request session is closed so the export reads through its own session
+        async with AsyncSession(engine) as session:
+            async for rows in ItemRepository(session=session).stream_all(
+                filters=filters,
+                columns=columns,
+                chunk_size=AppConfig.EXPORT_CHUNK_SIZE,
+            ):
+                yield rows
+
     async def update_item_by_id(self, id: UUID4, data: ItemUpdate):
         """Update item details"""
         item = await self.item_repository.update(id=id, data=data)
@@ -1,29 +1,192 @@
+import asyncio
+import base64
 import boto3
-from io import BytesIO
-from fastapi import UploadFile
-from pathlib import Path
-from typing import BinaryIO, Optional
+import botocore.exceptions
+from botocore.config import Config
+import hashlib
+import os
+import stat
+import tempfile
+from dataclasses import dataclass
+
+# fastapi passes uploads as starlette upload files rather than its own subclass
+from starlette.datastructures import UploadFile
+from pathlib import Path, PurePosixPath
+from typing import AsyncIterator, BinaryIO, Mapping, Optional
+from urllib.parse import quote, urlencode
+from starlette.requests import ClientDisconnect
+from starlette.responses import Response, StreamingResponse
+from fastapi.logger import logger
 from src.core.config import AppConfig
+from src.core.file_cache import FileCache
+from src.core.exceptions import BadActionError, NotFoundError, PayloadTooLargeError
+from src.core.security import create_file_token
+from src.models.file import UploadSession
+from src.utils.download import (
+    create_file_response,
+    format_http_date,
+    get_cache_control,
+    is_immutable_path,
+    parse_http_date,
+)
 from abc import ABC, abstractmethod
 
 
+@dataclass
+class FileInfo:
+    """Location and content details of a stored file"""
+
+    path: str
+    size: int
+    sha256: str
+    # id of the task generating image variants of the file, if any
+    variants_task_id: str | None = None
+
+
+@dataclass
+class SignedUpload:
+    """Request a client sends to upload a file straight to storage"""
+
+    url: str
+    method: str
+    # headers of PUT uploads and form fields sent before the file in POST uploads
+    headers: dict[str, str]
+    fields: dict[str, str]
+
+
+class HashingReader:
+    """Wraps a file to hash and count everything read from it, rejecting files above the maximum size as they are read"""
+
+    def __init__(self, file: BinaryIO, max_size: int) -> None:
+        self.file = file
+        self.max_size = max_size
+        self.size = 0
+        self._hash = hashlib.sha256()
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.file.read(size)
+        self.size += len(data)
+        if self.size > self.max_size:
+            raise PayloadTooLargeError(
+                f"File exceeds the maximum size of {self.max_size} bytes"
+            )
+        self._hash.update(data)
+        return data
+
+    @property
+    def sha256(self) -> str:
+        return self._hash.hexdigest()
+
+
+def is_hidden_path(path: str) -> bool:
+    """Check whether a path is hidden, such as the partial uploads and staged files only the api itself may read"""
+    return any(part.startswith(".") for part in PurePosixPath(path).parts)
+
+
+def get_upload_source(file: BinaryIO | UploadFile) -> BinaryIO:
+    """Get the underlying file of an upload, rejecting uploads whose size is already known to be too large"""
+    if not isinstance(file, UploadFile):
+        return file
+
+    if file.size is not None and file.size > AppConfig.MAX_UPLOAD_SIZE_BYTES:
+        raise PayloadTooLargeError(
+            f"File exceeds the maximum size of {AppConfig.MAX_UPLOAD_SIZE_BYTES} bytes"
+        )
+    return file.file
+
+
 class BaseStorageService(ABC):
     """Base storage class for all file storage processing"""
 
     @abstractmethod
     async def upload_file(
         self, file: BinaryIO | UploadFile, path: str, content_type: Optional[str] = None
-    ) -> str:
+    ) -> FileInfo:
         pass
 
     @abstractmethod
     async def download_file(self, path: str) -> BinaryIO:
         pass
 
+    @abstractmethod
+    async def stream_file(self, path: str) -> AsyncIterator[bytes]:
+        """Open a file and return an iterator over its contents in chunks. Raises a not found error for missing files"""
+        pass
+
+    @abstractmethod
+    async def get_download(self, path: str, headers: Mapping[str, str]) -> Response:
+        """
+        Build the response sending a file, honouring the Range and conditional headers of the request.
+        Raises a not found error for missing files
+        """
+
+    @abstractmethod
+    async def file_exists(self, path: str) -> bool:
+        """Check whether a file is stored at a path"""
+
     @abstractmethod
     async def delete_file(self, path: str) -> bool:
         pass
 
+    @abstractmethod
+    async def delete_files(self, paths: list[str]) -> dict[str, bool]:
+        """
+        Delete many files at once. Returns whether each path was deleted.
+        Backends that can not tell a missing file from a deleted one report every path deleted without an error
+        """
+
+    @abstractmethod
+    async def create_upload_url(
+        self,
+        path: str,
+        content_type: str,
+        size: int,
+        sha256: str,
+        method: str,
+        expires_in: int,
+    ) -> SignedUpload:
+        """Sign a request uploading a file of exactly the given size, content type and digest to a path"""
+
+    @abstractmethod
+    async def create_download_url(self, path: str, expires_in: int) -> str:
+        """Sign a url downloading a file"""
+
+    @abstractmethod
+    async def verify_upload(self, path: str, size: int, sha256: str) -> bool:
+        """Check that a file uploaded through a signed request has the declared size and digest. Raises a not found error for missing files"""
+
+    @abstractmethod
+    async def create_resumable_upload(self, upload: UploadSession) -> str | None:
+        """Prepare storage for the chunks of a resumable upload. Returns the id of the upload in the storage backend, if any"""
+
+    @abstractmethod
+    async def append_resumable_upload(
+        self, upload: UploadSession, chunks: AsyncIterator[bytes]
+    ) -> int:
+        """
+        Store a chunk of a resumable upload at its current offset and return the number of bytes stored.
+        Everything received before the client disconnects is kept so the upload resumes from there
+        """
+
+    @abstractmethod
+    async def complete_resumable_upload(self, upload: UploadSession) -> bool:
+        """Assemble the chunks of a resumable upload at its path. Returns False if the file does not match the declared digest"""
+
+    @abstractmethod
+    async def abort_resumable_upload(self, upload: UploadSession) -> None:
+        """Discard the chunks of a resumable upload"""
+
+    @abstractmethod
+    async def move_file(self, source: str, target: str) -> None:
+        """Move a stored file to another path, replacing any file already stored there"""
+
+    @abstractmethod
+    def get_public_path(self, path: str) -> str:
+        """Get the path of a stored file as reported to clients"""
+
+    async def close(self) -> None:
+        """Release connections held by the storage backend"""
+
     # async def validate_file(self, file: UploadFile | BytesIO) -> str:
     #     """
     #     Check if a file has the required properties
@@ -58,42 +221,279 @@ class LocalStorageService(BaseStorageService):
         file: BinaryIO | UploadFile,
         path: str,
         content_type: str | None = None,
-    ) -> str:
+    ) -> FileInfo:
         """Save a file to disk"""
         file_path = self.root_path / path
+        source = get_upload_source(file)
+
+        # file io blocks so the whole copy runs in a worker thread
+        reader = await asyncio.to_thread(self._write_file, source, file_path)
+
+        return FileInfo(
+            path=self.get_public_path(path), size=reader.size, sha256=reader.sha256
+        )
 
+    def _write_file(self, file: BinaryIO, file_path: Path) -> HashingReader:
+        """
+        Copy a file to its path in chunks, hashing it along the way.
+        It is written to a temporary file first and renamed into place so a failed upload never leaves a partial file behind
+        """
         # ensure the parent path exists
         file_path.parent.mkdir(parents=True, exist_ok=True)
 
-        # read contents of file
-        if isinstance(file, BytesIO):
-            content = file.read()
-        else:
-            content = await file.read()  # type: ignore
+        reader = HashingReader(file, max_size=AppConfig.MAX_UPLOAD_SIZE_BYTES)
+        # the temporary file is kept in the same directory so the rename does not cross filesystems
+        fd, temp_path = tempfile.mkstemp(dir=file_path.parent, prefix=".upload-")
+        try:
+            with os.fdopen(fd, "wb") as fs:
+                while chunk := reader.read(AppConfig.UPLOAD_CHUNK_SIZE_BYTES):
+                    fs.write(chunk)
+                fs.flush()
+                os.fsync(fs.fileno())
+            os.replace(temp_path, file_path)
+        except BaseException:
+            Path(temp_path).unlink(missing_ok=True)
+            raise
 
-        with open(file_path, "wb") as fs:
-            fs.write(content)
+        return reader
 
-        # convert to public path
-        # secured path should be placed in secured directory to restrict access
-        public_path = self._convert_local_path_to_public(path=str(file_path))
-        return public_path
+    async def upload_stream(
+        self, chunks: AsyncIterator[bytes], path: str, size: int, sha256: str
+    ) -> FileInfo:
+        """
+        Save a streamed request body to disk, rejecting it unless it has exactly the expected size and digest.
+        Like uploads, it is written to a temporary file and only renamed into place once it has been checked
+        """
+        file_path = self.root_path / path
+        await asyncio.to_thread(file_path.parent.mkdir, parents=True, exist_ok=True)
+        fd, temp_path = await asyncio.to_thread(
+            tempfile.mkstemp, dir=file_path.parent, prefix=".upload-"
+        )
+        digest, written = hashlib.sha256(), 0
+        try:
+            with os.fdopen(fd, "wb") as fs:
+                async for chunk in chunks:
+                    written += len(chunk)
+                    if written > size:
+                        raise PayloadTooLargeError(
+                            f"File exceeds the declared size of {size} bytes"
+                        )
+                    digest.update(chunk)
+                    await asyncio.to_thread(fs.write, chunk)
+                await asyncio.to_thread(fs.flush)
+                await asyncio.to_thread(os.fsync, fs.fileno())
+
+            if written != size or digest.hexdigest() != sha256:
+                raise BadActionError(
+                    "File contents do not match the declared size and digest"
+                )
+            await asyncio.to_thread(os.replace, temp_path, file_path)
+        except BaseException:
+            await asyncio.to_thread(Path(temp_path).unlink, missing_ok=True)
+            raise
+
+        return FileInfo(path=self.get_public_path(path), size=size, sha256=sha256)
+
+    async def create_upload_url(
+        self,
+        path: str,
+        content_type: str,
+        size: int,
+        sha256: str,
+        method: str,
+        expires_in: int,
+    ) -> SignedUpload:
+        """Sign an upload to the api itself, which checks the contents against the token as they are written"""
+        token, _ = create_file_token(
+            {
+                "act": "upload",
+                "path": path,
+                "content_type": content_type,
+                "size": size,
+                "sha256": sha256,
+            },
+            expires_in=expires_in,
+        )
+        url = self._get_signed_url(path, token)
+        if method == "POST":
+            return SignedUpload(url=url, method=method, headers={}, fields={})
+        return SignedUpload(
+            url=url, method=method, headers={"Content-Type": content_type}, fields={}
+        )
+
+    async def create_download_url(self, path: str, expires_in: int) -> str:
+        token, _ = create_file_token(
+            {"act": "download", "path": path}, expires_in=expires_in
+        )
+        return self._get_signed_url(path, token)
+
+    def _get_signed_url(self, path: str, token: str) -> str:
+        # urls are relative to the api since files are served by it
+        return f"/files/signed/{quote(path)}?{urlencode({'token': token})}"
+
+    async def verify_upload(self, path: str, size: int, sha256: str) -> bool:
+        """Check the size of an uploaded file. Its digest was already checked when it was written"""
+        _, stat_result = await asyncio.to_thread(self._stat_file, path)
+        return stat_result.st_size == size
+
+    def _get_upload_part_path(self, upload: UploadSession) -> Path:
+        # chunks are appended to a hidden file which is renamed into place once complete
+        return self.root_path / ".uploads" / str(upload.id)
+
+    async def create_resumable_upload(self, upload: UploadSession) -> str | None:
+        part_path = self._get_upload_part_path(upload)
+        await asyncio.to_thread(part_path.parent.mkdir, parents=True, exist_ok=True)
+        await asyncio.to_thread(part_path.touch)
+        return None
+
+    async def append_resumable_upload(
+        self, upload: UploadSession, chunks: AsyncIterator[bytes]
+    ) -> int:
+        """Append a chunk to the part file, dropping anything written past the offset by an earlier chunk that failed"""
+        file = await asyncio.to_thread(open, self._get_upload_part_path(upload), "r+b")
+        written = 0
+        try:
+            await asyncio.to_thread(file.truncate, upload.offset)
+            file.seek(upload.offset)
+            try:
+                async for chunk in chunks:
+                    if upload.offset + written + len(chunk) > upload.size:
+                        raise PayloadTooLargeError(
+                            f"Chunk exceeds the declared size of {upload.size} bytes"
+                        )
+                    await asyncio.to_thread(file.write, chunk)
+                    written += len(chunk)
+            except ClientDisconnect:
+                pass
+            await asyncio.to_thread(file.flush)
+            await asyncio.to_thread(os.fsync, file.fileno())
+        finally:
+            await asyncio.to_thread(file.close)
+
+        return written
+
+    async def complete_resumable_upload(self, upload: UploadSession) -> bool:
+        return await asyncio.to_thread(self._complete_resumable_upload, upload)
+
+    def _complete_resumable_upload(self, upload: UploadSession) -> bool:
+        """Check the digest of the part file and rename it into place"""
+        part_path = self._get_upload_part_path(upload)
+        digest = hashlib.sha256()
+        with open(part_path, "rb") as file:
+            while chunk := file.read(AppConfig.UPLOAD_CHUNK_SIZE_BYTES):
+                digest.update(chunk)
+        if digest.hexdigest() != upload.sha256:
+            return False
+
+        file_path = self.root_path / upload.path
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(part_path, file_path)
+        return True
+
+    async def abort_resumable_upload(self, upload: UploadSession) -> None:
+        await asyncio.to_thread(
+            self._get_upload_part_path(upload).unlink, missing_ok=True
+        )
 
     async def download_file(self, path: str) -> BinaryIO:
         """Download or Read the contents of a file in bytes"""
         file_path = self.root_path / path
-        return open(file_path, "rb")
+        return await asyncio.to_thread(open, file_path, "rb")
 
-    async def delete_file(self, path: str) -> bool:
-        """Delete a file if it exists"""
+    async def stream_file(self, path: str) -> AsyncIterator[bytes]:
+        """Open a file and stream its contents in chunks read off the event loop"""
         file_path = self.root_path / path
-        # check if path exists
-        if not file_path.exists():
-            return False
+        try:
+            file = await asyncio.to_thread(open, file_path, "rb")
+        except (FileNotFoundError, IsADirectoryError):
+            raise NotFoundError("File not found")
 
-        # delete file from storage
-        file_path.unlink()
-        return True
+        return self._iter_file(file)
+
+    async def _iter_file(self, file: BinaryIO) -> AsyncIterator[bytes]:
+        try:
+            while chunk := await asyncio.to_thread(
+                file.read, AppConfig.UPLOAD_CHUNK_SIZE_BYTES
+            ):
+                yield chunk
+        finally:
+            file.close()
+
+    async def get_download(self, path: str, headers: Mapping[str, str]) -> Response:
+        """Send a file from disk, letting the server use `sendfile` when it can"""
+        file_path, stat_result = await asyncio.to_thread(self._stat_file, path)
+        return create_file_response(file_path, stat_result, path, headers)
+
+    def _stat_file(self, path: str) -> tuple[Path, os.stat_result]:
+        """Resolve a path within the storage root. Paths escaping the root and hidden files such as partial uploads are not found"""
+        file_path = (self.root_path / path).resolve()
+        if not file_path.is_relative_to(self.root_path.resolve()) or is_hidden_path(
+            path
+        ):
+            raise NotFoundError("File not found")
+
+        try:
+            stat_result = file_path.stat()
+        except (FileNotFoundError, NotADirectoryError):
+            raise NotFoundError("File not found")
+        if not stat.S_ISREG(stat_result.st_mode):
+            raise NotFoundError("File not found")
+        return file_path, stat_result
+
+    async def file_exists(self, path: str) -> bool:
+        return await asyncio.to_thread((self.root_path / path).is_file)
+
+    async def delete_file(self, path: str) -> bool:
+        """Delete a file if it exists. Hidden files such as staged uploads are deleted too since the api cleans those up itself"""
+        results = await asyncio.to_thread(self._delete_files, [path], True)
+        return results[path]
+
+    async def delete_files(self, paths: list[str]) -> dict[str, bool]:
+        """Delete files in groups unlinked in parallel worker threads"""
+        groups = [
+            paths[i :: AppConfig.STORAGE_DELETE_CONCURRENCY]
+            for i in range(min(AppConfig.STORAGE_DELETE_CONCURRENCY, len(paths)))
+        ]
+        results = {}
+        for group in await asyncio.gather(
+            *(asyncio.to_thread(self._delete_files, group) for group in groups)
+        ):
+            results.update(group)
+        return results
+
+    def _delete_files(
+        self, paths: list[str], include_hidden: bool = False
+    ) -> dict[str, bool]:
+        root_path = self.root_path.resolve()
+        results = {}
+        for path in paths:
+            file_path = (self.root_path / path).resolve()
+            # paths escaping the root are never deleted, nor are hidden files such as partial uploads unless asked for
+            if not file_path.is_relative_to(root_path) or (
+                is_hidden_path(path) and not include_hidden
+            ):
+                results[path] = False
+                continue
+            try:
+                file_path.unlink()
+                results[path] = True
+            except (FileNotFoundError, NotADirectoryError, IsADirectoryError):
+                results[path] = False
+        return results
+
+    async def move_file(self, source: str, target: str) -> None:
+        """Rename a file within the storage root"""
+        await asyncio.to_thread(
+            self._move_file, self.root_path / source, self.root_path / target
+        )
+
+    def _move_file(self, source_path: Path, target_path: Path) -> None:
+        target_path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(source_path, target_path)
+
+    def get_public_path(self, path: str) -> str:
+        # secured path should be placed in secured directory to restrict access
+        return self._convert_local_path_to_public(path=str(self.root_path / path))
 
     def _convert_local_path_to_public(self, path: str):
         """Convert local application path to public path to improve security"""
@@ -103,42 +503,620 @@ class LocalStorageService(BaseStorageService):
         return "/public" + public_path
 
 
+# most keys s3 deletes in one request
+S3_DELETE_BATCH_SIZE = 1000
+
+
+def is_missing_object_error(e: botocore.exceptions.ClientError) -> bool:
+    # head requests report a bare 404 since they have no body to carry the error code
+    return e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey")
+
+
 class S3StorageService(BaseStorageService):
-    """Storage class for storing files remotely on AWS S3"""
+    """
+    Storage class for storing files remotely on AWS S3 or any S3 compatible service.
+    boto3 only makes blocking calls so every request runs in a worker thread
+    """
 
     def __init__(self):
         self.bucket_name = AppConfig.AWS_BUCKET_NAME
+        # clients are thread safe so one client and its connection pool is shared by every request
         self.s3_client = boto3.client(
             "s3",
             aws_access_key_id=AppConfig.AWS_ACCESS_KEY,
             aws_secret_access_key=AppConfig.AWS_SECRET_KEY,
             region_name=AppConfig.AWS_REGION,
+            endpoint_url=AppConfig.AWS_ENDPOINT_URL or None,
+            config=Config(
+                max_pool_connections=AppConfig.S3_MAX_POOL_CONNECTIONS,
+                connect_timeout=AppConfig.S3_CONNECT_TIMEOUT_SECONDS,
+                read_timeout=AppConfig.S3_READ_TIMEOUT_SECONDS,
+                retries={"max_attempts": AppConfig.S3_MAX_ATTEMPTS, "mode": "standard"},
+                # presigned urls must be signed with sigv4 for the checksum to be part of the signature
+                signature_version="s3v4",
+            ),
+        )
+        # s3 rejects multipart parts smaller than 5mb except for the last one
+        self.part_size = max(AppConfig.S3_MULTIPART_PART_SIZE_BYTES, 5 * 1024 * 1024)
+        self.cache = (
+            FileCache(
+                path=AppConfig.S3_CACHE_PATH, max_size=AppConfig.S3_CACHE_MAX_SIZE_BYTES
+            )
+            if AppConfig.S3_CACHE_MAX_SIZE_BYTES > 0
+            else None
         )
+        self.concurrency = AppConfig.S3_MULTIPART_CONCURRENCY
 
     async def upload_file(
         self, file: BinaryIO | UploadFile, path: str, content_type: str | None = None
-    ) -> str:
-        # get the file
-        if isinstance(file, UploadFile):
-            file = file.file
+    ) -> FileInfo:
+        """Upload a file in a single request, or as a multipart upload when it is larger than one part"""
+        reader = HashingReader(
+            get_upload_source(file), max_size=AppConfig.MAX_UPLOAD_SIZE_BYTES
+        )
 
         # define content type
         extra_args = {"ContentType": content_type} if content_type else {}
 
-        self.s3_client.upload_fileobj(
-            file, self.bucket_name, path, ExtraArgs=extra_args
+        data = await asyncio.to_thread(reader.read, self.part_size)
+        if len(data) < self.part_size:
+            await asyncio.to_thread(
+                self.s3_client.put_object,
+                Bucket=self.bucket_name,
+                Key=path,
+                Body=data,
+                **extra_args,
+            )
+        else:
+            await self._upload_multipart(reader, path, data, extra_args)
+
+        return FileInfo(
+            path=self.get_public_path(path), size=reader.size, sha256=reader.sha256
         )
-        return f"s3://{self.bucket_name}/{path}"
+
+    async def _upload_multipart(
+        self, reader: HashingReader, path: str, data: bytes, extra_args: dict
+    ) -> None:
+        """
+        Upload parts in parallel while the next ones are read. At most `concurrency` parts are in flight,
+        which bounds the memory held per upload. The upload is aborted if any part fails
+        """
+        upload = await asyncio.to_thread(
+            self.s3_client.create_multipart_upload,
+            Bucket=self.bucket_name,
+            Key=path,
+            **extra_args,
+        )
+        upload_id = upload["UploadId"]
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks: list[asyncio.Task] = []
+
+        async def upload_part(number: int, body: bytes) -> dict:
+            try:
+                response = await asyncio.to_thread(
+                    self.s3_client.upload_part,
+                    Bucket=self.bucket_name,
+                    Key=path,
+                    UploadId=upload_id,
+                    PartNumber=number,
+                    Body=body,
+                )
+                return {"PartNumber": number, "ETag": response["ETag"]}
+            finally:
+                semaphore.release()
+
+        try:
+            while data:
+                # wait for a free slot before reading another part into memory
+                await semaphore.acquire()
+                for task in tasks:
+                    if task.done() and task.exception():
+                        raise task.exception()  # type: ignore
+                tasks.append(asyncio.create_task(upload_part(len(tasks) + 1, data)))
+                data = await asyncio.to_thread(reader.read, self.part_size)
+
+            parts = await asyncio.gather(*tasks)
+            await asyncio.to_thread(
+                self.s3_client.complete_multipart_upload,
+                Bucket=self.bucket_name,
+                Key=path,
+                UploadId=upload_id,
+                MultipartUpload={"Parts": parts},
+            )
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            try:
+                await asyncio.to_thread(
+                    self.s3_client.abort_multipart_upload,
+                    Bucket=self.bucket_name,
+                    Key=path,
+                    UploadId=upload_id,
+                )
+            except Exception:
+                logger.error(
+                    "Failed to abort multipart upload of %s", path, exc_info=True
+                )
+            raise
+
+    async def get_cached_file(self, path: str) -> tuple[Path, os.stat_result] | None:
+        """
+        Get a copy of an object from the disk cache, fetching it into the cache on a miss.
+        Only objects with unique names are cached since they never change. Returns None for objects that are not cached
+        """
+        if self.cache is None or not is_immutable_path(path):
+            return None
+
+        async def fetch(file: BinaryIO) -> bool:
+            return await asyncio.to_thread(self._fetch_file, path, file)
+
+        return await self.cache.get(path, fetch)
+
+    def _fetch_file(self, path: str, file: BinaryIO) -> bool:
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket_name, Key=path)
+        except botocore.exceptions.ClientError as e:
+            if is_missing_object_error(e):
+                raise NotFoundError("File not found")
+            raise
+
+        with response["Body"] as body:
+            # large objects would evict most of the cache so they are always streamed from s3
+            if response["ContentLength"] > min(
+                AppConfig.S3_CACHE_MAX_FILE_SIZE_BYTES,
+                AppConfig.S3_CACHE_MAX_SIZE_BYTES,
+            ):
+                return False
+            while chunk := body.read(AppConfig.UPLOAD_CHUNK_SIZE_BYTES):
+                file.write(chunk)
+        return True
 
     async def download_file(self, path: str) -> BinaryIO:
-        file_obj = BytesIO()
-        self.s3_client.download_fileobj(self.bucket_name, path, file_obj)
+        """Download a file into a temporary file that is only held in memory while it is small"""
+        # hidden objects such as partial uploads are only read through the s3 client, matching local storage
+        if is_hidden_path(path):
+            raise NotFoundError("File not found")
+        if cached := await self.get_cached_file(path):
+            try:
+                return await asyncio.to_thread(open, cached[0], "rb")
+            except FileNotFoundError:
+                # evicted since it was looked up
+                pass
+
+        file_obj = tempfile.SpooledTemporaryFile(
+            max_size=AppConfig.UPLOAD_CHUNK_SIZE_BYTES
+        )
+        try:
+            await asyncio.to_thread(
+                self.s3_client.download_fileobj, self.bucket_name, path, file_obj
+            )
+        except botocore.exceptions.ClientError as e:
+            file_obj.close()
+            if is_missing_object_error(e):
+                raise NotFoundError("File not found")
+            raise
         file_obj.seek(0)
-        return file_obj
+        return file_obj  # type: ignore
+
+    async def stream_file(self, path: str) -> AsyncIterator[bytes]:
+        """Start downloading a file and stream its body in chunks"""
+        if is_hidden_path(path):
+            raise NotFoundError("File not found")
+        if cached := await self.get_cached_file(path):
+            try:
+                file = await asyncio.to_thread(open, cached[0], "rb")
+                return self._iter_body(file)
+            except FileNotFoundError:
+                pass
+
+        try:
+            response = await asyncio.to_thread(
+                self.s3_client.get_object, Bucket=self.bucket_name, Key=path
+            )
+        except botocore.exceptions.ClientError as e:
+            if is_missing_object_error(e):
+                raise NotFoundError("File not found")
+            raise
+
+        return self._iter_body(response["Body"])
+
+    async def _iter_body(self, body) -> AsyncIterator[bytes]:
+        try:
+            while chunk := await asyncio.to_thread(
+                body.read, AppConfig.UPLOAD_CHUNK_SIZE_BYTES
+            ):
+                yield chunk
+        finally:
+            body.close()
+
+    async def get_download(self, path: str, headers: Mapping[str, str]) -> Response:
+        """
+        Send an object from the disk cache, or stream it straight from S3 when it is not cached. Range and conditional headers
+        are passed on to S3 so only the requested bytes are fetched and unchanged objects are not fetched at all
+        """
+        if is_hidden_path(path):
+            raise NotFoundError("File not found")
+        if cached := await self.get_cached_file(path):
+            return create_file_response(cached[0], cached[1], path, headers)
+
+        params = {"Bucket": self.bucket_name, "Key": path}
+        if "if-none-match" in headers:
+            params["IfNoneMatch"] = headers["if-none-match"]
+        elif since := parse_http_date(headers.get("if-modified-since", "")):
+            params["IfModifiedSince"] = since
+        if "range" in headers:
+            params["Range"] = headers["range"]
+
+        try:
+            response = await asyncio.to_thread(self.s3_client.get_object, **params)
+            # If-Range asks for the whole object when it changed since the client fetched the first part
+            if_range = headers.get("if-range")
+            if (
+                "Range" in params
+                and if_range
+                and not self._matches_if_range(if_range, response)
+            ):
+                response["Body"].close()
+                del params["Range"]
+                response = await asyncio.to_thread(self.s3_client.get_object, **params)
+        except botocore.exceptions.ClientError as e:
+            if is_missing_object_error(e):
+                raise NotFoundError("File not found")
+            status_code = e.response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+            if status_code == 304:
+                response_headers = e.response["ResponseMetadata"].get("HTTPHeaders", {})
+                return Response(
+                    status_code=304,
+                    headers={
+                        "ETag": response_headers.get("etag", ""),
+                        "Cache-Control": get_cache_control(path),
+                    },
+                )
+            if e.response.get("Error", {}).get("Code") == "InvalidRange":
+                size = e.response["Error"].get("ActualObjectSize", "*")
+                return Response(
+                    status_code=416, headers={"Content-Range": f"bytes */{size}"}
+                )
+            raise
+
+        response_headers = {
+            "ETag": response["ETag"],
+            "Last-Modified": format_http_date(response["LastModified"]),
+            "Cache-Control": get_cache_control(path),
+            "Content-Length": str(response["ContentLength"]),
+            "Accept-Ranges": "bytes",
+        }
+        if "ContentRange" in response:
+            response_headers["Content-Range"] = response["ContentRange"]
+
+        return StreamingResponse(
+            self._iter_body(response["Body"]),
+            status_code=206 if "ContentRange" in response else 200,
+            headers=response_headers,
+            media_type=response.get("ContentType"),
+        )
+
+    def _matches_if_range(self, if_range: str, response: dict) -> bool:
+        if if_range.startswith(('"', "W/")):
+            # ranges are only combined with strong validators
+            return not if_range.startswith("W/") and if_range == response["ETag"]
+        date = parse_http_date(if_range)
+        return date is not None and response["LastModified"] <= date
+
+    async def file_exists(self, path: str) -> bool:
+        try:
+            await asyncio.to_thread(
+                self.s3_client.head_object, Bucket=self.bucket_name, Key=path
+            )
+        except botocore.exceptions.ClientError as e:
+            if is_missing_object_error(e):
+                return False
+            raise
+        return True
 
     async def delete_file(self, path: str) -> bool:
         try:
-            self.s3_client.delete_object(Bucket=self.bucket_name, Key=path)
+            await asyncio.to_thread(
+                self.s3_client.delete_object, Bucket=self.bucket_name, Key=path
+            )
+            if self.cache is not None:
+                await self.cache.discard(path)
             return True
         except Exception:
             return False
+
+    async def delete_files(self, paths: list[str]) -> dict[str, bool]:
+        """
+        Delete objects with multi-object delete requests of up to 1000 keys, several in flight at once.
+        S3 deletes missing keys without an error, so every key that did not fail is reported deleted whether or not it existed
+        """
+        semaphore = asyncio.Semaphore(AppConfig.STORAGE_DELETE_CONCURRENCY)
+
+        async def delete_batch(batch: list[str]) -> dict[str, bool]:
+            async with semaphore:
+                try:
+                    response = await asyncio.to_thread(
+                        self.s3_client.delete_objects,
+                        Bucket=self.bucket_name,
+                        # quiet mode only reports the keys that failed
+                        Delete={
+                            "Objects": [{"Key": key} for key in batch],
+                            "Quiet": True,
+                        },
+                    )
+                except Exception:
+                    logger.error(
+                        "Failed to delete %d objects", len(batch), exc_info=True
+                    )
+                    return dict.fromkeys(batch, False)
+
+            failed = {error["Key"] for error in response.get("Errors", [])}
+            results = {key: key not in failed for key in batch}
+            if self.cache is not None:
+                for key, deleted in results.items():
+                    if deleted:
+                        await self.cache.discard(key)
+            return results
+
+        # hidden objects such as partial uploads are never deleted in bulk
+        results = {path: False for path in paths if is_hidden_path(path)}
+        keys = [path for path in paths if path not in results]
+        for batch in await asyncio.gather(
+            *(
+                delete_batch(keys[i : i + S3_DELETE_BATCH_SIZE])
+                for i in range(0, len(keys), S3_DELETE_BATCH_SIZE)
+            )
+        ):
+            results.update(batch)
+        return {path: results[path] for path in paths}
+
+    async def create_upload_url(
+        self,
+        path: str,
+        content_type: str,
+        size: int,
+        sha256: str,
+        method: str,
+        expires_in: int,
+    ) -> SignedUpload:
+        """
+        Presign a PUT or POST upload. The content type and checksum are signed so s3 rejects any other contents,
+        and POST policies also pin the size. The size of PUT uploads is checked once they are confirmed
+        """
+        checksum = base64.b64encode(bytes.fromhex(sha256)).decode()
+        if method == "POST":
+            fields = {"Content-Type": content_type, "x-amz-checksum-sha256": checksum}
+            post = await asyncio.to_thread(
+                self.s3_client.generate_presigned_post,
+                Bucket=self.bucket_name,
+                Key=path,
+                Fields=fields,
+                Conditions=[
+                    {"Content-Type": content_type},
+                    {"x-amz-checksum-sha256": checksum},
+                    ["content-length-range", size, size],
+                ],
+                ExpiresIn=expires_in,
+            )
+            return SignedUpload(
+                url=post["url"], method=method, headers={}, fields=post["fields"]
+            )
+
+        url = await asyncio.to_thread(
+            self.s3_client.generate_presigned_url,
+            "put_object",
+            Params={
+                "Bucket": self.bucket_name,
+                "Key": path,
+                "ContentType": content_type,
+                "ContentLength": size,
+                "ChecksumSHA256": checksum,
+            },
+            ExpiresIn=expires_in,
+        )
+        return SignedUpload(
+            url=url,
+            method=method,
+            headers={"Content-Type": content_type, "x-amz-checksum-sha256": checksum},
+            fields={},
+        )
+
+    async def create_download_url(self, path: str, expires_in: int) -> str:
+        if is_hidden_path(path):
+            raise NotFoundError("File not found")
+        return await asyncio.to_thread(
+            self.s3_client.generate_presigned_url,
+            "get_object",
+            Params={"Bucket": self.bucket_name, "Key": path},
+            ExpiresIn=expires_in,
+        )
+
+    async def verify_upload(self, path: str, size: int, sha256: str) -> bool:
+        """
+        Check an uploaded object against the checksum s3 stored with it.
+        Services that do not store checksums have the object streamed and hashed instead
+        """
+        try:
+            response = await asyncio.to_thread(
+                self.s3_client.head_object,
+                Bucket=self.bucket_name,
+                Key=path,
+                ChecksumMode="ENABLED",
+            )
+        except botocore.exceptions.ClientError as e:
+            if is_missing_object_error(e):
+                raise NotFoundError("File not found")
+            raise
+
+        if response["ContentLength"] != size:
+            return False
+        # checksums of multipart objects are computed over their parts and end with the part count
+        if "-" not in response.get("ChecksumSHA256", "-"):
+            return base64.b64decode(response["ChecksumSHA256"]).hex() == sha256
+
+        digest = hashlib.sha256()
+        async for chunk in await self.stream_file(path):
+            digest.update(chunk)
+        return digest.hexdigest() == sha256
+
+    async def create_resumable_upload(self, upload: UploadSession) -> str | None:
+        extra_args = {"ContentType": upload.content_type} if upload.content_type else {}
+        response = await asyncio.to_thread(
+            self.s3_client.create_multipart_upload,
+            Bucket=self.bucket_name,
+            Key=upload.path,
+            **extra_args,
+        )
+        return response["UploadId"]
+
+    def _get_pending_part_key(self, upload: UploadSession) -> str:
+        return f".uploads/{upload.id}.part"
+
+    async def append_resumable_upload(
+        self, upload: UploadSession, chunks: AsyncIterator[bytes]
+    ) -> int:
+        """
+        Upload a chunk as multipart parts of exactly one part size, so the number of every part follows from its offset.
+        Bytes that do not fill a part are kept in a pending object until the next chunk completes it,
+        which bounds the memory held per chunk to a single part whatever size chunks clients send
+        """
+        pending_key = self._get_pending_part_key(upload)
+        buffer = bytearray()
+        if upload.offset % self.part_size:
+            response = await asyncio.to_thread(
+                self.s3_client.get_object, Bucket=self.bucket_name, Key=pending_key
+            )
+            buffer += await asyncio.to_thread(response["Body"].read)
+        part_number = upload.offset // self.part_size + 1
+
+        written = 0
+        try:
+            async for chunk in chunks:
+                if upload.offset + written + len(chunk) > upload.size:
+                    raise PayloadTooLargeError(
+                        f"Chunk exceeds the declared size of {upload.size} bytes"
+                    )
+                buffer += chunk
+                written += len(chunk)
+                while len(buffer) >= self.part_size:
+                    await self._upload_resumable_part(
+                        upload, part_number, bytes(buffer[: self.part_size])
+                    )
+                    del buffer[: self.part_size]
+                    part_number += 1
+        except ClientDisconnect:
+            pass
+
+        if buffer and upload.offset + written == upload.size:
+            # only the last part may be smaller than the part size
+            await self._upload_resumable_part(upload, part_number, bytes(buffer))
+        elif buffer:
+            await asyncio.to_thread(
+                self.s3_client.put_object,
+                Bucket=self.bucket_name,
+                Key=pending_key,
+                Body=bytes(buffer),
+            )
+        return written
+
+    async def _upload_resumable_part(
+        self, upload: UploadSession, part_number: int, body: bytes
+    ) -> None:
+        await asyncio.to_thread(
+            self.s3_client.upload_part,
+            Bucket=self.bucket_name,
+            Key=upload.path,
+            UploadId=upload.storage_upload_id,
+            PartNumber=part_number,
+            Body=body,
+        )
+
+    async def complete_resumable_upload(self, upload: UploadSession) -> bool:
+        """Complete the multipart upload and check the digest of the object, deleting it on a mismatch"""
+        # parts past the last one may be left by chunks that failed before the offset was recorded
+        part_count = -(-upload.size // self.part_size)
+        parts = []
+        paginator = self.s3_client.get_paginator("list_parts")
+        pages = await asyncio.to_thread(
+            lambda: list(
+                paginator.paginate(
+                    Bucket=self.bucket_name,
+                    Key=upload.path,
+                    UploadId=upload.storage_upload_id,
+                )
+            )
+        )
+        for page in pages:
+            parts.extend(
+                {"PartNumber": part["PartNumber"], "ETag": part["ETag"]}
+                for part in page.get("Parts", [])
+                if part["PartNumber"] <= part_count
+            )
+
+        await asyncio.to_thread(
+            self.s3_client.complete_multipart_upload,
+            Bucket=self.bucket_name,
+            Key=upload.path,
+            UploadId=upload.storage_upload_id,
+            MultipartUpload={"Parts": parts},
+        )
+        await asyncio.to_thread(
+            self.s3_client.delete_object,
+            Bucket=self.bucket_name,
+            Key=self._get_pending_part_key(upload),
+        )
+
+        if not await self.verify_upload(
+            path=upload.path, size=upload.size, sha256=upload.sha256
+        ):
+            await self.delete_file(upload.path)
+            return False
+        return True
+
+    async def abort_resumable_upload(self, upload: UploadSession) -> None:
+        try:
+            await asyncio.to_thread(
+                self.s3_client.abort_multipart_upload,
+                Bucket=self.bucket_name,
+                Key=upload.path,
+                UploadId=upload.storage_upload_id,
+            )
+        except botocore.exceptions.ClientError as e:
+            if e.response.get("Error", {}).get("Code") != "NoSuchUpload":
+                raise
+        await asyncio.to_thread(
+            self.s3_client.delete_object,
+            Bucket=self.bucket_name,
+            Key=self._get_pending_part_key(upload),
+        )
+
+    async def move_file(self, source: str, target: str) -> None:
+        """Copy an object to its new key within the bucket and delete the original. The copy never leaves s3"""
+        await asyncio.to_thread(
+            self.s3_client.copy_object,
+            Bucket=self.bucket_name,
+            Key=target,
+            CopySource={"Bucket": self.bucket_name, "Key": source},
+        )
+        await asyncio.to_thread(
+            self.s3_client.delete_object, Bucket=self.bucket_name, Key=source
+        )
+        if self.cache is not None:
+            await self.cache.discard(source)
+
+    def get_public_path(self, path: str) -> str:
+        return f"s3://{self.bucket_name}/{path}"
+
+    async def close(self) -> None:
+        self.s3_client.close()
+
+
+def create_storage_service() -> BaseStorageService:
+    """Create the storage backend shared by the whole application"""
+    backend = AppConfig.STORAGE_BACKEND or (
+        "local" if AppConfig.IS_DEVELOPMENT else "s3"
+    )
+    if backend == "s3":
+        return S3StorageService()
+    return LocalStorageService()
@@ -0,0 +1,248 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator
+from fastapi.logger import logger
+from sqlmodel.ext.asyncio.session import AsyncSession
+from src.core.config import AppConfig
+from src.core.database import engine
+from src.core.exceptions import (
+    BadActionError,
+    ConflictError,
+    NotFoundError,
+    PayloadTooLargeError,
+)
+from src.models.file import UploadSession, UploadSessionCreate
+from src.repositories import UploadRepository
+from src.services.file import FileService, get_file_extension
+from src.services.storage import BaseStorageService, FileInfo
+from src.core.tracing import traced
+
+# number of expired uploads discarded per query
+EXPIRE_BATCH_SIZE = 100
+
+
+def get_upload_expiry() -> datetime:
+    return datetime.now(tz=timezone.utc) + timedelta(
+        seconds=AppConfig.UPLOAD_SESSION_EXPIRE_SECONDS
+    )
+
+
+@traced
+class UploadService:
+    """
+    Resumable uploads. A file is sent as a sequence of chunks at increasing offsets, each stored by the storage backend as it arrives,
+    so an interrupted upload resumes from the last byte received and no request has to carry the whole file
+    """
+
+    def __init__(
+        self, session: AsyncSession, storage_service: BaseStorageService
+    ) -> None:
+        self.upload_repository = UploadRepository(session=session)
+        self.file_service = FileService(
+            session=session, storage_service=storage_service
+        )
+        self.storage_service = storage_service
+
+    async def create_upload(self, data: UploadSessionCreate) -> UploadSession:
+        """Start a resumable upload"""
+        if data.size > AppConfig.MAX_RESUMABLE_UPLOAD_SIZE_BYTES:
+            raise PayloadTooLargeError(
+                f"File exceeds the maximum size of {AppConfig.MAX_RESUMABLE_UPLOAD_SIZE_BYTES} bytes"
+            )
+        if AppConfig.UPLOAD_ALLOWED_CONTENT_TYPES and not data.content_type.startswith(
+            tuple(AppConfig.UPLOAD_ALLOWED_CONTENT_TYPES)
+        ):
+            raise BadActionError("Unsupported content type")
+
+        extension = get_file_extension(data.filename)
+        upload = UploadSession(
+            path=(
+                f"{data.sha256}{extension}"
+                if AppConfig.STORAGE_CONTENT_ADDRESSED
+                else f"{uuid.uuid4()}{extension}"
+            ),
+            content_type=data.content_type,
+            size=data.size,
+            sha256=data.sha256,
+            expires_at=get_upload_expiry(),
+        )
+        upload.storage_upload_id = await self.storage_service.create_resumable_upload(
+            upload
+        )
+        return await self.upload_repository.create(upload)
+
+    async def get_upload(self, id: uuid.UUID) -> UploadSession:
+        """Get an upload that has not expired"""
+        upload = await self.upload_repository.get_by_id(id=id)
+        if not upload or upload.expires_at.replace(tzinfo=timezone.utc) <= datetime.now(
+            tz=timezone.utc
+        ):
+            raise NotFoundError("Upload not found")
+        return upload
+
+    async def append_upload(
+        self,
+        id: uuid.UUID,
+        offset: int,
+        chunks: AsyncIterator[bytes],
+        length: int | None = None,
+    ) -> int:
+        """Store a chunk sent at the current offset of an upload. Returns the new offset"""
+        upload = await self.get_upload(id=id)
+        if offset != upload.offset:
+            raise ConflictError(
+                f"Upload offset is {upload.offset} but the chunk was sent at {offset}"
+            )
+        if length is not None and offset + length > upload.size:
+            raise PayloadTooLargeError(
+                f"Chunk exceeds the declared size of {upload.size} bytes"
+            )
+        if not await self.upload_repository.lock(
+            id=id, offset=offset, lock_seconds=AppConfig.UPLOAD_SESSION_LOCK_SECONDS
+        ):
+            raise ConflictError("Upload is already receiving a chunk")
+
+        try:
+            written = await self.storage_service.append_resumable_upload(upload, chunks)
+        except BaseException:
+            await self.upload_repository.unlock(id=id)
+            raise
+
+        await self.upload_repository.advance(
+            id=id, offset=offset + written, expires_at=get_upload_expiry()
+        )
+        return offset + written
+
+    async def complete_upload(self, id: uuid.UUID) -> FileInfo:
+        """Assemble a fully received upload into a stored file, checking it against the declared digest"""
+        upload = await self.get_upload(id=id)
+        if upload.offset != upload.size:
+            raise BadActionError(
+                f"Upload is incomplete. {upload.offset} of {upload.size} bytes were received"
+            )
+        if not await self.upload_repository.lock(
+            id=id,
+            offset=upload.offset,
+            lock_seconds=AppConfig.UPLOAD_SESSION_LOCK_SECONDS,
+        ):
+            raise ConflictError("Upload is already being completed")
+
+        if not AppConfig.STORAGE_CONTENT_ADDRESSED:
+            await self._complete_upload(upload)
+            return FileInfo(
+                path=self.storage_service.get_public_path(upload.path),
+                size=upload.size,
+                sha256=upload.sha256,
+                variants_task_id=await self.file_service.schedule_image_variants(
+                    upload.path, upload.content_type
+                ),
+            )
+
+        try:
+            stored_file, created = await self.file_service.reference_file(
+                sha256=upload.sha256,
+                path=upload.path,
+                size=upload.size,
+                content_type=upload.content_type,
+            )
+        except BaseException:
+            await self.upload_repository.unlock(id=id)
+            raise
+        try:
+            if created:
+                await self._complete_upload(upload)
+            else:
+                # the same contents are already stored so the received chunks are not needed
+                await self._discard_upload(upload)
+        except BaseException:
+            await self.file_service.release_file(stored_file.path)
+            raise
+
+        return FileInfo(
+            path=self.storage_service.get_public_path(stored_file.path),
+            size=stored_file.size,
+            sha256=stored_file.sha256,
+            variants_task_id=await self.file_service.schedule_image_variants(
+                stored_file.path, upload.content_type
+            ),
+        )
+
+    async def _complete_upload(self, upload: UploadSession) -> None:
+        try:
+            completed = await self.storage_service.complete_resumable_upload(upload)
+        except BaseException:
+            await self.upload_repository.unlock(id=upload.id)
+            raise
+
+        if not completed:
+            await self._discard_upload(upload)
+            raise BadActionError("File contents do not match the declared digest")
+        await self.upload_repository.delete(id=upload.id)
+
+    async def _discard_upload(self, upload: UploadSession) -> None:
+        await self.storage_service.abort_resumable_upload(upload)
+        await self.upload_repository.delete(id=upload.id)
+
+    async def delete_upload(self, id: uuid.UUID) -> None:
+        """Cancel an upload and discard the chunks received so far"""
+        upload = await self.get_upload(id=id)
+        if not await self.upload_repository.lock(
+            id=id,
+            offset=upload.offset,
+            lock_seconds=AppConfig.UPLOAD_SESSION_LOCK_SECONDS,
+        ):
+            raise ConflictError("Upload is receiving a chunk")
+        await self._discard_upload(upload)
+
+    async def expire_uploads(self, limit: int = EXPIRE_BATCH_SIZE) -> int:
+        """Discard uploads that have not received a chunk for too long. Returns the number of uploads discarded"""
+        expired = 0
+        for upload in await self.upload_repository.get_expired(limit=limit):
+            # uploads still receiving a chunk are left for the next run
+            if not await self.upload_repository.lock(
+                id=upload.id,
+                offset=upload.offset,
+                lock_seconds=AppConfig.UPLOAD_SESSION_LOCK_SECONDS,
+            ):
+                continue
+            await self._discard_upload(upload)
+            expired += 1
+        return expired
+
+
+class UploadCleaner:
+    """Periodically discards expired uploads so their chunks do not fill up storage"""
+
+    def __init__(self, storage_service: BaseStorageService) -> None:
+        self.storage_service = storage_service
+        self._task: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._clean_forever())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _clean_forever(self) -> None:
+        while True:
+            try:
+                await self.clean()
+            except Exception:
+                logger.error("Failed to discard expired uploads", exc_info=True)
+            await asyncio.sleep(AppConfig.UPLOAD_SESSION_CLEANUP_INTERVAL_SECONDS)
+
+    async def clean(self) -> None:
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            service = UploadService(
+                session=session, storage_service=self.storage_service
+            )
+            # keep going in batches until a batch comes back short
+            while await service.expire_uploads() == EXPIRE_BATCH_SIZE:
+                pass
@@ -5,12 +5,21 @@ from src.models.user import (
     UserUpdatePublic,
     User,
     UsersPublic,
+    UsersPartialPublic,
+    UserPublic,
 )
-from src.utils.database import build_query_filter
+from src.utils.database import build_query_filter, parse_fieldset
+from src.utils.export import encode_export, get_export_fields
+from src.core.config import AppConfig
+from src.core.database import engine
+from src.models.base import ExportFormat
+from typing import AsyncIterator
 from pydantic import UUID4
 from sqlmodel.ext.asyncio.session import AsyncSession
+from src.core.tracing import traced
 
 
+@traced
 class UserService:
     def __init__(self, session: AsyncSession) -> None:
         self.user_repository = UserRepository(session=session)
@@ -27,19 +36,60 @@ class UserService:
             raise NotFoundError("User not found")
         return user
 
-    async def get_all_users(self, skip: int, limit: int, query):
-        """Get all users"""
+    async def get_all_users(
+        self, skip: int, limit: int, query, fields: str | None = None
+    ):
+        """Get all users. Only the given comma separated fields are selected and returned when set"""
         # build filters. exclude unset and none fields
         filters = build_query_filter(
             model=User,
             query=query.model_dump(exclude_unset=True, exclude_none=True),
         )
+        if fields:
+            selected = parse_fieldset(model=UserPublic, fields=fields)
+            rows, count = await self.user_repository.get_all_partial(
+                skip=skip, limit=limit, filters=filters, columns=list(selected)
+            )
+            return UsersPartialPublic(
+                data=[
+                    {alias: row[column] for column, alias in selected.items()}
+                    for row in rows
+                ],
+                count=count,
+            )
+
         users, count = await self.user_repository.get_all(
             skip=skip, limit=limit, filters=filters
         )
 
         return UsersPublic(data=users, count=count)
 
+    def export_users(
+        self, query, format: ExportFormat, gzip: bool = False
+    ) -> AsyncIterator[bytes]:
+        """Encode all users matching the query as a stream of export chunks"""
+        filters = build_query_filter(
+            model=User,
+            query=query.model_dump(exclude_unset=True, exclude_none=True),
+        )
+        fields = get_export_fields(UserPublic)
+        return encode_export(
+            self._stream_users(filters=filters, columns=list(fields)),
+            fields=fields,
+            format=format,
+            gzip=gzip,
+        )
+
+    async def _stream_users(self, filters: list, columns: list[str]):
+        # the response is streamed after the request session is closed so the export reads through its own session
+        async with AsyncSession(engine) as session:
+            async for rows in UserRepository(session=session).stream_all(
+                filters=filters,
+                columns=columns,
+                chunk_size=AppConfig.EXPORT_CHUNK_SIZE,
+            ):
+                yield rows
+
     async def update_user_by_id(self, id: UUID4, data: UserUpdatePublic):
         """Update user details"""
         user = await self.user_repository.update(
@@ -1,3 +1,4 @@
 # add all modules here to be registered as task
 from .basic import *
 from .email import *
+from .image import *
@@ -0,0 +1,76 @@
+import asyncio
+import io
+import mimetypes
+from celery import Task
+from fastapi.logger import logger
+from src.core.config import AppConfig
+from src.services.storage import BaseStorageService, create_storage_service
+from src.tasks.main import celery_app
+from src.utils.image import get_variant_path, is_variant_source, render_variant
+
+# created on first use so each worker process shares one storage client between tasks
+storage_service: BaseStorageService | None = None
+
+
+def get_variants_task_id(path: str) -> str:
+    # the id is derived from the path so the status of a file's variants can be looked up from the path alone
+    return f"image-variants-{path}"
+
+
+def schedule_image_variants(path: str, content_type: str | None) -> str | None:
+    """Queue generating the variants of an uploaded image. Returns the id of the task, or None if the file has no variants"""
+    if not is_variant_source(content_type):
+        return None
+
+    task_id = get_variants_task_id(path)
+    try:
+        generate_image_variants_task.apply_async(args=[path], task_id=task_id)
+    except Exception:
+        # the original is stored either way, so a broker outage only leaves the file without variants
+        logger.error("Failed to queue image variants of %s", path, exc_info=True)
+        return None
+    return task_id
+
+
+async def generate_image_variants(task: Task, path: str) -> dict[str, str]:
+    global storage_service
+    if storage_service is None:
+        storage_service = create_storage_service()
+
+    variants: dict[str, str] = {}
+    source = None
+    try:
+        for name, variant in AppConfig.IMAGE_VARIANTS.items():
+            variant_path = get_variant_path(path, name)
+            # variants of a file never change so they are only generated once
+            if not await storage_service.file_exists(variant_path):
+                if source is None:
+                    source = await storage_service.download_file(path)
+                source.seek(0)
+                data = await asyncio.to_thread(render_variant, source, variant)
+                await storage_service.upload_file(
+                    file=io.BytesIO(data),
+                    path=variant_path,
+                    content_type=mimetypes.guess_type(variant_path)[0],
+                )
+
+            variants[name] = variant_path
+            task.update_state(
+                state="PROGRESS",
+                meta={
+                    "path": path,
+                    "variants": variants,
+                    "total": len(AppConfig.IMAGE_VARIANTS),
+                },
+            )
+    finally:
+        if source is not None:
+            source.close()
+
+    return variants
+
+
+@celery_app.task(name="generate_image_variants_task", bind=True)
+def generate_image_variants_task(self: Task, path: str):
+    variants = asyncio.run(generate_image_variants(self, path))
+    return {"path": path, "variants": variants}
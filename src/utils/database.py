@@ -1,8 +1,12 @@
 import sqlite3
 import sqlalchemy.exc
-from sqlmodel import Table, func, col
+from sqlmodel import SQLModel, Table, func, col
 from datetime import date
 from enum import Enum
+from src.core.exceptions import BadActionError
+
+# fields that can never be selected, even if a public model were to expose them by mistake
+UNSELECTABLE_FIELDS = {"password"}
 
 
 def build_query_filter(
@@ -33,6 +37,34 @@ def build_query_filter(
     return filter
 
 
+def parse_fieldset(model: type[SQLModel], fields: str) -> dict[str, str]:
+    """
+    Parse a comma separated list of fields of a public model, given by field name or camel case alias.
+
+    Returns:
+        dict[str, str]: The field names mapped to their public names, in the requested order without duplicates
+    """
+    names = {}
+    for name, field in model.model_fields.items():
+        names[name] = name
+        if field.alias:
+            names[field.alias] = name
+
+    selected: dict[str, str] = {}
+    for value in fields.split(","):
+        value = value.strip()
+        if not value:
+            continue
+        name = names.get(value)
+        if name is None or name in UNSELECTABLE_FIELDS:
+            raise BadActionError(f"Unknown field '{value}'")
+        selected[name] = model.model_fields[name].alias or name
+
+    if not selected:
+        raise BadActionError("At least one field must be selected")
+    return selected
+
+
 def parse_sqlite_integrity_error(
     e: sqlite3.IntegrityError | sqlalchemy.exc.IntegrityError,
 ) -> tuple[str, str]:
@@ -0,0 +1,137 @@
+import asyncio
+import os
+import re
+from datetime import datetime, timezone
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import PurePosixPath
+from typing import Mapping
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.types import Receive, Scope, Send
+from src.core.config import AppConfig
+
+# uuid or sha-256 names are never reused for different contents, so responses for them can be cached for good.
+# image variants are named after their original with the variant name before the extension
+IMMUTABLE_NAME_PATTERN = re.compile(
+    r"^([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}|[0-9a-f]{64})(\.[A-Za-z0-9]+){0,2}$"
+)
+
+
+def is_immutable_path(path: str) -> bool:
+    return IMMUTABLE_NAME_PATTERN.match(PurePosixPath(path).name) is not None
+
+
+def get_cache_control(path: str) -> str:
+    """Cache files with unique names as immutable and make caches revalidate everything else"""
+    if is_immutable_path(path):
+        return f"public, max-age={AppConfig.FILE_CACHE_MAX_AGE_SECONDS}, immutable"
+    return "no-cache"
+
+
+def get_file_etag(stat_result: os.stat_result) -> str:
+    """Build an etag from the modification time and size of a file, which change whenever it is rewritten"""
+    return f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+
+
+def format_http_date(value: datetime | float) -> str:
+    timestamp = value.timestamp() if isinstance(value, datetime) else value
+    return formatdate(timestamp, usegmt=True)
+
+
+def parse_http_date(value: str) -> datetime | None:
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return date if date.tzinfo else date.replace(tzinfo=timezone.utc)
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    """Check an If-None-Match or If-Range header against an etag using weak comparison"""
+    if header.strip() == "*":
+        return True
+    etag = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+def is_not_modified(
+    headers: Mapping[str, str], etag: str, last_modified: datetime
+) -> bool:
+    """Check whether the conditional headers of a request show that the client's copy is still current"""
+    if "if-none-match" in headers:
+        # the etag is more precise so the date is ignored when both are sent
+        return etag_matches(headers["if-none-match"], etag)
+
+    if "if-modified-since" in headers:
+        since = parse_http_date(headers["if-modified-since"])
+        # http dates have a resolution of one second
+        return since is not None and last_modified.replace(microsecond=0) <= since
+
+    return False
+
+
+def create_file_response(
+    file_path: str | os.PathLike[str],
+    stat_result: os.stat_result,
+    path: str,
+    headers: Mapping[str, str],
+) -> Response:
+    """Answer a download request with a file on disk, or with 304 when the client's copy is still current"""
+    last_modified = datetime.fromtimestamp(stat_result.st_mtime, tz=timezone.utc)
+    response_headers = {
+        "ETag": get_file_etag(stat_result),
+        "Last-Modified": format_http_date(last_modified),
+        "Cache-Control": get_cache_control(path),
+    }
+    if is_not_modified(headers, response_headers["ETag"], last_modified):
+        return Response(status_code=304, headers=response_headers)
+
+    return ZeroCopyFileResponse(
+        file_path, stat_result=stat_result, headers=response_headers
+    )
+
+
+class ZeroCopyFileResponse(FileResponse):
+    """
+    File response that hands the file to the server when it supports the ASGI path send or zero copy send extensions,
+    so it can be sent with `sendfile` without passing through the application.
+    Range requests and servers without either extension are served by reading the file in chunks
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        extensions = scope.get("extensions") or {}
+        if (
+            scope["method"] != "GET"
+            or self.stat_result is None
+            or "range" in Headers(scope=scope)
+            or not (
+                "http.response.pathsend" in extensions
+                or "http.response.zerocopysend" in extensions
+            )
+        ):
+            return await super().__call__(scope, receive, send)
+
+        await send(
+            {
+                "type": "http.response.start",
+                "status": self.status_code,
+                "headers": self.raw_headers,
+            }
+        )
+        if "http.response.pathsend" in extensions:
+            await send(
+                {"type": "http.response.pathsend", "path": os.path.abspath(self.path)}
+            )
+        else:
+            file = await asyncio.to_thread(open, self.path, "rb")
+            with file:
+                await send(
+                    {
+                        "type": "http.response.zerocopysend",
+                        "file": file,
+                        "count": self.stat_result.st_size,
+                    }
+                )
+
+        if self.background is not None:
+            await self.background()
@@ -0,0 +1,100 @@
+import csv
+import io
+import zlib
+from datetime import date, datetime
+from enum import Enum
+from typing import Any, AsyncIterator, Sequence
+import orjson
+from fastapi.responses import StreamingResponse
+from sqlmodel import SQLModel
+from src.models.base import ExportFormat
+
+EXPORT_MEDIA_TYPES = {
+    ExportFormat.NDJSON: "application/x-ndjson",
+    ExportFormat.CSV: "text/csv",
+}
+
+
+def get_export_fields(model: type[SQLModel]) -> dict[str, str]:
+    """Map the fields of a public model to the names used in exported records, i.e. its camel case aliases"""
+    return {name: field.alias or name for name, field in model.model_fields.items()}
+
+
+def _to_csv_value(value: Any) -> Any:
+    if value is None:
+        return ""
+    if isinstance(value, Enum):
+        return value.value
+    # match the json representation rather than str() which separates date and time with a space
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+async def encode_ndjson(
+    chunks: AsyncIterator[Sequence[Any]], fields: dict[str, str]
+) -> AsyncIterator[bytes]:
+    """Encode each chunk of rows as newline delimited json objects keyed by the export names"""
+    names = list(fields.items())
+    async for rows in chunks:
+        yield b"".join(
+            orjson.dumps({alias: row[name] for name, alias in names}) + b"\n"
+            for row in rows
+        )
+
+
+async def encode_csv(
+    chunks: AsyncIterator[Sequence[Any]], fields: dict[str, str]
+) -> AsyncIterator[bytes]:
+    """Encode each chunk of rows as csv lines after a header row of the export names"""
+    # the buffer is reused across chunks so only a single chunk is ever held in memory
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields.values())
+    yield buffer.getvalue().encode()
+
+    names = list(fields)
+    async for rows in chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([_to_csv_value(row[name]) for name in names] for row in rows)
+        yield buffer.getvalue().encode()
+
+
+async def gzip_stream(
+    chunks: AsyncIterator[bytes], level: int = 6
+) -> AsyncIterator[bytes]:
+    """
+    Compress a stream into a single gzip member. Every chunk is flushed on its own
+    so clients can decompress the export as it arrives instead of waiting for the end
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    async for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def encode_export(
+    chunks: AsyncIterator[Sequence[Any]],
+    fields: dict[str, str],
+    format: ExportFormat,
+    gzip: bool = False,
+) -> AsyncIterator[bytes]:
+    """Encode streamed rows in the requested format, optionally gzip compressed"""
+    encoder = encode_csv if format == ExportFormat.CSV else encode_ndjson
+    body = encoder(chunks, fields)
+    return gzip_stream(body) if gzip else body
+
+
+def create_export_response(
+    body: AsyncIterator[bytes], name: str, format: ExportFormat, gzip: bool = False
+) -> StreamingResponse:
+    """Stream an export as a file download named after the exported records"""
+    filename = f"{name}.{format.value}" + (".gz" if gzip else "")
+    return StreamingResponse(
+        body,
+        media_type="application/gzip" if gzip else EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
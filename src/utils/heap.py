@@ -0,0 +1,132 @@
+import gc
+import threading
+import tracemalloc
+from collections import Counter, OrderedDict
+from datetime import datetime, timezone
+from typing import Callable, Literal
+from sqlmodel import SQLModel
+from src.core.config import AppConfig
+from src.core.exceptions import BadActionError, NotFoundError
+
+# name -> function returning the number of entries held by a long lived in-process cache
+cache_registry: dict[str, Callable[[], int]] = {}
+
+
+def register_cache(name: str, sizer: Callable[[], int]) -> None:
+    """Report the size of a cache on the heap debug endpoints. Registering a name again replaces its sizer"""
+    cache_registry[name] = sizer
+
+
+def get_cache_sizes() -> dict[str, int]:
+    sizes = {}
+    for name, sizer in cache_registry.items():
+        try:
+            sizes[name] = sizer()
+        except Exception:
+            sizes[name] = -1
+    return sizes
+
+
+def count_model_instances() -> dict[str, int]:
+    """Count live SQLModel instances per class, most common first"""
+    # a full heap walk takes a while on large heaps. callers should run it off the event loop
+    # check the class hierarchy directly since isinstance probes attributes of every object
+    counts = Counter(
+        type(obj).__name__ for obj in gc.get_objects() if SQLModel in type(obj).__mro__
+    )
+    return dict(counts.most_common())
+
+
+class HeapTracker:
+    """Keeps a bounded number of named tracemalloc snapshots to compare allocations over time"""
+
+    def __init__(self, max_snapshots: int) -> None:
+        self.max_snapshots = max_snapshots
+        # name -> (taken at, traced size, snapshot) in the order they were taken
+        self.snapshots: OrderedDict[str, tuple[datetime, int, tracemalloc.Snapshot]] = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+
+    @property
+    def is_tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self, frames: int) -> None:
+        """Start tracing allocations. Every allocation is slower while tracing so stop it when done"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+
+    def stop(self) -> None:
+        """Stop tracing and drop all snapshots since they cannot be compared with later ones"""
+        tracemalloc.stop()
+        with self._lock:
+            self.snapshots.clear()
+
+    def take_snapshot(self, name: str) -> tuple[datetime, int]:
+        """
+        Take a named snapshot, dropping the oldest one once the limit is reached
+
+        Returns:
+            tuple[taken_at, size]: when the snapshot was taken and the total traced size in bytes
+        """
+        snapshot = self._take_snapshot()
+        taken_at = datetime.now(timezone.utc)
+        size = sum(trace.size for trace in snapshot.traces)
+        with self._lock:
+            self.snapshots.pop(name, None)
+            self.snapshots[name] = (taken_at, size, snapshot)
+            while len(self.snapshots) > self.max_snapshots:
+                self.snapshots.popitem(last=False)
+        return taken_at, size
+
+    def _take_snapshot(self) -> tracemalloc.Snapshot:
+        if not tracemalloc.is_tracing():
+            raise BadActionError("Allocation tracing has not been started")
+
+        return tracemalloc.take_snapshot().filter_traces(
+            (
+                # leave out the memory used by tracing itself
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                tracemalloc.Filter(False, "<unknown>"),
+            )
+        )
+
+    def get_snapshot(self, name: str) -> tracemalloc.Snapshot:
+        with self._lock:
+            entry = self.snapshots.get(name)
+        if not entry:
+            raise NotFoundError("Snapshot not found")
+        return entry[2]
+
+    def delete_snapshot(self, name: str) -> None:
+        with self._lock:
+            if self.snapshots.pop(name, None) is None:
+                raise NotFoundError("Snapshot not found")
+
+    def list_snapshots(self) -> list[tuple[str, datetime, int]]:
+        """Name, time taken and total traced size of every snapshot"""
+        with self._lock:
+            return [
+                (name, taken_at, size)
+                for name, (taken_at, size, _) in self.snapshots.items()
+            ]
+
+    def compare(
+        self,
+        base: str,
+        target: str | None,
+        group_by: Literal["filename", "lineno"],
+        limit: int,
+    ) -> list[tracemalloc.StatisticDiff]:
+        """
+        Get the allocations that grew the most between two snapshots.
+        The current heap is compared against the base snapshot when no target is given
+        """
+        base_snapshot = self.get_snapshot(base)
+        target_snapshot = self.get_snapshot(target) if target else self._take_snapshot()
+        return target_snapshot.compare_to(base_snapshot, group_by)[:limit]
+
+
+heap_tracker = HeapTracker(max_snapshots=AppConfig.HEAP_MAX_SNAPSHOTS)
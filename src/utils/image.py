@@ -0,0 +1,72 @@
+import io
+import mimetypes
+from pathlib import PurePosixPath
+from typing import BinaryIO
+from src.core.config import AppConfig, ImageVariant
+
+# image processing comes from the optional `images` extra and is only needed by the worker generating variants
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+    ImageOps = None
+
+# exif tag holding how the camera was turned when the picture was taken
+EXIF_ORIENTATION = 0x0112
+
+
+def is_variant_source(content_type: str | None) -> bool:
+    """Check whether variants are generated for uploads of a content type"""
+    return bool(
+        AppConfig.IMAGE_VARIANTS
+        and content_type
+        and content_type.startswith(tuple(AppConfig.IMAGE_VARIANT_CONTENT_TYPES))
+    )
+
+
+def get_variant_path(path: str, variant: str) -> str:
+    """Get the path a variant of a file is stored at, next to the original"""
+    source = PurePosixPath(path)
+    extension = AppConfig.IMAGE_VARIANTS[variant].format.lower()
+    return str(source.with_name(f"{source.stem}.{variant}.{extension}"))
+
+
+def get_variant_paths(path: str) -> list[str]:
+    """Get the paths every variant of a file would be stored at, if the file may have any"""
+    content_type, _ = mimetypes.guess_type(path)
+    # files without an extension may be images too
+    if content_type is not None and not is_variant_source(content_type):
+        return []
+    return [get_variant_path(path, variant) for variant in AppConfig.IMAGE_VARIANTS]
+
+
+def render_variant(source: BinaryIO, variant: ImageVariant) -> bytes:
+    """Scale an image down to fit a variant and encode it in the variant's format"""
+    if Image is None or ImageOps is None:
+        raise RuntimeError("Image variants need Pillow from the `images` extra")
+
+    with Image.open(source) as image:
+        # the header is read first so oversized images are rejected before any pixels are decoded
+        if image.width * image.height > AppConfig.IMAGE_MAX_PIXELS:
+            raise ValueError(
+                f"Image exceeds the maximum of {AppConfig.IMAGE_MAX_PIXELS} pixels"
+            )
+        width, height = variant.width or image.width, variant.height or image.height
+        # phones store the orientation as metadata rather than rotating the pixels. the image is rotated after it is
+        # scaled so the box is turned as well for orientations that swap the sides
+        if image.getexif().get(EXIF_ORIENTATION, 1) in (5, 6, 7, 8):
+            width, height = height, width
+        # thumbnail only shrinks and lets jpeg decode at a reduced scale, which is much faster than a full decode
+        image.thumbnail((width, height))
+        result = ImageOps.exif_transpose(image)
+
+        output_format = variant.format.upper()
+        has_alpha = result.mode in ("RGBA", "LA") or "transparency" in result.info
+        if output_format == "JPEG" or not has_alpha:
+            result = result.convert("RGB")
+        elif result.mode != "RGBA":
+            result = result.convert("RGBA")
+
+        output = io.BytesIO()
+        result.save(output, format=output_format, quality=variant.quality)
+        return output.getvalue()
@@ -56,5 +56,5 @@ def send_email(
         logger.error(msg="SMTP error", exc_info=True)
         raise
     except Exception as e:
-        logger.error(msg=f"Failed to send email.\nError: {str(e)}")
+        logger.error("Failed to send email.\nError: %s", e)
         raise
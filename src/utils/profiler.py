@@ -0,0 +1,147 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, NamedTuple
+from src.core.exceptions import ConflictError
+
+
+class Frame(NamedTuple):
+    name: str
+    file: str
+    line: int
+
+    def __str__(self) -> str:
+        return f"{self.name} ({self.file}:{self.line})"
+
+
+@dataclass
+class Profile:
+    """Stack samples of every thread, counted per distinct stack"""
+
+    interval: float
+    duration: float = 0
+    # (thread name, frames from the outermost call) -> number of samples
+    samples: Counter[tuple[str, tuple[Frame, ...]]] = field(default_factory=Counter)
+
+    def to_collapsed(self) -> str:
+        """Render in the collapsed stack format read by flamegraph.pl, speedscope and most flamegraph tools"""
+        lines = [
+            ";".join([thread, *(str(frame) for frame in stack)]) + f" {count}"
+            for (thread, stack), count in self.samples.most_common()
+        ]
+        return "\n".join(lines) + "\n"
+
+    def to_speedscope(self, name: str) -> dict[str, Any]:
+        """Render as a speedscope file with one sampled profile per thread"""
+        frames: dict[Frame, int] = {}
+        profiles: dict[str, dict[str, Any]] = {}
+
+        for (thread, stack), count in self.samples.items():
+            profile = profiles.setdefault(
+                thread,
+                {
+                    "type": "sampled",
+                    "name": thread,
+                    "unit": "seconds",
+                    "startValue": 0,
+                    "endValue": self.duration,
+                    "samples": [],
+                    "weights": [],
+                },
+            )
+            profile["samples"].append(
+                [frames.setdefault(frame, len(frames)) for frame in stack]
+            )
+            profile["weights"].append(count * self.interval)
+
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "fastapi-starter",
+            "shared": {
+                "frames": [
+                    {"name": frame.name, "file": frame.file, "line": frame.line}
+                    for frame in frames
+                ]
+            },
+            "profiles": list(profiles.values()),
+        }
+
+
+class StackSampler:
+    """
+    Wall clock sampling profiler for every thread of the process, including the event loop.
+    Runs in its own thread and only reads frames, so the profiled code is never instrumented or paused
+    beyond the brief moment each sample holds the GIL
+    """
+
+    def __init__(self, interval: float, max_depth: int = 128) -> None:
+        self.interval = interval
+        self.max_depth = max_depth
+        self.root = os.getcwd()
+
+    def run(self, seconds: float) -> Profile:
+        """Sample all other threads for `seconds`. Blocks the calling thread"""
+        profile = Profile(interval=self.interval)
+        own_id = threading.get_ident()
+        thread_names: dict[int, str] = {}
+        start_time = time.monotonic()
+        deadline = start_time + seconds
+
+        while (now := time.monotonic()) < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                if thread_id not in thread_names:
+                    thread_names = {
+                        thread.ident: thread.name
+                        for thread in threading.enumerate()
+                        if thread.ident is not None
+                    }
+                thread = thread_names.get(thread_id, f"Thread-{thread_id}")
+                profile.samples[(thread, self._get_stack(frame))] += 1
+
+            # sleep what is left of the interval so the sample rate does not drift with the sampling cost
+            time.sleep(max(0, self.interval - (time.monotonic() - now)))
+
+        profile.duration = time.monotonic() - start_time
+        return profile
+
+    def _get_stack(self, frame) -> tuple[Frame, ...]:
+        stack = []
+        while frame is not None and len(stack) < self.max_depth:
+            code = frame.f_code
+            stack.append(
+                Frame(
+                    name=code.co_qualname,
+                    file=self._format_file(code.co_filename),
+                    line=code.co_firstlineno,
+                )
+            )
+            frame = frame.f_back
+        stack.reverse()
+        return tuple(stack)
+
+    def _format_file(self, file: str) -> str:
+        # show application files relative to the project root
+        if file.startswith(self.root):
+            return os.path.relpath(file, self.root)
+        return file
+
+
+# only one profile runs at a time to keep the overhead on live traffic bounded
+profile_lock = threading.Lock()
+
+
+def run_profile(seconds: float, interval: float) -> Profile:
+    """Profile the process. Raises a conflict error when another profile is already running"""
+    if not profile_lock.acquire(blocking=False):
+        raise ConflictError("A profile is already running")
+
+    try:
+        return StackSampler(interval=interval).run(seconds)
+    finally:
+        profile_lock.release()